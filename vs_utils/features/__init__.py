@@ -1,11 +1,21 @@
 """
 Feature calculations.
 """
+import collections
+import contextlib
+import functools
+import importlib
+import itertools
 import types
 import numpy as np
 from rdkit import Chem
 from rdkit.Chem import rdGeometry, rdMolTransforms
-from ..utils.ob_utils import Ionizer
+from ..utils.array_utils import convert_dtype, RaggedArray
+from ..utils.ob_utils import Ionizer, IonizerError
+from ..utils.parallel_utils import (iter_chunks, process_map, report_batch,
+                                    report_progress, time_limit,
+                                    TimeLimitError)
+from ..utils.rdkit_utils import PicklableMol
 
 __author__ = "Steven Kearnes"
 __copyright__ = "Copyright 2014, Stanford University"
@@ -13,44 +23,318 @@ __license__ = "BSD 3-clause"
 
 
 
+# registry entry for a featurizer:
+# - module: module containing the featurizer class
+# - class_name: featurizer class name
+# - args: names of __init__ arguments (excluding self)
+# - defaults: default values for the last len(defaults) arguments, as
+#   returned by inspect.getargspec
+# - description: short description (used for scripting)
+FeaturizerInfo = collections.namedtuple(
+    'FeaturizerInfo', ['module', 'class_name', 'args', 'defaults',
+                       'description'])
+
+# featurizers are registered here so they can be listed (e.g. as command-line
+# subcommands) without importing their modules; the entries must match the
+# featurizer classes, which is checked by the tests
+FEATURIZERS = collections.OrderedDict([
+    ('circular', FeaturizerInfo(
+        'vs_utils.features.fingerprints', 'CircularFingerprint',
+        ('radius', 'size', 'chiral', 'bonds', 'features', 'sparse',
+         'smiles'),
+        (2, 2048, False, True, False, False, False),
+        'Circular (Morgan) fingerprints.')),
+    ('coulomb_matrix', FeaturizerInfo(
+        'vs_utils.features.coulomb_matrices', 'CoulombMatrix',
+        ('max_atoms', 'remove_hydrogens', 'randomize', 'n_samples', 'seed',
+         'representation'),
+        (True, True, 1, None, 'matrix'),
+        'Calculate Coulomb matrices for molecules.')),
+    ('descriptors', FeaturizerInfo(
+        'vs_utils.features.basic', 'SimpleDescriptors',
+        ('include', 'exclude', 'cost_budget'), (None, None, 'all'),
+        'RDKit descriptors.')),
+    ('dragon', FeaturizerInfo(
+        'vs_utils.features.dragon', 'DragonDescriptors',
+        ('assign_stereo_from_3d',), (False,),
+        'Calculate Dragon descriptors.')),
+    ('esp', FeaturizerInfo(
+        'vs_utils.features.esp', 'ESP',
+        ('size', 'resolution', 'nb_cutoff', 'ionic_strength', 'ionize', 'pH',
+         'align'),
+        (30., 0.5, 5., 150., True, 7.4, False),
+        'Calculate electrostatic potential (ESP) features for molecules.')),
+    ('image', FeaturizerInfo(
+        'vs_utils.features.images', 'MolImage',
+        ('size', 'flatten', 'engine', 'mode'), (32, False, 'obabel', 'rgb'),
+        'Molecule images.')),
+    ('molecular_weight', FeaturizerInfo(
+        'vs_utils.features.basic', 'MolecularWeight', (), (),
+        'Molecular weight.')),
+    ('mw', FeaturizerInfo(
+        'vs_utils.features.basic', 'MolecularWeight', (), (),
+        'Molecular weight.')),
+    ('scaffold', FeaturizerInfo(
+        'vs_utils.features.scaffolds', 'Scaffold',
+        ('include_chirality',), (False,),
+        'Molecular scaffolds.')),
+    ('shape', FeaturizerInfo(
+        'vs_utils.features.shape_grid', 'ShapeGrid',
+        ('size', 'resolution', 'hydrogens', 'align', 'probe_radius',
+         'featurization'),
+        (81, 0.5, False, False, 1.4, 'occupancy'),
+        'Grid-based shape features.')),
+])
+
+
 def get_featurizers():
-    """Compile a dict mapping strings to featurizer classes."""
-
-    # import all Featurizer subclasses so __subclasses__ will work
-    # these have to be local imports to avoid circular imports
-    from .basic import MolecularWeight, SimpleDescriptors
-    from .coulomb_matrices import CoulombMatrix
-    from .dragon import DragonDescriptors
-    from .esp import ESP
-    from .fingerprints import CircularFingerprint
-    from .images import MolImage
-    from .scaffolds import ScaffoldGenerator
-    from .shape_grid import ShapeGrid
-
-    featurizers = {}
-    for klass in Featurizer.__subclasses__():
-        assert klass.name is not None, (klass.__name__ +
-                                        " 'name' attribute is None.")
-        if isinstance(klass.name, list):
-            for name in klass.name:
-                assert name not in featurizers
-                featurizers[name] = klass
-        else:
-            assert klass.name not in featurizers
-            featurizers[klass.name] = klass
-    return featurizers
+    """
+    Compile a dict mapping strings to featurizer classes.
+
+    This imports every registered featurizer module. Use FEATURIZERS to list
+    featurizers and resolve_featurizer to import a single featurizer.
+    """
+    return dict((name, resolve_featurizer(name)) for name in FEATURIZERS)
 
 
 def resolve_featurizer(name):
     """
-    Resolve featurizer class from a string.
+    Resolve featurizer class from a string. Only the module containing the
+    featurizer is imported.
 
     Parameters
     ----------
     name : str
         Featurizer name.
     """
-    return get_featurizers()[name]
+    info = FEATURIZERS[name]
+    module = importlib.import_module(info.module)
+    return getattr(module, info.class_name)
+
+
+def _featurize_chunk(featurizer, mols, isolate=False, timeout=None,
+                     dtype=None):
+  """
+  Calculate the feature matrix for a chunk of molecules in a worker
+  process.
+
+  This is a module-level function so it can be pickled and sent to worker
+  processes along with the featurizer.
+
+  Parameters
+  ----------
+  featurizer : Featurizer
+      Featurizer.
+  mols : list
+      RDKit Mol objects.
+  isolate : bool, optional (default False)
+      Whether to isolate failures. See Featurizer._featurize_isolated.
+  timeout : float, optional
+      Time limit per molecule, in seconds (requires isolate).
+  dtype : numpy dtype or str, optional
+      Output data type (see convert_dtype). Not used if isolate is True.
+  """
+  if isolate:
+    return featurizer._featurize_isolated(mols, timeout)
+  return convert_dtype(featurizer._featurize_batch(mols), dtype)
+
+
+def _featurize_complex_chunk(featurizer, complexes, isolate=False,
+                             timeout=None):
+  """
+  Calculate features for a chunk of mol/protein complexes in a worker
+  process.
+
+  Parameters
+  ----------
+  featurizer : ComplexFeaturizer
+      Featurizer.
+  complexes : list
+      (mol_pdb, protein_pdb) tuples.
+  isolate : bool, optional (default False)
+      Whether to isolate failures.
+  timeout : float, optional
+      Time limit per complex, in seconds (requires isolate).
+
+  Returns
+  -------
+  rows : list
+      Features for each complex (None for failed complexes).
+  failures : dict
+      Mapping from complex index (in complexes) to the reason for the
+      failure.
+  """
+  if not isolate:
+    return [featurizer._featurize_complex(mol_pdb, protein_pdb)
+            for mol_pdb, protein_pdb in complexes], {}
+  rows = []
+  failures = {}
+  for i, (mol_pdb, protein_pdb) in enumerate(complexes):
+    try:
+      with time_limit(timeout):
+        rows.append(featurizer._featurize_complex(mol_pdb, protein_pdb))
+    except Exception as e:
+      rows.append(None)
+      failures[i] = _failure_reason(e)
+    if timeout is not None:
+      report_progress([(rows[-1], failures.get(i))])
+  return rows, failures
+
+
+def _failure_reason(e):
+  """
+  Describe the exception raised when featurizing a molecule (or complex)
+  failed.
+
+  Parameters
+  ----------
+  e : Exception
+      Exception.
+  """
+  if isinstance(e, TimeLimitError):
+    return str(e)
+  return '{}: {}'.format(type(e).__name__, e)
+
+
+def _item_failed(item, reason):
+  """
+  Placeholder result for a molecule (or complex) whose worker process was
+  killed (see process_map).
+
+  Parameters
+  ----------
+  item : object
+      Molecule or complex.
+  reason : str
+      Reason the worker process was killed.
+  """
+  return None, reason
+
+
+def _join_rows(values):
+  """
+  Construct (rows, failures) for a chunk from (row, reason) tuples
+  reported for each molecule (or complex). See
+  Featurizer._featurize_isolated.
+
+  Parameters
+  ----------
+  values : list
+      (row, reason) tuples, where reason is None for successful items.
+  """
+  rows = [row for row, _ in values]
+  failures = dict((i, reason) for i, (_, reason) in enumerate(values)
+                  if reason is not None)
+  return rows, failures
+
+
+def _pipeline_item_failed(n_featurizers, item, reason):
+  """
+  Placeholder result for a molecule whose worker process was killed while
+  it was featurized by a FeaturizerPipeline (see process_map). The
+  molecule fails for every featurizer that was featurizing it.
+
+  Parameters
+  ----------
+  n_featurizers : int
+      Number of featurizers in the pipeline.
+  item : tuple
+      (mol, featurizer indices) tuple.
+  reason : str
+      Reason the worker process was killed.
+  """
+  _, indices = item
+  return [_item_failed(item, reason) if i in indices else (None, None)
+          for i in xrange(n_featurizers)]
+
+
+def _join_pipeline_rows(n_featurizers, values):
+  """
+  Construct (rows, failures) for each featurizer in a FeaturizerPipeline
+  from the values reported for each molecule of a chunk. See
+  FeaturizerPipeline._featurize_isolated.
+
+  Parameters
+  ----------
+  n_featurizers : int
+      Number of featurizers in the pipeline.
+  values : list
+      Lists of (row, reason) tuples (one for each featurizer) for each
+      molecule.
+  """
+  return [_join_rows([value[i] for value in values])
+          for i in xrange(n_featurizers)]
+
+
+def _map_chunks(function, chunks, backend='serial', n_jobs=None,
+                timeout=None, max_tasks_per_child=None, on_timeout=None,
+                join=None):
+  """
+  Apply a function to each chunk of work, in this process or with a pool
+  of local processes. Results are yielded in the same order as the input
+  chunks.
+
+  Parameters
+  ----------
+  function : callable
+      Function applied to each chunk. Must be picklable for the 'process'
+      backend.
+  chunks : iterable
+      Chunks of work. Chunks that are None are passed through as None
+      without calling the function.
+  backend : str, optional (default 'serial')
+      Backend ('serial' or 'process').
+  n_jobs : int, optional
+      Number of worker processes for the 'process' backend. Defaults to
+      the number of CPUs.
+  timeout : float, optional
+      Time limit per item, in seconds. With the 'process' backend, the
+      function must report (row, reason) tuples for each item with
+      report_progress. As a backstop for code that time_limit cannot
+      interrupt, workers that report no progress for twice this limit are
+      killed and only the item they were working on fails.
+  max_tasks_per_child : int, optional
+      Number of chunks processed by each worker process before it is
+      replaced ('process' backend).
+  on_timeout : callable, optional
+      Placeholder result for an item whose worker was killed ('process'
+      backend, with a timeout). Defaults to _item_failed. See process_map.
+  join : callable, optional
+      Function constructing the result for a chunk from the values
+      reported for its items ('process' backend, with a timeout).
+      Defaults to _join_rows. See process_map.
+  """
+  if backend == 'serial':
+    for chunk in chunks:
+      yield None if chunk is None else function(chunk)
+  elif backend == 'process':
+    kwargs = {}
+    if timeout is not None:
+      kwargs = {'timeout': 2 * timeout,
+                'on_timeout': on_timeout or _item_failed,
+                'join': join or _join_rows}
+    for result in process_map(function, chunks, n_jobs,
+                              max_tasks_per_child=max_tasks_per_child,
+                              **kwargs):
+      yield result
+  else:
+    raise NotImplementedError(
+        "Unrecognized backend '{}'.".format(backend))
+
+
+def _mask_failed(features):
+  """
+  Construct a feature matrix from per-item features, masking items whose
+  features are None.
+
+  Parameters
+  ----------
+  features : list
+      Features for each item.
+  """
+  if not any([x is None for x in features]):
+    return np.asarray(features)
+  return RaggedArray.from_list([[x] for x in features]).data
 
 class ComplexFeaturizer(object):
   """"
@@ -63,7 +347,9 @@ class ComplexFeaturizer(object):
   """
   name = None
 
-  def featurize_complexes(self, mol_pdbs, protein_pdbs):
+  def featurize_complexes(self, mol_pdbs, protein_pdbs, backend='serial',
+                          n_jobs=None, chunk_size=10, timeout=None,
+                          max_tasks_per_child=None, failures=None):
     """
     Calculate features for mol/protein complexes.
 
@@ -75,11 +361,42 @@ class ComplexFeaturizer(object):
     protein_pdbs: list
       List of PDBs for proteins. Each PDB should be a list of lines of the
       PDB file.
+    backend : str, optional (default 'serial')
+      Featurization backend. Choose from:
+      * 'serial' : featurize complexes in this process.
+      * 'process' : featurize chunks of complexes with a pool of local
+        processes. Features are returned in input order.
+    n_jobs : int, optional
+      Number of worker processes for the 'process' backend. Defaults to the
+      number of CPUs.
+    chunk_size : int, optional (default 10)
+      Number of complexes sent to a worker process at a time.
+    timeout : float, optional
+      Time limit, in seconds, for featurizing each complex. Complexes that
+      exceed the limit are treated as failures. See Featurizer.featurize.
+    max_tasks_per_child : int, optional
+      Number of chunks processed by each worker process before it is
+      replaced with a new process ('process' backend).
+    failures : dict, optional
+      If provided, complexes that fail featurization (or exceed the time
+      limit) do not stop featurization. Their features are masked and
+      failures is updated with a mapping from complex index to the reason
+      for the failure. Failures are also isolated (but not reported) if a
+      timeout is given.
     """
-    features = [self._featurize_complex(mol_pdb, protein_pdb)
-                for (mol_pdb, protein_pdb) in zip(mol_pdbs, protein_pdbs)]
-    features = np.asarray(features)
-    return features
+    isolate = timeout is not None or failures is not None
+    complexes = itertools.izip(mol_pdbs, protein_pdbs)
+    function = functools.partial(_featurize_complex_chunk, self,
+                                 isolate=isolate, timeout=timeout)
+    rows = []
+    for chunk_rows, chunk_failures in _map_chunks(
+        function, iter_chunks(complexes, chunk_size), backend, n_jobs,
+        timeout, max_tasks_per_child):
+      if failures is not None:
+        for i, reason in chunk_failures.items():
+          failures[len(rows) + i] = reason
+      rows.extend(chunk_rows)
+    return _mask_failed(rows)
 
   def _featurize_complex(self, mol_pdb, complex_pdb):
     """
@@ -103,6 +420,9 @@ class Featurizer(object):
   shape that is inferred from the shape of the features returned by
   _featurize, and is either indexed by molecules or by molecules and
   conformers depending on the value of the conformers class attribute.
+  Child classes can also implement _featurize_batch to calculate the
+  feature matrix for many molecules at once; featurize uses it in
+  preference to calling _featurize for each molecule.
 
   Class Attributes
   ----------------
@@ -119,13 +439,21 @@ class Featurizer(object):
   topo_view : bool (default False)
       Whether the calculated features represent a topological view of the
       data.
+  uses_coordinates : bool (default False)
+      Whether molecule-level features depend on 3D coordinates (for
+      example, stereochemistry assigned from 3D). Such features are cached
+      by molecule coordinates rather than SMILES. Featurizers can set this
+      on instances.
   """
   conformers = False
   name = None
   topo_view = False
+  uses_coordinates = False
 
   def featurize(self, mols, parallel=False, client_kwargs=None,
-                view_flags=None):
+                view_flags=None, backend=None, n_jobs=None, chunk_size=100,
+                cache=None, ragged=False, timeout=None,
+                max_tasks_per_child=None, failures=None, dtype=None):
     """
     Calculate features for molecules.
 
@@ -135,16 +463,92 @@ class Featurizer(object):
         RDKit Mol objects.
     parallel : bool, optional
         Whether to train subtrainers in parallel using
-        IPython.parallel (default False).
+        IPython.parallel (default False). Equivalent to
+        backend='ipython'.
     client_kwargs : dict, optional
         Keyword arguments for IPython.parallel Client.
     view_flags : dict, optional
         Flags for IPython.parallel LoadBalancedView.
+    backend : str, optional
+        Featurization backend. Choose from:
+        * 'serial' : featurize molecules in this process (default unless
+          parallel is True).
+        * 'ipython' : featurize molecules with IPython.parallel.
+        * 'process' : featurize chunks of molecules with a pool of local
+          processes.
+    n_jobs : int, optional
+        Number of worker processes for the 'process' backend. Defaults to
+        the number of CPUs.
+    chunk_size : int, optional (default 100)
+        Number of molecules featurized at a time ('serial' and 'process'
+        backends). With the 'process' backend, each chunk is sent to a
+        worker process.
+    cache : FeatureCache, optional
+        Cache for per-molecule features. Only molecules that are not found
+        in the cache are featurized, and their features are added to the
+        cache.
+    ragged : bool, optional (default False)
+        Whether to return conformer features as a RaggedArray (with rows
+        for all conformers stored contiguously) instead of a masked array
+        padded to the maximum number of conformers.
+    timeout : float, optional
+        Time limit, in seconds, for featurizing each molecule ('serial' and
+        'process' backends). Molecules that exceed the limit are treated as
+        failures. Each chunk is first featurized as a batch, within a
+        time limit of timeout seconds per molecule; if the batch fails or
+        exceeds its limit, the molecules in the chunk are featurized again
+        one at a time (so external tools such as dragon6shell and obabel
+        are run once per molecule for that chunk). With the 'process'
+        backend, workers that cannot be interrupted are killed when they
+        make no progress for twice the time limit, and only the molecule
+        they were working on fails.
+    max_tasks_per_child : int, optional
+        Number of chunks processed by each worker process before it is
+        replaced with a new process ('process' backend). Use this to
+        contain memory leaks in external libraries.
+    failures : dict, optional
+        If provided, molecules that fail featurization (or exceed the time
+        limit) do not stop featurization ('serial' and 'process' backends).
+        Their features are masked and failures is updated with a mapping
+        from molecule index to the reason for the failure. Failures are
+        also isolated (but not reported) if a timeout is given.
+    dtype : numpy dtype or str, optional
+        Output data type, such as 'float32', 'uint8', or 'bool'. If
+        'packed', binary features are packed into bits along the last axis
+        (see vs_utils.utils.array_utils.unpack_bits); features with values
+        other than 0 and 1 raise a ValueError. With the 'process'
+        backend, features are converted in the worker processes. By
+        default, the data type is determined by the featurizer.
     """
+    isolate = timeout is not None or failures is not None
+    if backend is None:
+      backend = 'ipython' if parallel else 'serial'
+    if backend == 'ipython' and (isolate or max_tasks_per_child is not None):
+      raise ValueError(
+          'timeout, max_tasks_per_child, and failures are not supported ' +
+          'with IPython.parallel.')
     if self.conformers and isinstance(mols, types.GeneratorType):
       mols = list(mols)
 
-    if parallel:
+    if cache is not None:
+      mols = list(mols)
+      keys, features, missing = self._cache_lookup(mols, cache)
+      block = None
+      if missing:
+        missing_failures = {} if failures is not None else None
+        block = self.featurize([mols[i] for i in missing], parallel,
+                               client_kwargs, view_flags, backend, n_jobs,
+                               chunk_size, ragged=True, timeout=timeout,
+                               max_tasks_per_child=max_tasks_per_child,
+                               failures=missing_failures)
+        if failures is not None:
+          for i, reason in missing_failures.items():
+            failures[missing[i]] = reason
+      features = self._cache_update(mols, keys, features, missing, block,
+                                    cache)
+      features = convert_dtype(features, dtype)
+
+    elif backend == 'ipython':
       from IPython.parallel import Client
 
       if client_kwargs is None:
@@ -161,15 +565,414 @@ class Featurizer(object):
       # get output from engines
       call.display_outputs()
 
+      features = convert_dtype(self._assemble(mols, features), dtype)
+
+    elif isolate:
+      rows = []
+      for chunk_rows, chunk_failures in self._featurize_chunks(
+          iter_chunks(mols, chunk_size), backend, n_jobs, isolate=True,
+          timeout=timeout, max_tasks_per_child=max_tasks_per_child):
+        if failures is not None:
+          for i, reason in chunk_failures.items():
+            failures[len(rows) + i] = reason
+        rows.extend(chunk_rows)
+      features = convert_dtype(self._assemble(None, rows), dtype)
+
     else:
-      features = [self._featurize(mol) for mol in mols]
+      blocks = list(self._featurize_chunks(
+          iter_chunks(mols, chunk_size), backend, n_jobs,
+          max_tasks_per_child=max_tasks_per_child, dtype=dtype))
+      features = self._merge_blocks(blocks)
+      if not blocks:
+        features = convert_dtype(features, dtype)
+
+    if not ragged and isinstance(features, RaggedArray):
+      features = features.densify()
+    return features
 
+  def featurize_iter(self, mols, chunk_size=1000, backend='serial',
+                     n_jobs=None, cache=None, ragged=False, dtype=None):
+    """
+    Calculate features for molecules in chunks.
+
+    Molecules are read from mols lazily, so any iterable (such as
+    MolReader.get_mols()) can be used and peak memory depends on the chunk
+    size rather than the number of molecules. With the 'process' backend,
+    each chunk is sent to a worker process and a single process pool is
+    used for the whole iteration.
+
+    Parameters
+    ----------
+    mols : iterable
+        RDKit Mol objects.
+    chunk_size : int, optional (default 1000)
+        Number of molecules per chunk.
+    backend : str, optional (default 'serial')
+        Featurization backend ('serial' or 'process').
+    n_jobs : int, optional
+        Number of worker processes for the 'process' backend. Defaults to
+        the number of CPUs.
+    cache : FeatureCache, optional
+        Cache for per-molecule features. Only molecules that are not found
+        in the cache are featurized.
+    ragged : bool, optional (default False)
+        Whether to return conformer features as RaggedArrays instead of
+        padded masked arrays.
+    dtype : numpy dtype or str, optional
+        Output data type. See featurize.
+
+    Returns
+    -------
+    A generator yielding (mol_ids, features) tuples for each chunk, where
+    mol_ids contains molecule names (the _Name property, or None if it is
+    not set) and features is the feature matrix for the chunk.
+    """
+
+    # chunks waiting for features, in input order
+    # each record is (mol_ids, cached), where cached is None if the cache
+    # is not used or (chunk, cache lookup) otherwise
+    # chunks that are completely cached are passed through the pipeline as
+    # None, so records never holds more chunks than are in flight
+    records = collections.deque()
+
+    def get_chunks():
+      """
+      Split molecules into chunks that need to be featurized, keeping
+      track of molecule names and cached features.
+      """
+      for chunk in iter_chunks(mols, chunk_size):
+        mol_ids = np.asarray([
+            mol.GetProp('_Name') if mol.HasProp('_Name') else None
+            for mol in chunk])
+        if cache is None:
+          records.append((mol_ids, None))
+          yield chunk
+        else:
+          lookup = self._cache_lookup(chunk, cache)
+          records.append((mol_ids, (chunk, lookup)))
+          missing = lookup[2]
+          if missing:
+            yield [chunk[i] for i in missing]
+          else:
+            yield None  # passed through without featurizing
+
+    def finish(record, features):
+      """
+      Combine calculated and cached features for a chunk.
+      """
+      mol_ids, cached = record
+      if cached is not None:
+        chunk, (keys, cached_features, missing) = cached
+        features = self._cache_update(chunk, keys, cached_features, missing,
+                                      features, cache)
+        features = convert_dtype(features, dtype)
+      if not ragged and isinstance(features, RaggedArray):
+        features = features.densify()
+      return mol_ids, features
+
+    # features are cached before conversion, so only convert uncached
+    # features in the workers
+    for features in self._featurize_chunks(
+        get_chunks(), backend, n_jobs,
+        dtype=dtype if cache is None else None):
+      yield finish(records.popleft(), features)
+
+  def _featurize_chunks(self, chunks, backend='serial', n_jobs=None,
+                        isolate=False, timeout=None,
+                        max_tasks_per_child=None, dtype=None):
+    """
+    Calculate a feature matrix for each chunk of molecules.
+
+    With the 'process' backend, molecules are sent to workers as
+    PicklableMols so that molecule properties (such as _Name) survive
+    pickling. Feature matrices are yielded in the same order as the input
+    chunks. If isolate is True, (rows, failures) tuples are yielded
+    instead (see _featurize_isolated).
+
+    Parameters
+    ----------
+    chunks : iterable
+        Lists of RDKit Mol objects. Chunks that are None are not
+        featurized and yield None.
+    backend : str, optional (default 'serial')
+        Featurization backend ('serial' or 'process').
+    n_jobs : int, optional
+        Number of worker processes for the 'process' backend. Defaults to
+        the number of CPUs.
+    isolate : bool, optional (default False)
+        Whether to isolate failures.
+    timeout : float, optional
+        Time limit per molecule, in seconds (requires isolate).
+    max_tasks_per_child : int, optional
+        Number of chunks processed by each worker process before it is
+        replaced ('process' backend).
+    dtype : numpy dtype or str, optional
+        Output data type (not used if isolate is True).
+    """
+    if timeout is not None and not isolate:
+      raise ValueError('A timeout requires isolated failures.')
+    if backend == 'process':
+      chunks = (None if chunk is None else
+                [PicklableMol(mol) for mol in chunk] for chunk in chunks)
+    function = functools.partial(_featurize_chunk, self, isolate=isolate,
+                                 timeout=timeout, dtype=dtype)
+    return _map_chunks(function, chunks, backend, n_jobs, timeout,
+                       max_tasks_per_child)
+
+  def _featurize_batch(self, mols):
+    """
+    Calculate the feature matrix for a batch of molecules.
+
+    The default implementation calls _featurize for each molecule. Child
+    classes can override this method to calculate features for many
+    molecules at once, typically by filling a preallocated output array.
+    The returned matrix must have molecules on its first axis. If the
+    conformers class attribute is True, it should be a RaggedArray with
+    rows for the conformers of each molecule.
+
+    Parameters
+    ----------
+    mols : list
+        RDKit Mol objects.
+    """
+    features = [self._featurize(mol) for mol in mols]
+    return self._assemble(mols, features)
+
+  def _featurize_isolated(self, mols, timeout=None, report=True):
+    """
+    Calculate features for a batch of molecules, isolating failures.
+
+    The batch is featurized with _featurize_batch (within a time limit of
+    timeout seconds per molecule, if a timeout is given). If that fails,
+    each molecule is featurized separately (within timeout seconds) to
+    find the molecule(s) that failed.
+
+    With a timeout, results for each molecule are also reported with
+    report_progress as (row, reason) tuples (see _map_chunks).
+
+    Parameters
+    ----------
+    mols : list
+        RDKit Mol objects.
+    timeout : float, optional
+        Time limit per molecule, in seconds.
+    report : bool, optional (default True)
+        Whether to report progress (with a timeout). FeaturizerPipeline
+        reports progress for all of its featurizers together.
+
+    Returns
+    -------
+    rows : list
+        Features for each molecule (None for failed molecules).
+    failures : dict
+        Mapping from molecule index (in mols) to the reason for the
+        failure.
+    """
+    report = report and timeout is not None
+    if report:
+      report_batch(len(mols))
+    failures = {}
+    try:
+      with time_limit(None if timeout is None else timeout * len(mols)):
+        rows = self._split_features(self._featurize_batch(mols))
+    except Exception as e:
+      if len(mols) > 1:
+        rows = None  # find the molecule(s) that failed
+      else:
+        rows, failures = [None], {0: _failure_reason(e)}
+    if rows is not None:
+      if report:
+        report_progress([(row, failures.get(i))
+                         for i, row in enumerate(rows)])
+      return rows, failures
+    if report:
+      report_batch(1)
+    rows = []
+    for i, mol in enumerate(mols):
+      try:
+        with time_limit(timeout):
+          rows.extend(self._split_features(self._featurize_batch([mol])))
+      except Exception as e:
+        rows.append(None)
+        failures[i] = _failure_reason(e)
+      if report:  # see _map_chunks
+        report_progress([(rows[-1], failures.get(i))])
+    return rows, failures
+
+  def _assemble(self, mols, features):
+    """
+    Construct a feature matrix from per-molecule features. Features that
+    are None (e.g. for molecules that failed featurization) are masked.
+
+    Parameters
+    ----------
+    mols : iterable
+        RDKit Mol objects. Not used by the default implementation, so it
+        can be None.
+    features : list
+        Features calculated for each molecule.
+    """
     if self.conformers:
-      features = self.conformer_container(mols, features)
+      return RaggedArray.from_list(
+          [[None] if x is None else x for x in features])
     else:
-      features = np.asarray(features)
+      return _mask_failed(features)
+
+  def _split_features(self, features):
+    """
+    Split a feature matrix into features for each molecule.
+
+    Completely masked rows (e.g. molecules that failed featurization in a
+    batch) are returned as None. For padded conformer feature matrices,
+    trailing conformer entries that are completely masked are removed.
+
+    Parameters
+    ----------
+    features : ndarray or RaggedArray
+        Feature matrix.
+    """
+    if not self.conformers:
+      if not np.ma.isMaskedArray(features):
+        return [row for row in features]
+      mask = np.ma.getmaskarray(features).reshape((len(features), -1))
+      return [None if m.all() and m.size else row
+              for row, m in zip(features, mask)]
+    if isinstance(features, RaggedArray):
+      return [x.copy() for x in features]
+    rval = []
+    for x in features:
+      used = ~np.ma.getmaskarray(x).reshape((len(x), -1)).all(axis=1)
+      n_confs = np.flatnonzero(used)[-1] + 1 if used.any() else 1
+      rval.append(x[:n_confs])
+    return rval
+
+  def _cache_lookup(self, mols, cache):
+    """
+    Look up cached features for molecules.
+
+    Parameters
+    ----------
+    mols : list
+        RDKit Mol objects.
+    cache : FeatureCache
+        Feature cache.
+
+    Returns
+    -------
+    keys : list
+        Cache key for each molecule.
+    features : list
+        Cached features for each molecule (None if not found).
+    missing : list
+        Indices of molecules that need to be featurized. Molecules that
+        share a cache key are only featurized once.
+    """
+    keys = cache.get_keys(self, mols)
+    found = cache.get_many(keys)
+    features = [found.get(key) for key in keys]
+    missing = []
+    seen = set()
+    for i, key in enumerate(keys):
+      if key not in found and key not in seen:
+        missing.append(i)
+        seen.add(key)
+    return keys, features, missing
+
+  def _cache_update(self, mols, keys, features, missing, block, cache):
+    """
+    Add newly calculated features to the cache and construct the feature
+    matrix for all molecules.
+
+    Features for molecules that failed completely (None or fully masked)
+    are not cached.
+
+    Parameters
+    ----------
+    mols : list
+        RDKit Mol objects.
+    keys : list
+        Cache key for each molecule.
+    features : list
+        Cached features for each molecule (None if not found).
+    missing : list
+        Indices of molecules that were featurized.
+    block : ndarray or RaggedArray
+        Feature matrix for the featurized molecules.
+    cache : FeatureCache
+        Feature cache.
+    """
+    if missing:
+      self._cache_rows(keys, features, missing, self._split_features(block),
+                       cache)
+    return self._assemble(mols, features)
+
+  def _cache_rows(self, keys, features, missing, rows, cache):
+    """
+    Add newly calculated features to the cache and fill them in for every
+    molecule that shares their cache key.
+
+    Features for molecules that failed completely (None or fully masked)
+    are not cached.
+
+    Parameters
+    ----------
+    keys : list
+        Cache key for each molecule.
+    features : list
+        Cached features for each molecule (None if not found). Updated in
+        place.
+    missing : list
+        Indices of molecules that were featurized.
+    rows : list
+        Features for each molecule in missing.
+    cache : FeatureCache
+        Feature cache.
+    """
+    computed = dict(zip([keys[i] for i in missing], rows))
+    cache.set_many((key, value) for key, value in computed.items()
+                   if value is not None
+                   and not (isinstance(value, np.ndarray)
+                            and np.ma.getmaskarray(value).all()))
+    for i, key in enumerate(keys):
+      if key in computed:
+        features[i] = computed[key]
     return features
 
+  def _merge_blocks(self, blocks):
+    """
+    Concatenate feature matrices calculated for consecutive chunks of
+    molecules.
+
+    Padded conformer feature matrices are padded (with masked values) to
+    the maximum number of conformers in any chunk.
+
+    Parameters
+    ----------
+    blocks : list
+        Feature matrices. If empty (i.e. there are no molecules), an empty
+        feature matrix is returned.
+    """
+    if not blocks:
+      return self._assemble([], [])
+    if len(blocks) == 1:
+      return blocks[0]
+    if not self.conformers:
+      if any([isinstance(block, np.ma.MaskedArray) for block in blocks]):
+        return np.ma.concatenate(blocks)
+      return np.concatenate(blocks)
+    if all([isinstance(block, RaggedArray) for block in blocks]):
+      return RaggedArray.concatenate(blocks)
+    blocks = [block.densify() if isinstance(block, RaggedArray) else block
+              for block in blocks]
+    max_confs = max([block.shape[1] for block in blocks])
+    padded = []
+    for block in blocks:
+      x = np.ma.masked_all((block.shape[0], max_confs) + block.shape[2:],
+                           dtype=block.dtype)
+      x[:, :block.shape[1]] = block
+      padded.append(x)
+    return np.ma.concatenate(padded)
+
   def _featurize(self, mol):
     """
     Calculate features for a single molecule.
@@ -181,24 +984,17 @@ class Featurizer(object):
     """
     raise NotImplementedError('Featurizer is not defined.')
 
-  def __call__(self, mols, parallel=False, client_kwargs=None,
-               view_flags=None):
+  def __call__(self, mols, *args, **kwargs):
     """
-    Calculate features for molecules.
+    Calculate features for molecules. Additional arguments are passed to
+    featurize.
 
     Parameters
     ----------
     mols : iterable
         RDKit Mol objects.
-    parallel : bool, optional
-        Whether to train subtrainers in parallel using
-        IPython.parallel (default False).
-    client_kwargs : dict, optional
-        Keyword arguments for IPython.parallel Client.
-    view_flags : dict, optional
-        Flags for IPython.parallel LoadBalancedView.
     """
-    return self.featurize(mols, parallel, client_kwargs, view_flags)
+    return self.featurize(mols, *args, **kwargs)
 
   def conformer_container(self, mols, features):
     """
@@ -208,7 +1004,11 @@ class Featurizer(object):
     For example, if mols contains 3 molecules with 1, 2, 5 conformers,
     respectively, then the final container will have 3 entries on its
     first axis and 5 entries on its second axis. The remaining axes
-    correspond to feature dimensions.
+    correspond to feature dimensions. The size of the second axis is
+    determined by the number of entries in the features for each molecule,
+    which can exceed the number of conformers.
+
+    Use RaggedArray.from_list to store features without padding.
 
     Parameters
     ----------
@@ -220,37 +1020,520 @@ class Featurizer(object):
         ndarray with conformers on the first axis.
     """
 
-    # get the maximum number of conformers
-    max_confs = max([mol.GetNumConformers() for mol in mols])
-    if not max_confs:
-      max_confs = 1
-
-    # construct the new container
-    # - first axis = # mols
-    # - second axis = max # conformers
-    # - remaining axes = determined by feature shape
-    features_shape = None
-    for i in xrange(len(features)):
-      for j in xrange(len(features[i])):
-        if features[i][j] is not None:
-          features_shape = features[i][0].shape
-          break
-      if features_shape is not None:
-        break
-    if features_shape is None:
-      raise ValueError('Cannot find any features.')
-    shape = (len(mols), max_confs) + features_shape
-    x = np.ma.masked_all(shape)
-
-    # fill in the container
-    for i, (mol, mol_features) in enumerate(zip(mols, features)):
-      n_confs = max(mol.GetNumConformers(), 1)
+    return RaggedArray.from_list(features).densify()
+
+
+class FeaturizerPipeline(object):
+  """
+  Calculate features for molecules with several featurizers in one pass.
+
+  Each chunk of molecules is passed to every featurizer in turn. Featurizers
+  that prepare molecules with MolPreparators that have the same
+  configuration share a single MolPreparator, and each molecule is only
+  prepared once per configuration (per chunk). Note that the preparator
+  attributes of the featurizers are replaced by the shared instances.
+
+  Parameters
+  ----------
+  featurizers : list
+      Featurizers.
+  names : list, optional
+      Name for each featurizer, used to label its features. Defaults to the
+      featurizer name attributes, with a numeric suffix added to repeated
+      names.
+  """
+  def __init__(self, featurizers, names=None):
+    self.featurizers = list(featurizers)
+    if names is None:
+      names = []
+      for featurizer in self.featurizers:
+        name = featurizer.name
+        if isinstance(name, list):
+          name = name[0]
+        if name in names:
+          name = '{}_{}'.format(name, names.count(name))
+          while name in names:
+            name += '_'
+        names.append(name)
+    if len(names) != len(self.featurizers):
+      raise ValueError('Featurizers and names do not match.')
+    if len(set(names)) != len(names):
+      raise ValueError('Featurizer names must be unique.')
+    self.names = list(names)
+
+    # share preparators with the same configuration
+    self.preparators = collections.OrderedDict()
+    for featurizer in self.featurizers:
+      preparator = getattr(featurizer, 'preparator', None)
+      if not isinstance(preparator, MolPreparator):
+        continue
+      key = preparator.get_config()
+      featurizer.preparator = self.preparators.setdefault(key, preparator)
+
+  def featurize(self, mols, backend='serial', n_jobs=None, chunk_size=100,
+                ragged=False, dtype=None, timeout=None,
+                max_tasks_per_child=None, failures=None, cache=None):
+    """
+    Calculate features for molecules.
+
+    Parameters
+    ----------
+    mols : iterable
+        RDKit Mol objects.
+    backend : str, optional (default 'serial')
+        Featurization backend ('serial' or 'process').
+    n_jobs : int, optional
+        Number of worker processes for the 'process' backend. Defaults to
+        the number of CPUs.
+    chunk_size : int, optional (default 100)
+        Number of molecules per chunk.
+    ragged : bool, optional (default False)
+        Whether to return conformer features as RaggedArrays. See
+        Featurizer.featurize.
+    dtype : numpy dtype or str, optional
+        Output data type for all featurizers. See Featurizer.featurize.
+    timeout : float, optional
+        Time limit, in seconds, for featurizing each molecule with each
+        featurizer. Each featurizer featurizes a chunk as a batch and
+        falls back to one molecule at a time, as in Featurizer.featurize,
+        so a molecule that fails or exceeds the limit with one featurizer
+        only has masked features for that featurizer. With the 'process'
+        backend, a molecule that is stuck in a worker that cannot be
+        interrupted fails for every featurizer.
+    max_tasks_per_child : int, optional
+        Number of chunks processed by each worker process before it is
+        replaced with a new process ('process' backend).
+    failures : dict, optional
+        If provided, molecules that fail featurization (or exceed the time
+        limit) do not stop featurization, and their features are masked.
+        failures is updated with a mapping from each featurizer name to a
+        dict mapping molecule index to the reason for the failure.
+        Failures are also isolated (but not reported) if a timeout is
+        given.
+    cache : FeatureCache, optional
+        Cache for per-molecule features. Cache keys are looked up for each
+        featurizer separately, and each featurizer only featurizes the
+        molecules that are not found in the cache for it.
+
+    Returns
+    -------
+    An OrderedDict mapping featurizer names to feature matrices.
+    """
+    isolate = timeout is not None or failures is not None
+    blocks = [[] for _ in self.featurizers]
+    if isolate or cache is not None:
+      rows = [[] for _ in self.featurizers]
+      for _, chunk_rows in self._iter_chunks(
+          mols, chunk_size, backend, n_jobs, cache, isolate, timeout,
+          max_tasks_per_child, failures):
+        for featurizer_rows, featurizer_chunk_rows in zip(rows, chunk_rows):
+          featurizer_rows.extend(featurizer_chunk_rows)
+      for featurizer_blocks, featurizer, featurizer_rows in zip(
+          blocks, self.featurizers, rows):
+        featurizer_blocks.append(
+            convert_dtype(featurizer._assemble(None, featurizer_rows), dtype))
+    else:
+      for _, chunk_blocks in self._iter_chunks(
+          mols, chunk_size, backend, n_jobs,
+          max_tasks_per_child=max_tasks_per_child):
+        for i, block in enumerate(chunk_blocks):
+          blocks[i].append(convert_dtype(block, dtype))
+    features = collections.OrderedDict()
+    for name, featurizer, featurizer_blocks in zip(
+        self.names, self.featurizers, blocks):
+      x = featurizer._merge_blocks(featurizer_blocks)
+      if not featurizer_blocks:
+        x = convert_dtype(x, dtype)
+      if not ragged and isinstance(x, RaggedArray):
+        x = x.densify()
+      features[name] = x
+    return features
+
+  def featurize_iter(self, mols, chunk_size=1000, backend='serial',
+                     n_jobs=None, cache=None, ragged=False, dtype=None,
+                     timeout=None, max_tasks_per_child=None, failures=None):
+    """
+    Calculate features for molecules in chunks. See
+    Featurizer.featurize_iter.
+
+    Parameters
+    ----------
+    mols : iterable
+        RDKit Mol objects.
+    chunk_size : int, optional (default 1000)
+        Number of molecules per chunk.
+    backend : str, optional (default 'serial')
+        Featurization backend ('serial' or 'process').
+    n_jobs : int, optional
+        Number of worker processes for the 'process' backend. Defaults to
+        the number of CPUs.
+    cache : FeatureCache, optional
+        Cache for per-molecule features. See featurize.
+    ragged : bool, optional (default False)
+        Whether to return conformer features as RaggedArrays.
+    dtype : numpy dtype or str, optional
+        Output data type for all featurizers. See Featurizer.featurize.
+    timeout : float, optional
+        Time limit, in seconds, for featurizing each molecule with each
+        featurizer. See featurize.
+    max_tasks_per_child : int, optional
+        Number of chunks processed by each worker process before it is
+        replaced with a new process ('process' backend).
+    failures : dict, optional
+        If provided, failures are isolated and recorded as in featurize
+        (with molecule indices counted from the start of mols). The dict
+        is updated as each chunk is yielded.
+
+    Returns
+    -------
+    A generator yielding (mol_ids, features) tuples for each chunk, where
+    features is an OrderedDict mapping featurizer names to feature
+    matrices.
+    """
+    isolate = timeout is not None or failures is not None
+
+    # a successfully calculated row for each featurizer, used to construct
+    # masked features for chunks in which every molecule failed
+    templates = [None] * len(self.featurizers)
+    for mol_ids, chunk_blocks in self._iter_chunks(
+        mols, chunk_size, backend, n_jobs, cache, isolate, timeout,
+        max_tasks_per_child, failures):
+      if isolate or cache is not None:
+        chunk_blocks = self._assemble_chunk(chunk_blocks, templates)
+      features = collections.OrderedDict()
+      for name, x in zip(self.names, chunk_blocks):
+        x = convert_dtype(x, dtype)
+        if not ragged and isinstance(x, RaggedArray):
+          x = x.densify()
+        features[name] = x
+      yield mol_ids, features
+
+  def _iter_chunks(self, mols, chunk_size, backend='serial', n_jobs=None,
+                   cache=None, isolate=False, timeout=None,
+                   max_tasks_per_child=None, failures=None):
+    """
+    Calculate features for molecules in chunks, combining them with cached
+    features.
+
+    Parameters
+    ----------
+    mols : iterable
+        RDKit Mol objects.
+    chunk_size : int
+        Number of molecules per chunk.
+    backend : str, optional (default 'serial')
+        Featurization backend ('serial' or 'process').
+    n_jobs : int, optional
+        Number of worker processes for the 'process' backend.
+    cache : FeatureCache, optional
+        Cache for per-molecule features.
+    isolate : bool, optional (default False)
+        Whether to isolate failures.
+    timeout : float, optional
+        Time limit per molecule and featurizer, in seconds (requires
+        isolate).
+    max_tasks_per_child : int, optional
+        Number of chunks processed by each worker process before it is
+        replaced ('process' backend).
+    failures : dict, optional
+        Mapping from featurizer names to failures (see featurize). Updated
+        as each chunk is yielded.
+
+    Returns
+    -------
+    A generator yielding (mol_ids, values) tuples for each chunk, where
+    values contains a feature matrix for each featurizer or, if isolate
+    is True or a cache is given, a list of rows for each featurizer (None
+    for failed molecules).
+    """
+    if failures is not None:
+      for name in self.names:
+        failures.setdefault(name, {})
+    indices = tuple(xrange(len(self.featurizers)))
+
+    # chunks waiting for features, in input order
+    # each record is (mol_ids, cached), where cached is None if the cache
+    # is not used or (chunk, cache lookup for each featurizer) otherwise
+    records = collections.deque()
+
+    def get_chunks():
+      """
+      Split molecules into chunks of (mol, featurizer indices) tuples that
+      need to be featurized, keeping track of molecule names and cached
+      features.
+      """
+      for chunk in iter_chunks(mols, chunk_size):
+        mol_ids = np.asarray([
+            mol.GetProp('_Name') if mol.HasProp('_Name') else None
+            for mol in chunk])
+        if cache is None:
+          records.append((mol_ids, None))
+          yield [(mol, indices) for mol in chunk]
+          continue
+        lookups = [featurizer._cache_lookup(chunk, cache)
+                   for featurizer in self.featurizers]
+        records.append((mol_ids, (chunk, lookups)))
+        needed = collections.defaultdict(list)
+        for j, (_, _, missing) in enumerate(lookups):
+          for i in missing:
+            needed[i].append(j)
+        if needed:
+          yield [(chunk[i], tuple(needed[i])) for i in sorted(needed)]
+        else:
+          yield None  # passed through without featurizing
+
+    n_mols = 0
+    for results in self._featurize_chunks(
+        get_chunks(), backend, n_jobs, isolate, timeout,
+        max_tasks_per_child):
+      mol_ids, cached = records.popleft()
+      if cached is not None:
+        chunk, lookups = cached
+        values = self._cache_results(chunk, lookups, results, cache,
+                                     isolate, n_mols, failures)
+      elif isolate:
+        values = self._split_results(results, n_mols, failures)
+      else:
+        values = results
+      n_mols += len(mol_ids)
+      yield mol_ids, values
+
+  def _featurize_chunks(self, chunks, backend='serial', n_jobs=None,
+                        isolate=False, timeout=None,
+                        max_tasks_per_child=None):
+    """
+    Calculate a list of feature matrices (one for each featurizer) for each
+    chunk of molecules. If isolate is True, a list of (rows, failures)
+    tuples is yielded instead (see _featurize_isolated).
+
+    Parameters
+    ----------
+    chunks : iterable
+        Lists of (mol, featurizer indices) tuples (see _featurize_batch).
+        Chunks that are None are not featurized and yield None.
+    backend : str, optional (default 'serial')
+        Featurization backend ('serial' or 'process').
+    n_jobs : int, optional
+        Number of worker processes for the 'process' backend.
+    isolate : bool, optional (default False)
+        Whether to isolate failures.
+    timeout : float, optional
+        Time limit per molecule and featurizer, in seconds (requires
+        isolate).
+    max_tasks_per_child : int, optional
+        Number of chunks processed by each worker process before it is
+        replaced ('process' backend).
+    """
+    if timeout is not None and not isolate:
+      raise ValueError('A timeout requires isolated failures.')
+    if backend == 'process':
+      chunks = (None if chunk is None else
+                [(PicklableMol(mol), indices) for mol, indices in chunk]
+                for chunk in chunks)
+    function = functools.partial(_featurize_chunk, self, isolate=isolate,
+                                 timeout=timeout)
+    n_featurizers = len(self.featurizers)
+    return _map_chunks(
+        function, chunks, backend, n_jobs, timeout, max_tasks_per_child,
+        on_timeout=functools.partial(_pipeline_item_failed, n_featurizers),
+        join=functools.partial(_join_pipeline_rows, n_featurizers))
+
+  def _featurize_batch(self, items):
+    """
+    Calculate feature matrices for a batch of molecules with each
+    featurizer. Shared preparators are memoized for the duration of the
+    batch.
+
+    Parameters
+    ----------
+    items : list
+        (mol, indices) tuples, where indices are the indices of the
+        featurizers that featurize each RDKit Mol.
+
+    Returns
+    -------
+    A list containing the feature matrix for the molecules featurized by
+    each featurizer (or None, for featurizers without any molecules).
+    """
+    with self._memoize():
+      return [featurizer._featurize_batch(mols) if mols else None
+              for featurizer, mols in zip(self.featurizers,
+                                          self._select(items))]
+
+  def _featurize_isolated(self, items, timeout=None):
+    """
+    Calculate features for a batch of molecules with each featurizer,
+    isolating failures. Shared preparators are memoized for the duration
+    of the batch.
+
+    Each featurizer featurizes its molecules with
+    Featurizer._featurize_isolated. With a timeout, results for each
+    molecule are reported with report_progress once every featurizer is
+    done, as lists of (row, reason) tuples (one for each featurizer; see
+    _join_pipeline_rows).
+
+    Parameters
+    ----------
+    items : list
+        (mol, indices) tuples. See _featurize_batch.
+    timeout : float, optional
+        Time limit per molecule and featurizer, in seconds.
+
+    Returns
+    -------
+    A list of (rows, failures) tuples (one for each featurizer), with an
+    entry in rows for each item (None for failed molecules and molecules
+    that the featurizer did not featurize). See
+    Featurizer._featurize_isolated.
+    """
+    results = []
+    with self._memoize():
+      for j, (featurizer, mols) in enumerate(
+          zip(self.featurizers, self._select(items))):
+        rows, failures = [None] * len(items), {}
+        if mols:
+          if timeout is not None:  # restart the clock for each featurizer
+            report_batch(len(mols))
+          selected = [i for i, (_, indices) in enumerate(items)
+                      if j in indices]
+          mol_rows, mol_failures = featurizer._featurize_isolated(
+              mols, timeout, report=False)
+          for i, row in zip(selected, mol_rows):
+            rows[i] = row
+          for i, reason in mol_failures.items():
+            failures[selected[i]] = reason
+        results.append((rows, failures))
+    if timeout is not None:
+      report_progress(zip(*[[(row, item_failures.get(i))
+                             for i, row in enumerate(item_rows)]
+                            for item_rows, item_failures in results]))
+    return results
+
+  def _select(self, items):
+    """
+    Get the molecules featurized by each featurizer.
+
+    Parameters
+    ----------
+    items : list
+        (mol, indices) tuples. See _featurize_batch.
+    """
+    return [[mol for mol, indices in items if j in indices]
+            for j in xrange(len(self.featurizers))]
+
+  @contextlib.contextmanager
+  def _memoize(self):
+    """
+    Memoize shared preparators within a block.
+    """
+    for preparator in self.preparators.values():
+      preparator.memoize(True)
+    try:
+      yield
+    finally:
+      for preparator in self.preparators.values():
+        preparator.memoize(False)
+
+  def _split_results(self, results, start, failures=None):
+    """
+    Get rows for each featurizer from the results for a chunk of molecules
+    (see _featurize_isolated), recording failures.
+
+    Parameters
+    ----------
+    results : list
+        (rows, failures) tuples for each featurizer.
+    start : int
+        Index of the first molecule in the chunk.
+    failures : dict, optional
+        Mapping from featurizer names to failures (see featurize).
+    """
+    rows = []
+    for name, (chunk_rows, chunk_failures) in zip(self.names, results):
+      if failures is not None:
+        for i, reason in chunk_failures.items():
+          failures[name][start + i] = reason
+      rows.append(chunk_rows)
+    return rows
+
+  def _cache_results(self, chunk, lookups, results, cache, isolate=False,
+                     start=0, failures=None):
+    """
+    Add newly calculated features for a chunk of molecules to the cache and
+    get rows for each featurizer, recording failures.
+
+    Parameters
+    ----------
+    chunk : list
+        RDKit Mol objects.
+    lookups : list
+        Cache lookup for each featurizer (see Featurizer._cache_lookup).
+    results : list
+        Results for the molecules that were featurized (see
+        _featurize_chunks), or None if there were none.
+    cache : FeatureCache
+        Feature cache.
+    isolate : bool, optional (default False)
+        Whether results are (rows, failures) tuples.
+    start : int, optional (default 0)
+        Index of the first molecule in the chunk.
+    failures : dict, optional
+        Mapping from featurizer names to failures (see featurize).
+    """
+    featurized = sorted(set(
+        i for _, _, missing in lookups for i in missing))
+    position = dict((i, k) for k, i in enumerate(featurized))
+    rows = []
+    for j, (name, featurizer, (keys, features, missing)) in enumerate(
+        zip(self.names, self.featurizers, lookups)):
+      if missing:
+        if isolate:
+          item_rows, item_failures = results[j]
+          computed = [item_rows[position[i]] for i in missing]
+          if failures is not None:
+            for k, reason in item_failures.items():
+              failures[name][start + featurized[k]] = reason
+        else:
+          computed = featurizer._split_features(results[j])
+        featurizer._cache_rows(keys, features, missing, computed, cache)
+      rows.append(features)
+    return rows
+
+  def _assemble_chunk(self, rows, templates):
+    """
+    Construct a feature matrix for each featurizer from the rows for a
+    chunk of molecules.
+
+    If every molecule in the chunk failed for a featurizer, a row
+    calculated for an earlier chunk is used to construct masked features
+    of the right shape.
+
+    Parameters
+    ----------
+    rows : list
+        Rows for each featurizer (None for failed molecules).
+    templates : list
+        A successfully calculated row for each featurizer, or None if
+        there is none yet. Updated in place.
+    """
+    blocks = []
+    for i, (featurizer, featurizer_rows) in enumerate(
+        zip(self.featurizers, rows)):
+      if templates[i] is None:
+        templates[i] = next(
+            (row for row in featurizer_rows if row is not None), None)
       try:
-        x[i, :n_confs] = mol_features
-      except ValueError:  # handle None conformer values
-        for j in xrange(n_confs):
-          x[i, j] = mol_features[j]
-    return x
+        x = featurizer._assemble(None, featurizer_rows)
+      except ValueError:  # every molecule failed
+        if templates[i] is None:
+          raise
+        x = featurizer._assemble(None, [templates[i]] + featurizer_rows)
+        if isinstance(x, RaggedArray):
+          x = RaggedArray(x.data[x.offsets[1]:], x.offsets[1:] - x.offsets[1])
+        else:
+          x = x[1:]
+      blocks.append(x)
+    return blocks
 
 
 class MolPreparator(object):
@@ -275,6 +1558,7 @@ class MolPreparator(object):
     self.ionizer = Ionizer(pH)
     self.align = align
     self.add_hydrogens = add_hydrogens
+    self._memo = None
 
   def __call__(self, *args, **kwargs):
     return self.prepare(*args, **kwargs)
@@ -323,6 +1607,36 @@ class MolPreparator(object):
     """
     self.add_hydrogens = add_hydrogens
 
+  def get_config(self):
+    """
+    Get a tuple describing the preparation options. MolPreparators with the
+    same configuration prepare molecules identically.
+    """
+    return self.ionize, self.ionizer.pH, self.align, self.add_hydrogens
+
+  def memoize(self, enable=True):
+    """
+    Enable or disable memoization of prepared molecules.
+
+    While memoization is enabled, each input molecule (identified by object
+    identity) is only prepared once for each combination of options, and
+    copies of the prepared molecule are returned. Disabling memoization
+    releases the stored molecules.
+
+    Parameters
+    ----------
+    enable : bool, optional (default True)
+        Whether to enable memoization.
+    """
+    self._memo = {} if enable else None
+
+  @property
+  def memoized(self):
+    """
+    Whether memoization is enabled.
+    """
+    return self._memo is not None
+
   def prepare(self, mol, ionize=None, align=None, add_hydrogens=None):
     """
     Prepare a molecule for featurization.
@@ -348,7 +1662,123 @@ class MolPreparator(object):
       align = self.align
     if add_hydrogens is None:
       add_hydrogens = self.add_hydrogens
+    if self._memo is not None:
+      key = (id(mol), ionize, align, add_hydrogens)
+      if key not in self._memo:
+
+        # keep a reference to the input molecule so its id is not reused
+        self._memo[key] = (mol, self._prepare(mol, ionize, align,
+                                              add_hydrogens))
+      return self._copy(self._memo[key][1], raise_errors=True)
+    return self._prepare(mol, ionize, align, add_hydrogens)
+
+  def prepare_many(self, mols, ionize=None, align=None, add_hydrogens=None,
+                   copy=True):
+    """
+    Prepare a batch of molecules for featurization.
+
+    Molecules are ionized with Ionizer.ionize_many, which uses a single
+    obabel process for the whole batch. If memoization is enabled, only
+    molecules that have not been prepared with the same options are
+    prepared, and ionization failures are memoized so that prepare raises
+    them for the affected molecules.
 
+    Parameters
+    ----------
+    mols : list
+        Molecules.
+    ionize : bool, optional (default None)
+        Override for self.ionize.
+    align : bool, optional (default None)
+        Override for self.align.
+    add_hydrogens : bool, optional (default None)
+        Override for self.add_hydrogens.
+    copy : bool, optional (default True)
+        Whether to return copies of memoized molecules. If False and
+        memoization is enabled, molecules are only memoized (for later
+        calls to prepare) and None is returned.
+
+    Returns
+    -------
+    A list containing the prepared molecule for each input molecule, or an
+    IonizerError instance for molecules that failed ionization.
+    """
+    if ionize is None:
+      ionize = self.ionize
+    if align is None:
+      align = self.align
+    if add_hydrogens is None:
+      add_hydrogens = self.add_hydrogens
+    mols = list(mols)
+    if self._memo is None:
+      return self._prepare_many(mols, ionize, align, add_hydrogens)
+    keys = [(id(mol), ionize, align, add_hydrogens) for mol in mols]
+    new = collections.OrderedDict()
+    for key, mol in zip(keys, mols):
+      if key not in self._memo:
+        new[key] = mol
+    for key, mol, prepared in zip(
+        new.keys(), new.values(),
+        self._prepare_many(new.values(), ionize, align, add_hydrogens)):
+      self._memo[key] = (mol, prepared)
+    if not copy:
+      return None
+    return [self._copy(self._memo[key][1]) for key in keys]
+
+  @staticmethod
+  def _copy(mol, raise_errors=False):
+    """
+    Copy a memoized molecule.
+
+    Parameters
+    ----------
+    mol : RDMol or IonizerError
+        Prepared molecule, or ionization error.
+    raise_errors : bool, optional (default False)
+        Whether to raise ionization errors.
+    """
+    if isinstance(mol, IonizerError):
+      if raise_errors:
+        raise mol
+      return mol
+    return Chem.Mol(mol)
+
+  def _prepare_many(self, mols, ionize, align, add_hydrogens):
+    """
+    Prepare a batch of molecules for featurization.
+
+    Parameters
+    ----------
+    mols : list
+        Molecules.
+    ionize : bool
+        Whether to ionize the molecules.
+    align : bool
+        Whether to align the molecules.
+    add_hydrogens : bool
+        Whether to add hydrogens.
+    """
+    if ionize:
+      mols = self.ionizer.ionize_many([Chem.Mol(mol) for mol in mols])
+    return [mol if isinstance(mol, IonizerError)
+            else self._prepare(mol, False, align, add_hydrogens)
+            for mol in mols]
+
+  def _prepare(self, mol, ionize, align, add_hydrogens):
+    """
+    Prepare a molecule for featurization.
+
+    Parameters
+    ----------
+    mol : RDMol
+        Molecule.
+    ionize : bool
+        Whether to ionize the molecule.
+    align : bool
+        Whether to align the molecule.
+    add_hydrogens : bool
+        Whether to add hydrogens.
+    """
     mol = Chem.Mol(mol)  # create a copy
 
     # ionization
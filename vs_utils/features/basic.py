@@ -6,10 +6,23 @@ __author__ = "Steven Kearnes"
 __copyright__ = "Copyright 2014, Stanford University"
 __license__ = "BSD 3-clause"
 
+import fnmatch
+import numpy as np
+import warnings
+
 from rdkit.Chem import Descriptors
 
 from vs_utils.features import Featurizer
 
+# patterns for descriptors skipped by each cost budget
+# the 'fast' budget skips descriptors that are much slower than the median
+# descriptor (information content, graph walks, and topological complexity)
+COST_BUDGETS = {
+    'all': [],
+    'fast': ['AvgIpc', 'BalabanJ', 'BCUT2D_*', 'BertzCT', 'Ipc', 'qed',
+             'SPS'],
+}
+
 
 class MolecularWeight(Featurizer):
     """
@@ -30,6 +43,20 @@ class MolecularWeight(Featurizer):
         wt = [wt]
         return wt
 
+    def _featurize_batch(self, mols):
+        """
+        Calculate molecular weights for a batch of molecules.
+
+        Parameters
+        ----------
+        mols : list
+            Molecules.
+        """
+        features = np.zeros((len(mols), 1), dtype=float)
+        for i, mol in enumerate(mols):
+            features[i, 0] = Descriptors.ExactMolWt(mol)
+        return features
+
 
 class SimpleDescriptors(Featurizer):
     """
@@ -37,13 +64,52 @@ class SimpleDescriptors(Featurizer):
 
     See http://rdkit.org/docs/GettingStartedInPython.html
     #list-of-available-descriptors.
+
+    Descriptors are selected by name or by shell-style pattern (e.g.
+    'fr_*'). Use scripts/profile_descriptors.py to measure the cost of each
+    descriptor on a sample of molecules.
+
+    Descriptors are stored as float32. Values outside the float32 range
+    (e.g. Ipc for large molecules) are clipped to the largest float32
+    value with a warning, rather than overflowing to inf.
+
+    Parameters
+    ----------
+    include : list or str, optional
+        Descriptors to calculate (a list, or a comma- or space-separated
+        string). Defaults to all descriptors allowed by cost_budget.
+    exclude : list or str, optional
+        Descriptors to skip.
+    cost_budget : str, optional (default 'all')
+        Descriptor preset. Choose from:
+        * 'all' : all descriptors.
+        * 'fast' : skip descriptors that dominate runtime (see
+          COST_BUDGETS).
     """
     name = 'descriptors'
 
-    def __init__(self):
+    def __init__(self, include=None, exclude=None, cost_budget='all'):
+        if cost_budget not in COST_BUDGETS:
+            raise ValueError(
+                "Unrecognized cost budget '{}'.".format(cost_budget))
+        self.include = _parse_names(include)
+        self.exclude = _parse_names(exclude)
+        self.cost_budget = cost_budget
+        skip = COST_BUDGETS[cost_budget] + (self.exclude or [])
+        if self.include is not None:
+            for pattern in self.include:
+                if not any([_matches(descriptor, [pattern])
+                            for descriptor, _ in Descriptors.descList]):
+                    raise ValueError(
+                        "Unrecognized descriptor '{}'.".format(pattern))
         self.descriptors = []
         self.functions = []
         for descriptor, function in Descriptors.descList:
+            if self.include is not None and not _matches(descriptor,
+                                                         self.include):
+                continue
+            if _matches(descriptor, skip):
+                continue
             self.descriptors.append(descriptor)
             self.functions.append(function)
 
@@ -56,7 +122,73 @@ class SimpleDescriptors(Featurizer):
         mol : RDKit Mol
             Molecule.
         """
-        rval = []
-        for function in self.functions:
-            rval.append(function(mol))
+        rval = np.zeros(len(self.functions), dtype=np.float32)
+        self._set_descriptors(mol, rval)
         return rval
+
+    def _featurize_batch(self, mols):
+        """
+        Calculate RDKit descriptors for a batch of molecules.
+
+        Parameters
+        ----------
+        mols : list
+            Molecules.
+        """
+        features = np.zeros((len(mols), len(self.functions)),
+                            dtype=np.float32)
+        for i, mol in enumerate(mols):
+            self._set_descriptors(mol, features[i])
+        return features
+
+    def _set_descriptors(self, mol, row):
+        """
+        Calculate descriptors into a preallocated row.
+
+        Parameters
+        ----------
+        mol : RDKit Mol
+            Molecule.
+        row : ndarray
+            Output row with one entry for each descriptor.
+        """
+        limit = np.finfo(row.dtype).max
+        for j, function in enumerate(self.functions):
+            value = function(mol)
+            if np.isfinite(value) and abs(value) > limit:
+                warnings.warn(
+                    "Descriptor '{}' exceeds the {} range and was "
+                    "clipped.".format(self.descriptors[j], row.dtype))
+                value = np.clip(value, -limit, limit)
+            row[j] = value
+
+
+def _parse_names(names):
+    """
+    Parse a list of descriptor names or patterns.
+
+    Parameters
+    ----------
+    names : list or str
+        Names, or a comma- or space-separated string of names.
+    """
+    if names is None:
+        return None
+    if isinstance(names, basestring):
+        names = names.replace(',', ' ').split()
+    return list(names)
+
+
+def _matches(descriptor, patterns):
+    """
+    Check whether a descriptor name matches any pattern.
+
+    Parameters
+    ----------
+    descriptor : str
+        Descriptor name.
+    patterns : list
+        Names or shell-style patterns.
+    """
+    return any([fnmatch.fnmatchcase(descriptor, pattern)
+                for pattern in patterns])
@@ -8,12 +8,13 @@ __author__ = "Steven Kearnes"
 __copyright__ = "Copyright 2014, Stanford University"
 __license__ = "BSD 3-clause"
 
+import hashlib
 import numpy as np
 
 from rdkit import Chem
 
 from vs_utils.features import Featurizer
-from vs_utils.utils import pad_array
+from vs_utils.utils.array_utils import RaggedArray
 
 
 class CoulombMatrix(Featurizer):
@@ -33,13 +34,28 @@ class CoulombMatrix(Featurizer):
     n_samples : int, optional (default 1)
         Number of random Coulomb matrices to generate if randomize is True.
     seed : int, optional
-        Random seed.
+        Master random seed. Each molecule gets a seed derived from the
+        master seed and the molecule itself, so randomized matrices are
+        reproducible regardless of featurization order or parallelism.
+    representation : str, optional (default 'matrix')
+        Feature representation for each conformer. Choose from:
+        * 'matrix' : flattened upper triangle of the (optionally
+          randomized) Coulomb matrix.
+        * 'sorted' : flattened upper triangle of the Coulomb matrix with
+          rows and columns sorted by decreasing row norm.
+        * 'eigenspectrum' : eigenvalues of the Coulomb matrix sorted by
+          decreasing absolute value (max_atoms values).
+        The 'sorted' and 'eigenspectrum' representations do not depend on
+        atom index order, so randomize and n_samples are ignored.
     """
     conformers = True
     name = 'coulomb_matrix'
 
     def __init__(self, max_atoms, remove_hydrogens=True, randomize=True,
-                 n_samples=1, seed=None):
+                 n_samples=1, seed=None, representation='matrix'):
+        if representation not in ['matrix', 'sorted', 'eigenspectrum']:
+            raise ValueError(
+                "Unrecognized representation '{}'.".format(representation))
         self.max_atoms = int(max_atoms)
         self.remove_hydrogens = remove_hydrogens
         self.randomize = randomize
@@ -47,6 +63,7 @@ class CoulombMatrix(Featurizer):
         if seed is not None:
             seed = int(seed)
         self.seed = seed
+        self.representation = representation
 
     def _featurize(self, mol):
         """
@@ -55,22 +72,81 @@ class CoulombMatrix(Featurizer):
         for additional conformers.
 
         Since Coulomb matrices are symmetric, only the (flattened) upper
-        triangular portion is returned.
+        triangular portion is returned (or the eigenvalues, depending on
+        the representation).
 
         Parameters
         ----------
         mol : RDKit Mol
             Molecule.
         """
-        features = self.coulomb_matrix(mol)
-        features = [f[np.triu_indices_from(f)] for f in features]
-        features = np.asarray(features)
+        return self.get_features(self.coulomb_matrix(mol))
+
+    def _featurize_batch(self, mols):
+        """
+        Calculate Coulomb matrices for a batch of molecules.
+
+        The upper triangular portion of each matrix is written directly into
+        a preallocated RaggedArray with one row per conformer (times
+        n_samples, if randomize is True).
+
+        Parameters
+        ----------
+        mols : list
+            Molecules.
+        """
+        if self.representation == 'eigenspectrum':
+            n_features = self.max_atoms
+        else:
+            n_features = self.max_atoms * (self.max_atoms + 1) // 2
+        n_rows = [mol.GetNumConformers() * self.get_n_samples()
+                  for mol in mols]
+        offsets = np.concatenate(([0], np.cumsum(n_rows)))
+        features = RaggedArray(np.zeros((offsets[-1], n_features)), offsets)
+        for i, mol in enumerate(mols):
+            if n_rows[i]:
+                features.data[offsets[i]:offsets[i + 1]] = self.get_features(
+                    self.coulomb_matrix(mol))
         return features
 
+    def get_n_samples(self):
+        """
+        Get the number of feature rows for each conformer.
+        """
+        if self.randomize and self.representation == 'matrix':
+            return self.n_samples
+        return 1
+
+    def get_features(self, m):
+        """
+        Convert Coulomb matrices to features.
+
+        Parameters
+        ----------
+        m : ndarray
+            Padded Coulomb matrices with shape (n, max_atoms, max_atoms).
+
+        Returns
+        -------
+        An array with shape (n, n_features).
+        """
+        if self.representation == 'eigenspectrum':
+            eigenvalues = np.linalg.eigvalsh(m)  # batched over matrices
+            order = np.argsort(-np.abs(eigenvalues), axis=1, kind='mergesort')
+            return eigenvalues[np.arange(len(m))[:, np.newaxis], order]
+        triu = np.triu_indices(self.max_atoms)
+        return m[:, triu[0], triu[1]]
+
     def coulomb_matrix(self, mol):
         """
         Generate Coulomb matrices for each conformer of the given molecule.
 
+        Matrices for all conformers are calculated at once from conformer
+        coordinates and written into a preallocated array with shape
+        (n_confs * n_samples, max_atoms, max_atoms) (n_samples is 1 if
+        randomize is False or the representation is not 'matrix'). Rows and
+        columns beyond the number of atoms are zero.
+
         Parameters
         ----------
         mol : RDKit Mol
@@ -79,31 +155,68 @@ class CoulombMatrix(Featurizer):
         if self.remove_hydrogens:
             mol = Chem.RemoveHs(mol)
         n_atoms = mol.GetNumAtoms()
-        z = [atom.GetAtomicNum() for atom in mol.GetAtoms()]
-        rval = []
-        for conf in mol.GetConformers():
-            d = self.get_interatomic_distances(conf)
-            m = np.zeros((n_atoms, n_atoms))
-            for i in xrange(mol.GetNumAtoms()):
-                for j in xrange(mol.GetNumAtoms()):
-                    if i == j:
-                        m[i, j] = 0.5 * z[i] ** 2.4
-                    elif i < j:
-                        m[i, j] = (z[i] * z[j]) / d[i, j]
-                        m[j, i] = m[i, j]
-                    else:
-                        continue
-            if self.randomize:
-                for random_m in self.randomize_coulomb_matrix(m):
-                    random_m = pad_array(random_m, self.max_atoms)
-                    rval.append(random_m)
-            else:
-                m = pad_array(m, self.max_atoms)
-                rval.append(m)
-        rval = np.asarray(rval)
+        if n_atoms > self.max_atoms:
+            raise ValueError('Molecule has more than max_atoms atoms ' +
+                             '({} > {}).'.format(n_atoms, self.max_atoms))
+        z = np.asarray([atom.GetAtomicNum() for atom in mol.GetAtoms()],
+                       dtype=float)
+        coords = np.zeros((mol.GetNumConformers(), n_atoms, 3))
+        for i, conf in enumerate(mol.GetConformers()):
+            coords[i] = conf.GetPositions()
+        m = self.get_coulomb_matrices(z, coords)
+        if self.representation == 'sorted':
+            m = self.sort_coulomb_matrices(m)
+        n_per_conf = self.get_n_samples()
+        rval = np.zeros((len(m) * n_per_conf, self.max_atoms, self.max_atoms))
+        if self.randomize and self.representation == 'matrix':
+            samples = rval.reshape((len(m), n_per_conf) + rval.shape[1:])
+            rng = self.get_rng(z, coords)
+            samples[:, :, :n_atoms, :n_atoms] = (
+                self.randomize_coulomb_matrices(m, rng))
+        else:
+            rval[:, :n_atoms, :n_atoms] = m
         return rval
 
-    def randomize_coulomb_matrix(self, m):
+    @classmethod
+    def get_coulomb_matrices(cls, z, coords):
+        """
+        Calculate unpadded Coulomb matrices for a set of conformers.
+
+        Parameters
+        ----------
+        z : ndarray
+            Atomic numbers.
+        coords : ndarray
+            Atomic coordinates with shape (n_confs, n_atoms, 3).
+
+        Returns
+        -------
+        An array with shape (n_confs, n_atoms, n_atoms).
+        """
+        d = cls.get_distance_matrices(coords)
+        diag = np.arange(len(z))
+        d[:, diag, diag] = 1  # avoid dividing by zero
+        m = np.outer(z, z) / d
+        m[:, diag, diag] = 0.5 * z ** 2.4
+        return m
+
+    @staticmethod
+    def sort_coulomb_matrices(m):
+        """
+        Sort the rows and columns of Coulomb matrices by decreasing row
+        norm (ties are broken by atom index).
+
+        Parameters
+        ----------
+        m : ndarray
+            Coulomb matrices with shape (n, n_atoms, n_atoms).
+        """
+        norms = np.sqrt(np.sum(m * m, axis=2))
+        order = np.argsort(-norms, axis=1, kind='mergesort')
+        index = np.arange(len(m))[:, np.newaxis, np.newaxis]
+        return m[index, order[:, :, np.newaxis], order[:, np.newaxis, :]]
+
+    def randomize_coulomb_matrix(self, m, rng=None):
         """
         Randomize a Coulomb matrix as decribed in Montavon et al., _New Journal
         of Physics_ __15__ (2013) 095003:
@@ -118,23 +231,66 @@ class CoulombMatrix(Featurizer):
         ----------
         m : ndarray
             Coulomb matrix.
-        n_samples : int, optional (default 1)
-            Number of random matrices to generate.
-        seed : int, optional
-            Random seed.
-        """
-        rval = []
-        row_norms = np.asarray([np.linalg.norm(row) for row in m], dtype=float)
-        rng = np.random.RandomState(self.seed)
-        for i in xrange(self.n_samples):
-            e = rng.normal(size=row_norms.size)
-            p = np.argsort(row_norms + e)
-            new = m[p][:, p]  # permute rows first, then columns
-            rval.append(new)
-        return rval
+        rng : RandomState, optional
+            Random number generator. Defaults to a generator seeded with
+            the seed attribute.
+        """
+        if rng is None:
+            rng = np.random.RandomState(self.seed)
+        return list(self.randomize_coulomb_matrices(m[np.newaxis], rng)[0])
 
-    @staticmethod
-    def get_interatomic_distances(conf):
+    def randomize_coulomb_matrices(self, m, rng):
+        """
+        Draw n_samples randomized Coulomb matrices for each of a set of
+        matrices (see randomize_coulomb_matrix).
+
+        Noise for all matrices and samples is drawn from rng at once, and
+        all permuted matrices are gathered with a single indexing
+        operation.
+
+        Parameters
+        ----------
+        m : ndarray
+            Coulomb matrices with shape (n, n_atoms, n_atoms).
+        rng : RandomState
+            Random number generator.
+
+        Returns
+        -------
+        An array with shape (n, n_samples, n_atoms, n_atoms).
+        """
+        n, n_atoms = m.shape[:2]
+        row_norms = np.sqrt(np.sum(m * m, axis=2))
+        e = rng.normal(size=(n, self.n_samples, n_atoms))
+        p = np.argsort(row_norms[:, np.newaxis] + e, axis=2)
+        index = np.arange(n)[:, np.newaxis, np.newaxis, np.newaxis]
+        return m[index, p[..., np.newaxis], p[..., np.newaxis, :]]
+
+    def get_rng(self, z, coords):
+        """
+        Get a random number generator for a molecule.
+
+        If a seed is set, the generator is seeded with a hash of the seed
+        and the molecule (atomic numbers and coordinates), so results do not
+        depend on the order or chunking of molecules (e.g. with parallel
+        featurization) but different molecules get different noise.
+
+        Parameters
+        ----------
+        z : ndarray
+            Atomic numbers.
+        coords : ndarray
+            Atomic coordinates with shape (n_confs, n_atoms, 3).
+        """
+        if self.seed is None:
+            return np.random.RandomState()
+        digest = hashlib.sha1('{}:'.format(self.seed))
+        digest.update(np.ascontiguousarray(z, dtype=float).tostring())
+        digest.update(np.ascontiguousarray(coords, dtype=float).tostring())
+        return np.random.RandomState(int(digest.hexdigest()[:8], 16))
+
+    @classmethod
+    def get_interatomic_distances(cls, conf):
         """
         Get interatomic distances for atoms in a molecular conformer.
 
@@ -143,14 +299,21 @@ class CoulombMatrix(Featurizer):
         conf : RDKit Conformer
             Molecule conformer.
         """
-        n_atoms = conf.GetNumAtoms()
-        coords = [conf.GetAtomPosition(i) for i in xrange(n_atoms)]
-        d = np.zeros((n_atoms, n_atoms), dtype=float)
-        for i in xrange(n_atoms):
-            for j in xrange(n_atoms):
-                if i < j:
-                    d[i, j] = coords[i].Distance(coords[j])
-                    d[j, i] = d[i, j]
-                else:
-                    continue
-        return d
+        return cls.get_distance_matrices(conf.GetPositions()[np.newaxis])[0]
+
+    @staticmethod
+    def get_distance_matrices(coords):
+        """
+        Get interatomic distances for a set of conformers.
+
+        Parameters
+        ----------
+        coords : ndarray
+            Atomic coordinates with shape (n_confs, n_atoms, 3).
+
+        Returns
+        -------
+        An array with shape (n_confs, n_atoms, n_atoms).
+        """
+        diff = coords[:, :, np.newaxis] - coords[:, np.newaxis]
+        return np.sqrt(np.sum(diff * diff, axis=-1))
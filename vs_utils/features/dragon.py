@@ -9,6 +9,7 @@ __license__ = "BSD 3-clause"
 import numpy as np
 
 from vs_utils.features import Featurizer
+from vs_utils.utils.array_utils import convert_dtype
 from vs_utils.utils.dragon_utils import Dragon
 
 
@@ -25,12 +26,20 @@ class DragonDescriptors(Featurizer):
     name = 'dragon'
 
     def __init__(self, assign_stereo_from_3d=False):
+        self.assign_stereo_from_3d = assign_stereo_from_3d
+        self.uses_coordinates = assign_stereo_from_3d
         self.engine = Dragon(assign_stereo_from_3d=assign_stereo_from_3d)
 
     def featurize(self, mols, parallel=False, client_kwargs=None,
-                  view_flags=None):
+                  view_flags=None, backend=None, n_jobs=None, chunk_size=100,
+                  cache=None, ragged=False, timeout=None,
+                  max_tasks_per_child=None, failures=None, dtype=None):
         """
-        Calculate features for molecules.
+        Calculate features for molecules. See Featurizer.featurize.
+
+        With IPython.parallel, molecules are split into one batch per
+        engine so each engine makes a single dragon6shell call. Other
+        backends featurize chunks of molecules with _featurize_batch.
 
         Parameters
         ----------
@@ -42,39 +51,79 @@ class DragonDescriptors(Featurizer):
             Keyword arguments for IPython.parallel Client.
         view_flags : dict, optional
             Flags for IPython.parallel LoadBalancedView.
+        backend : str, optional
+            Featurization backend ('serial', 'ipython', or 'process').
+        n_jobs : int, optional
+            Number of worker processes for the 'process' backend.
+        chunk_size : int, optional (default 100)
+            Number of molecules passed to each dragon6shell call with the
+            'serial' and 'process' backends.
+        cache : FeatureCache, optional
+            Cache for per-molecule features.
+        ragged : bool, optional (default False)
+            Not used (Dragon descriptors do not use conformers).
+        timeout : float, optional
+            Time limit, in seconds, for featurizing each molecule.
+        max_tasks_per_child : int, optional
+            Number of chunks processed by each worker process before it is
+            replaced ('process' backend).
+        failures : dict, optional
+            Mapping from molecule index to the reason for the failure.
+        dtype : numpy dtype or str, optional
+            Output data type.
+        """
+        if backend is None:
+            backend = 'ipython' if parallel else 'serial'
+        if (backend != 'ipython' or cache is not None or timeout is not None
+                or max_tasks_per_child is not None or failures is not None):
+            return super(DragonDescriptors, self).featurize(
+                mols, parallel, client_kwargs, view_flags, backend, n_jobs,
+                chunk_size, cache=cache, ragged=ragged, timeout=timeout,
+                max_tasks_per_child=max_tasks_per_child, failures=failures,
+                dtype=dtype)
+
+        from IPython.parallel import Client
+
+        if client_kwargs is None:
+            client_kwargs = {}
+        if view_flags is None:
+            view_flags = {}
+        client = Client(**client_kwargs)
+        client.direct_view().use_dill()  # use dill
+        view = client.load_balanced_view()
+        view.set_flags(**view_flags)
+        call = view.map(
+            self._featurize_batch,
+            np.array_split(mols, len(client.direct_view())), block=False)
+        features = call.get()
+        features = np.ma.concatenate(features)
+
+        # get output from engines
+        call.display_outputs()
+
+        return convert_dtype(features, dtype)
+
+    def _featurize(self, mol):
+        """
+        Calculate Dragon descriptors for a molecule.
+
+        Parameters
+        ----------
+        mol : RDKit Mol
+            Molecule.
         """
-        if parallel:
-            from IPython.parallel import Client
-
-            if client_kwargs is None:
-                client_kwargs = {}
-            if view_flags is None:
-                view_flags = {}
-            client = Client(**client_kwargs)
-            client.direct_view().use_dill()  # use dill
-            view = client.load_balanced_view()
-            view.set_flags(**view_flags)
-            call = view.map(
-                self._featurize,
-                np.array_split(mols, len(client.direct_view())), block=False)
-            features = call.get()
-            features = np.concatenate(features)
-
-            # get output from engines
-            call.display_outputs()
-
-        else:
-            features = self._featurize(mols)
-
-        return np.asarray(features)
-
-    def _featurize(self, mols):
+        return self.engine.get_descriptors([mol])[0]
+
+    def _featurize_batch(self, mols):
         """
-        Calculate Dragon descriptors.
+        Calculate Dragon descriptors for a batch of molecules with a single
+        dragon6shell call. Molecules that Dragon skips are masked.
 
         Parameters
         ----------
         mols : array_like
             Molecules.
         """
-        return self.engine.get_descriptors(mols)
+        if not len(mols):
+            return self._assemble(mols, [])
+        return self._assemble(mols, list(self.engine.get_descriptors(mols)))
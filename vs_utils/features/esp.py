@@ -53,8 +53,35 @@ class ESP(Featurizer):
         self.resolution = float(resolution)
         self.nb_cutoff = float(nb_cutoff)
         self.ionic_strength = float(ionic_strength)
+        self.ionize = ionize
+        self.pH = pH
+        self.align = align
         self.preparator = MolPreparator(ionize, pH, align, add_hydrogens=True)
 
+    def _featurize_batch(self, mols):
+        """
+        Calculate electrostatic potential grids for a batch of molecules.
+
+        Molecules are prepared (and ionized with a single obabel process)
+        as a batch before calculating ESP for each molecule. Prepared
+        molecules are memoized for the duration of the batch, unless the
+        preparator is already memoized (e.g. by a FeaturizerPipeline).
+
+        Parameters
+        ----------
+        mols : list
+            Molecules.
+        """
+        memoized = self.preparator.memoized
+        if not memoized:
+            self.preparator.memoize(True)
+        try:
+            self.preparator.prepare_many(mols, copy=False)
+            return super(ESP, self)._featurize_batch(mols)
+        finally:
+            if not memoized:
+                self.preparator.memoize(False)
+
     def _featurize(self, mol):
         """
         Calculate electrostatic potential grid.
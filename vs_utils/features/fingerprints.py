@@ -6,10 +6,14 @@ __author__ = "Steven Kearnes"
 __copyright__ = "Copyright 2014, Stanford University"
 __license__ = "BSD 3-clause"
 
+import collections
+import numpy as np
+
 from rdkit import Chem
 from rdkit.Chem import rdMolDescriptors
 
 from vs_utils.features import Featurizer
+from vs_utils.utils.array_utils import SparseFeatures
 
 
 class CircularFingerprint(Featurizer):
@@ -30,11 +34,18 @@ class CircularFingerprint(Featurizer):
         Whether to use feature information instead of atom information; see
         RDKit docs for more info.
     sparse : bool, optional (default False)
-        Whether to return a dict for each molecule containing the sparse
-        fingerprint.
+        Whether to calculate sparse (unfolded) count fingerprints. Sparse
+        fingerprints are returned as SparseFeatures, with a CSR matrix of
+        fragment counts and a vocabulary mapping fragment IDs to columns
+        (shared by all molecules). Molecules that fail featurization get
+        empty rows. Otherwise, fingerprints are returned as uint8 arrays
+        (see also the dtype argument to featurize, which can be used to
+        pack fingerprint bits).
     smiles : bool, optional (default False)
         Whether to calculate SMILES strings for fragment IDs (only applicable
-        when calculating sparse fingerprints).
+        when calculating sparse fingerprints). SMILES are stored as the
+        vocabulary labels and are generated once for each unique fragment
+        ID in a batch of molecules.
     """
     name = 'circular'
 
@@ -58,25 +69,210 @@ class CircularFingerprint(Featurizer):
             Molecule.
         """
         if self.sparse:
+            return self._sparse_fingerprints([mol])
+        fp = np.zeros(self.size, dtype=np.uint8)
+        self._set_bits(mol, fp)
+        return fp
+
+    def _sparse_fingerprints(self, mols):
+        """
+        Calculate sparse count fingerprints for a batch of molecules.
+
+        Fragment SMILES are generated once for each unique fragment ID,
+        using the first atom environment where the fragment occurs.
+
+        Parameters
+        ----------
+        mols : list
+            Molecules.
+        """
+        rows, fragment_ids, counts = [], [], []
+        smiles = {} if self.smiles else None
+        for i, mol in enumerate(mols):
             info = {}
             fp = rdMolDescriptors.GetMorganFingerprint(
                 mol, self.radius, useChirality=self.chiral,
                 useBondTypes=self.bonds, useFeatures=self.features,
                 bitInfo=info)
             fp = fp.GetNonzeroElements()  # convert to a dict
+            rows.extend([i] * len(fp))
+            fragment_ids.extend(fp.keys())
+            counts.extend(fp.values())
 
-            # generate SMILES for fragments
-            if self.smiles:
-                fp_smiles = {}
-                for fragment_id, count in fp.items():
-                    root, radius = info[fragment_id][0]
-                    env = Chem.FindAtomEnvironmentOfRadiusN(mol, radius, root)
-                    frag = Chem.PathToSubmol(mol, env)
-                    smiles = Chem.MolToSmiles(frag)
-                    fp_smiles[fragment_id] = {'smiles': smiles, 'count': count}
-                fp = fp_smiles
-        else:
-            fp = rdMolDescriptors.GetMorganFingerprintAsBitVect(
-                mol, self.radius, nBits=self.size, useChirality=self.chiral,
-                useBondTypes=self.bonds, useFeatures=self.features)
-        return fp
+            # generate SMILES for new fragments
+            if smiles is not None:
+                for fragment_id in fp:
+                    if fragment_id not in smiles:
+                        root, radius = info[fragment_id][0]
+                        smiles[fragment_id] = self.get_fragment_smiles(
+                            mol, root, radius)
+        return SparseFeatures.from_coo(rows, fragment_ids, counts, len(mols),
+                                       smiles)
+
+    @staticmethod
+    def get_fragment_smiles(mol, root, radius):
+        """
+        Get SMILES for the atom environment of a fragment.
+
+        Parameters
+        ----------
+        mol : RDKit Mol
+            Molecule.
+        root : int
+            Index of the central atom.
+        radius : int
+            Environment radius.
+        """
+        env = Chem.FindAtomEnvironmentOfRadiusN(mol, radius, root)
+        frag = Chem.PathToSubmol(mol, env)
+        return Chem.MolToSmiles(frag)
+
+    def _set_bits(self, mol, fp):
+        """
+        Set fingerprint bits in a preallocated array.
+
+        Parameters
+        ----------
+        mol : RDKit Mol
+            Molecule.
+        fp : ndarray
+            Fingerprint array with length size (initialized to zero).
+        """
+        bv = rdMolDescriptors.GetMorganFingerprintAsBitVect(
+            mol, self.radius, nBits=self.size, useChirality=self.chiral,
+            useBondTypes=self.bonds, useFeatures=self.features)
+        fp[list(bv.GetOnBits())] = 1
+
+    def _featurize_batch(self, mols):
+        """
+        Calculate circular fingerprints for a batch of molecules.
+
+        Dense fingerprints are written directly into a preallocated
+        (n_mols, size) array. Sparse fingerprints are collected into a
+        single SparseFeatures with a shared fragment vocabulary.
+
+        Parameters
+        ----------
+        mols : list
+            Molecules.
+        """
+        if self.sparse:
+            return self._sparse_fingerprints(mols)
+        features = np.zeros((len(mols), self.size), dtype=np.uint8)
+        for i, mol in enumerate(mols):
+            self._set_bits(mol, features[i])
+        return features
+
+    def featurize_folded(self, mols, combinations):
+        """
+        Calculate dense fingerprints for several (radius, size) combinations
+        in one pass.
+
+        Unfolded Morgan environment IDs are calculated once per molecule,
+        for the largest requested radius, and tagged with the radius of the
+        smallest environment that generates each ID. Fingerprints for each
+        combination are then derived by selecting the IDs for the radius
+        and folding them (ID modulo size, as in RDKit bit vector
+        fingerprints) into a preallocated uint8 matrix. The radius and size
+        attributes of this featurizer are not used.
+
+        Parameters
+        ----------
+        mols : iterable
+            Molecules.
+        combinations : list
+            (radius, size) tuples.
+
+        Returns
+        -------
+        An OrderedDict mapping (radius, size) tuples to feature matrices
+        with shape (n_mols, size).
+        """
+        combinations = [(int(radius), int(size))
+                        for radius, size in combinations]
+        max_radius = max([radius for radius, _ in combinations])
+        rows, fragment_ids, fragment_radii = [], [], []
+        n_mols = 0
+        for i, mol in enumerate(mols):
+            mol_ids, mol_radii = self.get_fragment_radii(mol, max_radius)
+            rows.append(np.repeat(i, len(mol_ids)))
+            fragment_ids.append(mol_ids)
+            fragment_radii.append(mol_radii)
+            n_mols += 1
+        rows = np.concatenate(rows + [np.zeros(0, dtype=int)])
+        fragment_ids = np.concatenate(
+            fragment_ids + [np.zeros(0, dtype=np.int64)])
+        fragment_radii = np.concatenate(
+            fragment_radii + [np.zeros(0, dtype=int)])
+
+        # fold IDs for each combination
+        features = collections.OrderedDict()
+        for radius, size in combinations:
+            mask = fragment_radii <= radius
+            x = np.zeros((n_mols, size), dtype=np.uint8)
+            x[rows[mask], fragment_ids[mask] % size] = 1
+            features[(radius, size)] = x
+        return features
+
+    def get_fragment_radii(self, mol, radius):
+        """
+        Get unfolded Morgan environment IDs and the radius of the smallest
+        environment that generates each ID.
+
+        Parameters
+        ----------
+        mol : RDKit Mol
+            Molecule.
+        radius : int
+            Maximum radius.
+
+        Returns
+        -------
+        fragment_ids : ndarray
+            Environment IDs.
+        radii : ndarray
+            Radius for each ID.
+        """
+        info = {}
+        rdMolDescriptors.GetMorganFingerprint(
+            mol, radius, useChirality=self.chiral, useBondTypes=self.bonds,
+            useFeatures=self.features, bitInfo=info)
+        fragment_ids = np.fromiter(info.keys(), dtype=np.int64,
+                                   count=len(info))
+        radii = np.fromiter(
+            (min([env[1] for env in envs]) for envs in info.values()),
+            dtype=int, count=len(info))
+        return fragment_ids, radii
+
+    def _assemble(self, mols, features):
+        """
+        Construct a feature matrix from per-molecule features. Sparse
+        fingerprints for failed molecules (None) are empty.
+
+        Parameters
+        ----------
+        mols : iterable
+            Molecules.
+        features : list
+            Features calculated for each molecule.
+        """
+        if not self.sparse:
+            return super(CircularFingerprint, self)._assemble(mols, features)
+        empty = SparseFeatures.from_coo([], [], [], 1)
+        return SparseFeatures.concatenate(
+            [empty if x is None else x for x in features] or
+            [SparseFeatures.from_coo([], [], [], 0)])
+
+    def _merge_blocks(self, blocks):
+        """
+        Concatenate feature matrices calculated for consecutive chunks of
+        molecules, merging sparse fingerprint vocabularies.
+
+        Parameters
+        ----------
+        blocks : list
+            Feature matrices.
+        """
+        if self.sparse:
+            return SparseFeatures.concatenate(blocks)
+        return super(CircularFingerprint, self)._merge_blocks(blocks)
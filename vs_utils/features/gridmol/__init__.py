@@ -6,8 +6,57 @@ __author__ = "Steven Kearnes"
 __copyright__ = "Copyright 2014, Stanford University"
 __license__ = "3-clause BSD"
 
+import collections
 import numpy as np
 
+# maximum number of cached coordinate lattices (an 81^3 lattice takes about
+# 13 MB)
+LATTICE_CACHE_SIZE = 4
+
+# read-only coordinate lattices keyed by (kind, shape, spacing, center), in
+# order of use
+_lattice_cache = collections.OrderedDict()
+
+
+def get_cached_lattice(kind, shape, spacing, center, build):
+    """
+    Get a read-only coordinate lattice from the module-level cache, building
+    it if necessary.
+
+    Parameters
+    ----------
+    kind : str
+        Lattice type (e.g. 'axes' or 'all').
+    shape : tuple
+        Number of grid points in each dimension.
+    spacing : float
+        Space between grid points.
+    center : array_like
+        Grid center.
+    build : callable
+        Function that builds the lattice (an ndarray or a tuple of ndarrays)
+        if it is not cached.
+    """
+    key = (kind, tuple(shape), float(spacing),
+           tuple(np.asarray(center, dtype=float).tolist()))
+    try:
+        lattice = _lattice_cache.pop(key)
+    except KeyError:
+        lattice = build()
+        for array in (lattice if isinstance(lattice, tuple) else [lattice]):
+            array.flags.writeable = False
+    _lattice_cache[key] = lattice  # mark as most recently used
+    while len(_lattice_cache) > LATTICE_CACHE_SIZE:
+        _lattice_cache.popitem(last=False)
+    return lattice
+
+
+def clear_lattice_cache():
+    """
+    Remove all cached coordinate lattices.
+    """
+    _lattice_cache.clear()
+
 
 class Grid(object):
     """
@@ -111,27 +160,51 @@ class Grid(object):
         coords += self.center  # move to real-space center
         return coords
 
+    def get_axis_coords(self):
+        """
+        Get real-space coordinates of the grid points along each axis.
+
+        Coordinates are calculated as in get_coords, so the coordinates of
+        grid point (i, j, k) are (x[i], y[j], z[k]). Use these vectors for
+        separable or broadcast calculations that do not need the full
+        coordinate lattice.
+
+        Returns
+        -------
+        A tuple of read-only 1D arrays (shared between grids with the same
+        shape, spacing, and center).
+        """
+        def build():
+            grid_center = (np.asarray(self.shape) - 1) / 2. * self.spacing
+            axes = []
+            for i in xrange(self.ndim):
+                coords = np.arange(self.shape[i], dtype=float) * self.spacing
+                coords -= grid_center[i]
+                coords += self.center[i]
+                axes.append(coords)
+            return tuple(axes)
+        return get_cached_lattice('axes', self.shape, self.spacing,
+                                  self.center, build)
+
     def get_all_coords(self):
         """
         Get real-space coordinates for all grid points.
-        """
 
-        # construct an array whose entries correspond to each index of the grid
-        # e.g. grid_points[1, 2, 3] -> [1, 2, 3]
-        grid_points = np.zeros((self.grid.shape + (self.grid.ndim,)),
-                               dtype=int)
-        for i, indices in enumerate(np.indices(grid_points.shape[:-1])):
-            grid_points[..., i] = indices
-
-        # reshape so grid_points is 2D and each row is a grid point
-        grid_points = grid_points.reshape((self.size, self.ndim))
-
-        # get real-space coordinates for all grid points
-        # reshape to match shape of the grid
-        # e.g. coords[1, 2, 3] -> self.get_coords([1, 2, 3])
-        coords = self.get_coords(grid_points).reshape(
-            (self.grid.shape + (self.grid.ndim,)))
-        return coords
+        Returns
+        -------
+        A read-only array with shape self.shape + (self.ndim,), where
+        coords[1, 2, 3] == self.get_coords([1, 2, 3]). The array is shared
+        between grids with the same shape, spacing, and center.
+        """
+        def build():
+            coords = np.zeros(self.shape + (self.ndim,), dtype=float)
+            for i, axis_coords in enumerate(self.get_axis_coords()):
+                view = [np.newaxis] * self.ndim
+                view[i] = slice(None)
+                coords[..., i] = axis_coords[tuple(view)]
+            return coords
+        return get_cached_lattice('all', self.shape, self.spacing,
+                                  self.center, build)
 
     def get_grid_point(self, coords):
         """
@@ -5,6 +5,10 @@ The ideas expressed in this code take some inspiration from Tom Goddard. See
 http://www.cgl.ucsf.edu/chimera/data/surface-oct2013/surface.html. I was also
 referred to some of the UCSF Chimera code, specifically
 libs/_gaussian/gaussian.cpp and libs/Surface/gridsurf.py.
+
+GridMol and GridAtom describe a single conformer with one object per atom.
+The module-level functions work on coordinate arrays instead, so shape
+grids for many conformers of a molecule can be calculated at once.
 """
 
 __author__ = "Steven Kearnes"
@@ -12,10 +16,17 @@ __copyright__ = "Copyright 2014, Stanford University"
 __license__ = "3-clause BSD"
 
 import numpy as np
-from scipy.spatial.distance import cdist
 
 from . import Grid
 
+# maximum number of (conformer, atom, grid point) distances calculated at
+# once by get_occupancy_grids
+MAX_BLOCK_SIZE = 2 ** 22
+
+# number of grid points along each axis in the blocks used to skip distant
+# atoms in get_distance_grids
+DISTANCE_BLOCK_WIDTH = 4
+
 
 class GridMol(Grid):
     """
@@ -64,14 +75,29 @@ class GridMol(Grid):
         self.atoms.append(atom)
         return atom
 
+    def get_atom_arrays(self):
+        """
+        Get atom centers and radii as arrays.
+
+        Returns
+        -------
+        centers : ndarray
+            Atom centers with shape (n_atoms, ndim).
+        radii : ndarray
+            Atomic radii.
+        """
+        centers = np.asarray([atom.center for atom in self.atoms],
+                             dtype=float).reshape((-1, self.ndim))
+        radii = np.asarray([atom.radius for atom in self.atoms], dtype=float)
+        return centers, radii
+
     def get_occupancy(self):
         """
         Get a boolean grid with set bits corresponding to points inside the
         molecule.
         """
-        grid = np.sum([atom.get_grid_mask() for atom in self.atoms], axis=0)
-        grid = np.asarray(grid, dtype=bool)
-        return grid
+        centers, radii = self.get_atom_arrays()
+        return get_occupancy_grids(self, centers, radii, self.probe_radius)
 
     def get_distance(self):
         """
@@ -85,38 +111,8 @@ class GridMol(Grid):
         This definition assigns negative values to points within the molecule.
         """
         assert self.get_num_atoms()
-        coords = self.get_all_coords().reshape((self.size, self.ndim))
-        centers = np.asarray([atom.center for atom in self.atoms], dtype=float)
-        radii = np.asarray([atom.radius for atom in self.atoms], dtype=float)
-
-        # get pairwise distances between all grid points and atomic centers
-        # distances has shape (coords.shape[0], centers.shape[0])
-        distances = cdist(coords, centers)
-
-        # correct for atomic radii
-        # the atomic radii have the probe radius added to get the radius
-        # to the ``accessible'' surface
-        distances -= (radii + self.probe_radius)
-
-        # get minimum distance to molecular surface
-        # prefer negative distances to preserve correspondence with occupancy
-        # note that we can't just multiply occupied points by -1, because
-        # distances are calculated relative to atomic surfaces, which may lie
-        # within the molecular surface
-        best_distances = np.zeros(distances.shape[0], dtype=float)
-        for i in xrange(distances.shape[0]):
-            if np.any(distances[i] < 0):
-                best_distances[i] = -1 * np.amin(
-                    np.fabs(distances[i][distances[i] < 0]))
-            else:
-                best_distances[i] = np.amin(distances[i])
-        return best_distances.reshape(self.shape)
-
-        # take the minimum absolute distance while preserving sign
-        min_abs = np.argmin(np.fabs(distances), axis=1)
-        distances = distances[np.arange(distances.shape[0]), min_abs]
-        distances = distances.reshape(self.shape)
-        return distances
+        centers, radii = self.get_atom_arrays()
+        return get_distance_grids(self, centers, radii, self.probe_radius)
 
 
 class GridAtom(object):
@@ -173,25 +169,395 @@ class GridAtom(object):
         probe_radius : float, optional (default 0.)
             Probe radius for determining solvent-accessible surface.
         """
-        try:
-            assert grid.coords_in_grid(center)
-            center = np.asarray(center, dtype=float)
-            for i in xrange(grid.ndim):
-                delta = np.zeros_like(center)
-                delta[i] = radius + probe_radius
-                assert grid.coords_in_grid(center + delta)
-                assert grid.coords_in_grid(center - delta)
-            return True
-        except AssertionError:
-            return False
+        return bool(atoms_in_grid(grid, center, radius, probe_radius))
 
     def get_grid_mask(self):
         """
         Get a boolean mask for grid points inside this atom.
         """
-        coords = self.parent.get_all_coords().reshape(
-            (self.parent.size, self.parent.ndim))
-        distance = cdist(coords, np.atleast_2d(self.center))
-        distance = distance.reshape(self.parent.shape)
-        mask = distance <= (self.radius + self.parent.probe_radius)
+        mask = np.zeros(self.parent.shape, dtype=bool)
+        index, local_mask = self.get_local_mask()
+        mask[index] = local_mask
         return mask
+
+    def get_local_mask(self):
+        """
+        Get a boolean mask for grid points inside this atom, restricted to
+        the block of grid points within the bounding box of the atom (plus
+        the probe radius).
+
+        Returns
+        -------
+        index : tuple
+            Slices giving the location of the block in the parent grid.
+        mask : ndarray
+            Boolean mask for the block.
+        """
+        index = self.get_local_index()
+        mask = self.get_surface_distance(index) <= 0
+        return index, mask
+
+    def get_local_index(self):
+        """
+        Get slices for the block of grid points within the bounding box of
+        this atom (plus the probe radius).
+        """
+        low, high = get_bounding_box(self.parent, self.center,
+                                     self.radius + self.parent.probe_radius)
+        return tuple([slice(i, j + 1) for i, j in zip(low, high)])
+
+    def get_surface_distance(self, index=None):
+        """
+        Get the distance from grid points to the surface of this atom (plus
+        the probe radius). Points inside the atom have negative values.
+
+        Parameters
+        ----------
+        index : tuple, optional
+            Slices selecting a block of the parent grid. Defaults to the
+            whole grid.
+        """
+        return get_surface_distance(self.parent, self.center,
+                                    self.radius + self.parent.probe_radius,
+                                    index)
+
+
+def get_grid_index(grid, coords):
+    """
+    Get (unrounded) grid indices for real-space coordinates. This is the
+    inverse of Grid.get_coords.
+
+    Parameters
+    ----------
+    grid : Grid
+        Grid.
+    coords : array_like
+        Real-space coordinates with shape (..., ndim).
+    """
+    grid_center = (np.asarray(grid.shape) - 1) / 2. * grid.spacing
+    return (np.asarray(coords, dtype=float) - grid.center +
+            grid_center) / grid.spacing
+
+
+def atoms_in_grid(grid, centers, radii, probe_radius=0.):
+    """
+    Check whether atoms (plus the probe radius) fit in a grid.
+
+    An atom fits if the grid points closest to its center plus or minus
+    its radius along each axis are all in the grid.
+
+    Parameters
+    ----------
+    grid : Grid
+        Grid.
+    centers : array_like
+        Atom centers with shape (..., ndim), e.g. (n_confs, n_atoms, 3).
+    radii : array_like
+        Atomic radii, broadcastable to centers.shape[:-1].
+    probe_radius : float, optional (default 0.)
+        Probe radius for determining solvent-accessible surface.
+
+    Returns
+    -------
+    A boolean array with shape centers.shape[:-1].
+    """
+    index = get_grid_index(grid, centers)
+    radii = (np.asarray(radii, dtype=float) + probe_radius) / grid.spacing
+    radii = radii[..., np.newaxis]
+    low = np.rint(index - radii)
+    high = np.rint(index + radii)
+    return np.all((low >= 0) & (high <= np.asarray(grid.shape) - 1),
+                  axis=-1)
+
+
+def get_bounding_box(grid, center, radius):
+    """
+    Get the range of grid points within the bounding box of a sphere,
+    clipped to the grid.
+
+    Parameters
+    ----------
+    grid : Grid
+        Grid.
+    center : array_like
+        Sphere center(s), with shape (..., ndim).
+    radius : float or array_like
+        Sphere radius (or radii, broadcastable to center.shape[:-1]).
+
+    Returns
+    -------
+    low, high : ndarray
+        Indices of the first and last grid points along each axis. The box
+        is padded by one grid point on each side so points on the surface
+        are not lost to rounding.
+    """
+    index = get_grid_index(grid, center)
+    radius = np.asarray(radius, dtype=float)[..., np.newaxis] / grid.spacing
+    max_index = np.asarray(grid.shape) - 1
+    low = np.clip(np.floor(index - radius) - 1, 0, max_index).astype(int)
+    high = np.clip(np.ceil(index + radius) + 1, 0, max_index).astype(int)
+    return low, high
+
+
+def get_surface_distance(grid, center, radius, index=None):
+    """
+    Get the distance from grid points to the surface of a sphere. Points
+    inside the sphere have negative values.
+
+    Distances are calculated from per-axis offsets (see
+    Grid.get_axis_coords) broadcast over the grid, so the (n_points, ndim)
+    coordinate array is never built. The operations match Grid.get_coords
+    and cdist, so points on the surface are classified identically.
+
+    Parameters
+    ----------
+    grid : Grid
+        Grid.
+    center : array_like
+        Sphere center.
+    radius : float
+        Sphere radius.
+    index : tuple, optional
+        Slices selecting a block of the grid. Defaults to the whole grid.
+    """
+    if index is None:
+        index = tuple([slice(0, n) for n in grid.shape])
+    center = np.asarray(center, dtype=float)
+    distance = 0.
+    for i, coords in enumerate(grid.get_axis_coords()):
+        delta = coords[index[i]] - center[i]
+        view = [np.newaxis] * grid.ndim
+        view[i] = slice(None)
+        distance = distance + (delta * delta)[tuple(view)]
+    distance = np.sqrt(distance)
+    distance -= radius
+    return distance
+
+
+def _check_atoms(grid, coords, radii, probe_radius):
+    """
+    Check atom arrays and make sure all atoms fit in a grid.
+
+    Parameters
+    ----------
+    grid : Grid
+        Grid.
+    coords : array_like
+        Atom centers with shape (..., n_atoms, ndim).
+    radii : array_like
+        Atomic radius for each atom.
+    probe_radius : float
+        Probe radius for determining solvent-accessible surface.
+
+    Returns
+    -------
+    coords : ndarray
+        Atom centers with shape (n_confs, n_atoms, ndim).
+    radii : ndarray
+        Atomic radii plus the probe radius.
+    """
+    coords = np.asarray(coords, dtype=float)
+    coords = coords.reshape((int(np.prod(coords.shape[:-2])),) +
+                            coords.shape[-2:])
+    radii = np.asarray(radii, dtype=float) + probe_radius
+    if radii.shape != coords.shape[1:2] or coords.shape[2] != grid.ndim:
+        raise ValueError('Atom coordinates and radii do not match.')
+    if not np.all(atoms_in_grid(grid, coords, radii)):
+        raise ValueError('Atom does not fit in the grid.')
+    return coords, radii
+
+
+def get_occupancy_grids(grid, coords, radii, probe_radius=1.4):
+    """
+    Get boolean grids with set bits corresponding to points inside a
+    molecule, for one or more conformers.
+
+    Every atom is evaluated on a block of grid points with the same size
+    (large enough for the largest atom), positioned at the bounding box of
+    the atom, so all conformers and atoms are processed in one vectorized
+    pass. The result is identical to GridMol.get_occupancy.
+
+    Parameters
+    ----------
+    grid : Grid
+        Grid (only its shape, center, and spacing are used).
+    coords : array_like
+        Atom centers with shape (n_confs, n_atoms, ndim), or
+        (n_atoms, ndim) for a single conformer.
+    radii : array_like
+        Atomic radius for each atom.
+    probe_radius : float, optional (default 1.4)
+        Probe radius for determining solvent-accessible surface.
+
+    Returns
+    -------
+    A boolean array with shape (n_confs,) + grid.shape (or grid.shape for
+    a single conformer).
+    """
+    leading = np.shape(coords)[:-2]
+    coords, radii = _check_atoms(grid, coords, radii, probe_radius)
+    n_confs, n_atoms, ndim = coords.shape
+    grid_size = int(np.prod(grid.shape))
+    occupancy = np.zeros(n_confs * grid_size, dtype=bool)
+    if not n_atoms:
+        return occupancy.reshape(leading + tuple(grid.shape))
+
+    # block of grid points evaluated for each atom
+    width = int(np.ceil(2 * radii.max() / grid.spacing)) + 4
+    low, _ = get_bounding_box(grid, coords, radii)
+    offsets = np.arange(width)
+    block_shape = (slice(None), slice(None)) + (np.newaxis,) * ndim
+    step = max(1, MAX_BLOCK_SIZE // (n_atoms * width ** ndim))
+    for start in xrange(0, n_confs, step):
+        block_low = low[start:start + step]
+        block_coords = coords[start:start + step]
+        distance = 0.
+        flat_index = np.arange(start, start + len(block_low))
+        flat_index = flat_index[:, np.newaxis][block_shape]
+        for i, axis_coords in enumerate(grid.get_axis_coords()):
+            index = block_low[..., i, np.newaxis] + offsets
+            delta = axis_coords[np.minimum(index, grid.shape[i] - 1)]
+            delta -= block_coords[..., i, np.newaxis]
+            delta[index >= grid.shape[i]] = np.inf  # outside the grid
+            view = [slice(None), slice(None)] + [np.newaxis] * ndim
+            view[2 + i] = slice(None)
+            distance = distance + (delta * delta)[tuple(view)]
+            flat_index = flat_index * grid.shape[i] + index[tuple(view)]
+        mask = np.sqrt(distance) <= radii[np.newaxis][block_shape]
+        occupancy[flat_index[mask]] = True
+    return occupancy.reshape(leading + tuple(grid.shape))
+
+
+def get_distance_grids(grid, coords, radii, probe_radius=1.4):
+    """
+    Get distances to the molecular surface for one or more conformers.
+
+    The distance to the molecular surface is the difference between the
+    distance to the atom center and the radius of the atom (plus the probe
+    radius). The chosen value for each grid point is the minimum absolute
+    distance calculated with respect to any atom, preferring negative
+    distances (points inside the molecule).
+
+    Each atom only visits part of the grid. Negative distances are
+    calculated within the bounding box of each atom. For positive
+    distances, the grid is split into blocks of DISTANCE_BLOCK_WIDTH points
+    along each axis, and each atom only visits the blocks where its surface
+    can be the closest: a block is skipped for an atom if its smallest
+    distance to the block is larger than the largest distance from the
+    block to the surface of another atom (or if the whole block is inside
+    the molecule). Distances are calculated in the same way as
+    get_surface_distance, so skipping atoms does not change the result.
+
+    Parameters
+    ----------
+    grid : Grid
+        Grid (only its shape, center, and spacing are used).
+    coords : array_like
+        Atom centers with shape (n_confs, n_atoms, ndim), or
+        (n_atoms, ndim) for a single conformer.
+    radii : array_like
+        Atomic radius for each atom.
+    probe_radius : float, optional (default 1.4)
+        Probe radius for determining solvent-accessible surface.
+
+    Returns
+    -------
+    A float array with shape (n_confs,) + grid.shape (or grid.shape for a
+    single conformer).
+    """
+    leading = np.shape(coords)[:-2]
+    coords, radii = _check_atoms(grid, coords, radii, probe_radius)
+    ndim = grid.ndim
+    rval = np.empty((len(coords),) + tuple(grid.shape), dtype=float)
+    if not len(radii):
+        rval.fill(np.inf)
+        return rval.reshape(leading + tuple(grid.shape))
+
+    # pad the grid to a whole number of blocks along each axis
+    # axis_blocks[i] contains coordinates along axis i for each block
+    width = DISTANCE_BLOCK_WIDTH
+    n_blocks = [(n + width - 1) // width for n in grid.shape]
+    axis_blocks = []
+    for axis_coords, n in zip(grid.get_axis_coords(), n_blocks):
+        extra = axis_coords[-1] + grid.spacing * np.arange(
+            1, n * width - len(axis_coords) + 1)
+        axis_blocks.append(
+            np.concatenate((axis_coords, extra)).reshape((n, width)))
+    block_index = np.indices(n_blocks).reshape((ndim, -1)).T
+    padded_shape = [n * width for n in n_blocks]
+    real = tuple([slice(0, n) for n in grid.shape])
+    padded_inside = np.empty(padded_shape, dtype=float)
+    inside = padded_inside[real]
+
+    # positive distances are stored block by block, with shape
+    # (n_blocks, width, width, ...)
+    best = np.empty((len(block_index),) + (width,) * ndim, dtype=float)
+    split_shape = []
+    for n in n_blocks:
+        split_shape.extend([n, width])
+    to_blocks = range(0, 2 * ndim, 2) + range(1, 2 * ndim, 2)
+    from_blocks = list(np.argsort(to_blocks))
+    for conf_best, centers in zip(rval, coords):
+
+        # prefer negative distances to preserve correspondence with
+        # occupancy
+        # note that we can't just multiply occupied points by -1, because
+        # distances are calculated relative to atomic surfaces, which may lie
+        # within the molecular surface
+        best.fill(np.inf)
+        padded_inside.fill(0.)  # padding counts as inside
+        inside.fill(-np.inf)  # negative distance closest to zero
+
+        # negative distances only occur within the atom bounding box
+        box_low, box_high = get_bounding_box(grid, centers, radii)
+        for center, radius, i, j in zip(centers, radii, box_low, box_high):
+            index = tuple([slice(a, b + 1) for a, b in zip(i, j)])
+            local = get_surface_distance(grid, center, radius, index)
+            inside[index] = np.maximum(
+                inside[index], np.where(local < 0, local, -np.inf))
+
+        # bounds on the distance from each block to each atomic surface,
+        # with shape (n_blocks, n_atoms), from per-axis squared distances
+        # to the nearest and farthest points of each block
+        nearest = 0.
+        farthest = 0.
+        for i in xrange(ndim):
+            delta_low = axis_blocks[i][:, :1] - centers[:, i]
+            delta_high = centers[:, i] - axis_blocks[i][:, -1:]
+            near = np.maximum(np.maximum(delta_low, delta_high), 0)
+            far = np.maximum(np.fabs(delta_low), np.fabs(delta_high))
+            view = [np.newaxis] * ndim + [slice(None)]
+            view[i] = slice(None)
+            nearest = nearest + (near * near)[tuple(view)]
+            farthest = farthest + (far * far)[tuple(view)]
+        lower = np.sqrt(nearest.reshape((len(block_index), -1))) - radii
+        upper = np.sqrt(farthest.reshape((len(block_index), -1))) - radii
+        candidates = lower <= upper.min(axis=1)[:, np.newaxis] + 1e-6
+
+        # skip blocks where every point is inside the molecule
+        filled = np.isfinite(padded_inside).reshape(split_shape)
+        filled = filled.transpose(to_blocks).reshape((len(block_index), -1))
+        candidates &= ~filled.all(axis=1)[:, np.newaxis]
+
+        # distances for each atom on its candidate blocks
+        # operations match get_surface_distance
+        for atom in xrange(len(centers)):
+            selected = np.flatnonzero(candidates[:, atom])
+            if not len(selected):
+                continue
+            index = block_index[selected]
+            distance = 0.
+            for i in xrange(ndim):
+                delta = axis_blocks[i][index[:, i]] - centers[atom, i]
+                view = [slice(None)] + [np.newaxis] * ndim
+                view[1 + i] = slice(None)
+                distance = distance + (delta * delta)[tuple(view)]
+            distance = np.sqrt(distance)
+            distance -= radii[atom]
+            best[selected] = np.minimum(best[selected], distance)
+        padded = best.reshape(n_blocks + [width] * ndim)
+        padded = padded.transpose(from_blocks).reshape(padded_shape)
+        conf_best[...] = padded[real]
+        finite = np.isfinite(inside)
+        conf_best[finite] = inside[finite]
+    return rval.reshape(leading + tuple(grid.shape))
@@ -45,6 +45,38 @@ class TestGrid(unittest.TestCase):
         coords = self.grid.get_all_coords()
         assert np.array_equal(coords.shape,
                               (self.grid.shape + (self.grid.ndim,)))
+        assert np.array_equal(coords[1, 2, 3],
+                              self.grid.get_coords((1, 2, 3)))
+
+        # lattices are cached and read-only
+        other = Grid((11, 11, 11))
+        assert other.get_all_coords() is coords
+        assert not coords.flags.writeable
+        assert Grid((11, 11, 11), spacing=0.5).get_all_coords() is not coords
+
+    def test_get_all_coords_shape(self):
+        """
+        Test Grid.get_all_coords with a different number of points in each
+        dimension.
+        """
+        self.grid = Grid((3, 4, 5), center=(1, 2, 3), spacing=0.5)
+        coords = self.grid.get_all_coords()
+        assert coords.shape == (3, 4, 5, 3)
+        assert np.array_equal(coords[2, 3, 4], [1.5, 2.75, 4])
+
+    def test_get_axis_coords(self):
+        """
+        Test Grid.get_axis_coords.
+        """
+        self.grid = Grid((3, 4, 5), center=(1, 2, 3), spacing=0.5)
+        x, y, z = self.grid.get_axis_coords()
+        assert np.array_equal(x, [0.5, 1, 1.5])
+        assert np.array_equal(y, [1.25, 1.75, 2.25, 2.75])
+        assert np.array_equal(z, [2, 2.5, 3, 3.5, 4])
+        assert not x.flags.writeable
+        coords = self.grid.get_all_coords()
+        assert np.array_equal(coords[..., 0], np.broadcast_to(
+            x[:, np.newaxis, np.newaxis], self.grid.shape))
 
     def test_get_grid_point(self):
         """
@@ -2,9 +2,13 @@
 Tests for molecule.py.
 """
 import numpy as np
+from scipy.spatial.distance import cdist
 import unittest
 
-from ..molecule import GridAtom, GridMol
+from .. import Grid
+from ..molecule import (atoms_in_grid, get_distance_grids,
+                        get_occupancy_grids, get_surface_distance, GridAtom,
+                        GridMol)
 
 
 class TestGridMol(unittest.TestCase):
@@ -67,6 +71,31 @@ class TestGridMol(unittest.TestCase):
         assert np.count_nonzero(np.fabs(distances) < threshold) > (
             0.9 * distances.size)
 
+    def test_get_distance_reference(self):
+        """
+        Compare GridMol.get_distance to a per-point reference calculation.
+        """
+        self.mol = GridMol((21, 21, 21), center=(0.1, -0.2, 0.3),
+                           spacing=0.5)
+        self.mol.add_atom((1, 2, 1), 1.6)
+        self.mol.add_atom((1, 1, 1), 1.5)
+        self.mol.add_atom((-1, 0, 0.5), 1.8)
+        distances = self.mol.get_distance()
+
+        # signed minimum distance to any atomic surface for each grid point
+        coords = self.mol.get_all_coords().reshape((self.mol.size, 3))
+        centers = [atom.center for atom in self.mol.atoms]
+        radii = np.asarray([atom.radius for atom in self.mol.atoms])
+        ref = cdist(coords, centers) - (radii + self.mol.probe_radius)
+        for i, row in enumerate(ref):
+            if np.any(row < 0):
+                ref[i, 0] = -np.amin(np.fabs(row[row < 0]))
+            else:
+                ref[i, 0] = np.amin(row)
+        ref = ref[:, 0].reshape(self.mol.shape)
+        assert np.array_equal(distances, ref)
+        assert np.array_equal(distances <= 0, self.mol.get_occupancy())
+
 
 class TestGridAtom(unittest.TestCase):
     """
@@ -101,3 +130,104 @@ class TestGridAtom(unittest.TestCase):
         effective_radius = self.atom.radius + self.mol.probe_radius
         atom_volume = 4/3. * np.pi * effective_radius ** 3
         assert np.fabs(grid_volume - atom_volume) < 10
+
+    def test_get_local_mask(self):
+        """
+        Test GridAtom.get_local_mask.
+        """
+        index, mask = self.atom.get_local_mask()
+        assert mask.size < self.mol.size
+
+        # compare to distances from all grid points
+        coords = self.mol.get_all_coords().reshape((self.mol.size, 3))
+        distance = cdist(coords, np.atleast_2d(self.atom.center))
+        ref = distance.reshape(self.mol.shape) <= (self.atom.radius +
+                                                   self.mol.probe_radius)
+        assert np.array_equal(self.atom.get_grid_mask(), ref)
+        assert np.count_nonzero(mask) == np.count_nonzero(ref)
+        assert np.array_equal(mask, ref[index])
+
+
+class TestConformerGrids(unittest.TestCase):
+    """
+    Tests for batched multi-conformer grids.
+    """
+    def setUp(self):
+        """
+        Set up tests.
+        """
+        self.grid = Grid((21, 21, 21), spacing=0.5)
+        self.coords = np.asarray([[(1, 2, 1), (1, 1, 1), (-1, 0, 0.5)],
+                                  [(0, 0, 0), (0.5, 1, -1), (-1, -1, 1)]],
+                                 dtype=float)
+        self.radii = np.asarray([1.6, 1.5, 1.8])
+
+    def get_grid_mols(self):
+        """
+        Construct a GridMol for each conformer.
+        """
+        mols = []
+        for centers in self.coords:
+            mol = GridMol(self.grid.shape, spacing=self.grid.spacing)
+            for center, radius in zip(centers, self.radii):
+                mol.add_atom(center, radius)
+            mols.append(mol)
+        return mols
+
+    def test_atoms_in_grid(self):
+        """
+        Test atoms_in_grid.
+        """
+        in_grid = atoms_in_grid(self.grid, self.coords, self.radii, 1.4)
+        assert in_grid.shape == (2, 3)
+        assert np.all(in_grid)
+        assert not atoms_in_grid(self.grid, (4, 0, 0), 1.6, 1.4)
+        assert not atoms_in_grid(self.grid, (-4, 0, 0), 1.6, 1.4)
+
+    def test_get_occupancy_grids(self):
+        """
+        Test get_occupancy_grids.
+        """
+        occupancy = get_occupancy_grids(self.grid, self.coords, self.radii)
+        assert occupancy.shape == (2,) + self.grid.shape
+        for grids, mol in zip(occupancy, self.get_grid_mols()):
+            assert np.array_equal(grids, np.any(
+                [atom.get_grid_mask() for atom in mol.atoms], axis=0))
+
+    def test_get_distance_grids(self):
+        """
+        Test get_distance_grids.
+        """
+        distances = get_distance_grids(self.grid, self.coords, self.radii)
+        assert distances.shape == (2,) + self.grid.shape
+        for grids, mol in zip(distances, self.get_grid_mols()):
+            assert np.array_equal(grids, mol.get_distance())
+
+    def test_get_distance_grids_skipped_atoms(self):
+        """
+        Test that atoms skipped for distant blocks of the grid do not
+        change get_distance_grids.
+        """
+        grid = Grid((31, 31, 31), center=(0.2, 0., -0.1), spacing=0.5)
+        rng = np.random.RandomState(0)
+        coords = rng.uniform(-4, 4, (2, 8, 3))
+        radii = rng.uniform(1., 2., 8)
+        distances = get_distance_grids(grid, coords, radii)
+        for conf_distances, centers in zip(distances, coords):
+            ref = np.asarray([
+                get_surface_distance(grid, center, radius + 1.4)
+                for center, radius in zip(centers, radii)])
+            inside = np.where(ref < 0, ref, -np.inf).max(axis=0)
+            ref = np.where(np.isfinite(inside), inside, ref.min(axis=0))
+            assert np.array_equal(conf_distances, ref)
+
+    def test_atom_not_in_grid(self):
+        """
+        Make sure atoms outside the grid are rejected.
+        """
+        self.coords[1, 2] = (4, 0, 0)
+        try:
+            get_occupancy_grids(self.grid, self.coords, self.radii)
+            assert False
+        except ValueError:
+            pass
@@ -6,35 +6,59 @@ __author__ = "Steven Kearnes"
 __copyright__ = "Copyright 2014, Stanford University"
 __license__ = "BSD 3-clause"
 
+import numpy as np
+
 from rdkit.Chem import Draw
+from rdkit.Chem.Draw import rdMolDraw2D
 
 from vs_utils.features import Featurizer
 from vs_utils.utils import image_utils, ob_utils
+from vs_utils.utils.array_utils import pack_bits
 
 
 class MolImage(Featurizer):
     """
     Molecule images.
 
+    With the 'obabel' engine, each batch of molecules is depicted by a
+    single obabel process rather than one process per molecule. With the
+    'rdkit' engine, each batch is drawn in this process on a single
+    rdMolDraw2D canvas (see render). Pixels are written into a
+    preallocated uint8 array.
+
     Parameters
     ----------
     size : int, optional (default 32)
         Size (in any dimension) of generated images.
     flatten : bool, optional (default False)
         Whether to flatten the pixel array. If False, the features for each
-        molecule will be a 3D array.
+        molecule will be a 3D array (or 2D, for grayscale and binary
+        images).
     engine : str, optional (default 'obabel')
         Which engine to use to generate images. Choose from 'obabel' or
         'rdkit'.
+    mode : str, optional (default 'rgb')
+        Pixel format. Choose from:
+        * 'rgb' : RGB pixels with shape (size, size, 3).
+        * 'gray' : grayscale pixels with shape (size, size).
+        * 'binary' : 1-bit pixels (1 for dark pixels, i.e. ink) packed
+          into bytes along the last axis, with shape (size, ceil(size / 8))
+          or (ceil(size * size / 8),) if flatten is True. Use
+          vs_utils.utils.array_utils.unpack_bits to recover the pixels.
     """
     name = 'image'
 
-    def __init__(self, size=32, flatten=False, engine='obabel'):
+    def __init__(self, size=32, flatten=False, engine='obabel', mode='rgb'):
+        if engine not in ['obabel', 'rdkit']:
+            raise NotImplementedError(engine)
+        if mode not in ['rgb', 'gray', 'binary']:
+            raise ValueError("Unrecognized mode '{}'.".format(mode))
         self.size = size
         if not flatten:
             self.topo_view = True
         self.flatten = flatten
         self.engine = engine
+        self.mode = mode
 
     def _featurize(self, mol):
         """
@@ -45,15 +69,109 @@ class MolImage(Featurizer):
         mol : RDKit Mol
             Molecule.
         """
-        dim = (self.size, self.size)
+        return self._featurize_batch([mol])[0]
+
+    def _featurize_batch(self, mols):
+        """
+        Generate 2D depictions for a batch of molecules.
+
+        Parameters
+        ----------
+        mols : list
+            Molecules.
+        """
+        features = np.zeros((len(mols),) + self.get_shape(), dtype=np.uint8)
+        for i, image in enumerate(self.render(mols)):
+            features[i] = self.get_pixels(image)
+        return features
+
+    def get_shape(self):
+        """
+        Get the shape of the features for each molecule.
+        """
+        shape = (self.size, self.size)
+        if self.mode == 'rgb':
+            shape += (3,)
+        if self.flatten:
+            shape = (int(np.prod(shape)),)
+        if self.mode == 'binary':
+            shape = shape[:-1] + ((shape[-1] + 7) // 8,)
+        return shape
+
+    def render(self, mols):
+        """
+        Render images for molecules.
+
+        The 'obabel' engine depicts the batch with a single obabel process.
+        The 'rdkit' engine draws the batch as a grid of panels on one
+        rdMolDraw2D canvas, which is converted to an image once and split
+        into an image for each molecule. Each molecule is scaled to fit its
+        own panel, so images do not depend on the other molecules in the
+        batch. RDKit versions that can only draw grids with a common scale
+        (without the drawMolsSameScale drawing option) draw each molecule
+        with Draw.MolToImage instead.
+
+        Parameters
+        ----------
+        mols : list
+            Molecules.
+
+        Returns
+        -------
+        A list of PIL images.
+        """
         if self.engine == 'obabel':
-            image = ob_utils.MolImage(self.size)(mol)
-        elif self.engine == 'rdkit':
-            image = Draw.MolToImage(mol, dim, fitImage=True)
-            image = image.convert('RGB')  # drop alpha channel
+            return ob_utils.MolImage(self.size).depict_many(mols)
+        if not len(mols):
+            return []
+        if not hasattr(rdMolDraw2D, 'MolDraw2DCairo'):  # no Cairo support
+            return self._draw_each(mols)
+        n_cols = int(np.ceil(np.sqrt(len(mols))))
+        n_rows = (len(mols) + n_cols - 1) // n_cols
+        drawer = rdMolDraw2D.MolDraw2DCairo(
+            n_cols * self.size, n_rows * self.size, self.size, self.size)
+        options = drawer.drawOptions()
+        if not hasattr(options, 'drawMolsSameScale'):
+            return self._draw_each(mols)
+        options.drawMolsSameScale = False
+        drawer.DrawMolecules(
+            [rdMolDraw2D.PrepareMolForDrawing(mol) for mol in mols])
+        drawer.FinishDrawing()
+        grid = image_utils.load(drawer.GetDrawingText())
+        images = []
+        for i in xrange(len(mols)):
+            x = (i % n_cols) * self.size
+            y = (i // n_cols) * self.size
+            images.append(grid.crop((x, y, x + self.size, y + self.size)))
+        return images
+
+    def _draw_each(self, mols):
+        """
+        Draw each molecule separately with Draw.MolToImage.
+
+        Parameters
+        ----------
+        mols : list
+            Molecules.
+        """
+        dim = (self.size, self.size)
+        return [Draw.MolToImage(mol, dim, fitImage=True) for mol in mols]
+
+    def get_pixels(self, image):
+        """
+        Get pixels from an image in the output format.
+
+        Parameters
+        ----------
+        image : PIL Image
+            Image.
+        """
+        if self.mode == 'rgb':
+            pixels = image_utils.get_pixels(image, 'RGB')  # drop alpha
         else:
-            raise NotImplementedError(self.engine)
-        pixels = image_utils.get_pixels(image)
+            pixels = image_utils.get_pixels(image, 'L')
         if self.flatten:
             pixels = pixels.ravel()
+        if self.mode == 'binary':
+            pixels = pack_bits(pixels < 128)
         return pixels
@@ -722,33 +722,35 @@ class NNScoreComplexFeaturizer(ComplexFeaturizer):
     """
     ### OPEN TEMPDIR
     tempdir = tempfile.mkdtemp()
-
-    mol_pdb_file = os.path.join(tempdir, "mol.pdb")
-    with open(mol_pdb_file, "w") as mol_f:
-      mol_f.writelines(mol_pdb)
-    protein_pdb_file = os.path.join(tempdir, "protein.pdb")
-    with open(protein_pdb_file, "w") as protein_f:
-      protein_f.writelines(protein_pdb)
-
-    mol_hyd_file = os.path.join(tempdir, "mol_hyd.pdb")
-    mol_pdbqt_file = os.path.join(tempdir, "mol_hyd.pdbqt")
-    hydrogenate_and_compute_partial_charges(
-        mol_pdb_file, "pdb", tempdir, mol_hyd_file, mol_pdbqt_file)
-
-    protein_hyd_file = os.path.join(tempdir, "protein_hyd.pdb")
-    protein_pdbqt_file = os.path.join(tempdir, "protein_hyd.pdbqt")
-    hydrogenate_and_compute_partial_charges(
-        protein_pdb_file, "pdb", tempdir, protein_hyd_file, protein_pdbqt_file)
-
-    mol_pdb_obj = PDB()
-    mol_pdb_obj.load_from_files(mol_pdb_file, mol_pdbqt_file)
-
-    protein_pdb_obj = PDB()
-    protein_pdb_obj.load_from_files(protein_pdb_file, protein_pdbqt_file)
-
-    features = self.binana.compute_input_vector(mol_pdb_obj, protein_pdb_obj)
-
-    ### CLOSE TEMPDIR
-    shutil.rmtree(tempdir)
+    try:
+      mol_pdb_file = os.path.join(tempdir, "mol.pdb")
+      with open(mol_pdb_file, "w") as mol_f:
+        mol_f.writelines(mol_pdb)
+      protein_pdb_file = os.path.join(tempdir, "protein.pdb")
+      with open(protein_pdb_file, "w") as protein_f:
+        protein_f.writelines(protein_pdb)
+
+      mol_hyd_file = os.path.join(tempdir, "mol_hyd.pdb")
+      mol_pdbqt_file = os.path.join(tempdir, "mol_hyd.pdbqt")
+      hydrogenate_and_compute_partial_charges(
+          mol_pdb_file, "pdb", tempdir, mol_hyd_file, mol_pdbqt_file)
+
+      protein_hyd_file = os.path.join(tempdir, "protein_hyd.pdb")
+      protein_pdbqt_file = os.path.join(tempdir, "protein_hyd.pdbqt")
+      hydrogenate_and_compute_partial_charges(
+          protein_pdb_file, "pdb", tempdir, protein_hyd_file,
+          protein_pdbqt_file)
+
+      mol_pdb_obj = PDB()
+      mol_pdb_obj.load_from_files(mol_pdb_file, mol_pdbqt_file)
+
+      protein_pdb_obj = PDB()
+      protein_pdb_obj.load_from_files(protein_pdb_file, protein_pdbqt_file)
+
+      features = self.binana.compute_input_vector(mol_pdb_obj,
+                                                  protein_pdb_obj)
+    finally:
+      ### CLOSE TEMPDIR (also on failure or timeout)
+      shutil.rmtree(tempdir)
 
     return features
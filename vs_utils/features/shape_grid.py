@@ -9,13 +9,22 @@ __license__ = "BSD 3-clause"
 import numpy as np
 
 from vs_utils.features import Featurizer, MolPreparator
-from vs_utils.features.gridmol.molecule import GridAtom, GridMol
+from vs_utils.features.gridmol import Grid
+from vs_utils.features.gridmol.molecule import (get_distance_grids,
+                                                get_occupancy_grids, GridAtom,
+                                                GridMol)
 
 
 class ShapeGrid(Featurizer):
     """
     Grid-based shape features.
 
+    Occupancy grids are mostly empty, so store them compactly: use
+    featurize(..., dtype='packed') to pack bits along the last axis, or
+    write grids from featurize_iter(..., ragged=True) to HDF5 with
+    vs_utils.utils.h5_utils.GridWriter in 'packed' or 'sparse' (voxel
+    index) mode.
+
     Parameters
     ----------
     size : int, optional (default 81)
@@ -30,14 +39,11 @@ class ShapeGrid(Featurizer):
         when working with conformers retrieved from PubChem.
     probe_radius : float, optional (default 1.4)
         Probe radius for determining solvent-accessible surface.
-    featurization : str, optional (default 'distance')
+    featurization : str, optional (default 'occupancy')
         Shape featurization to use. Choose from:
         * 'distance' : distances to molecular surface.
-        * 'occupancy' : boolean grid indicating inside/outside of molecule
-    distance_to_surface : bool, optional (default True)
-        Whether to calculate the distance from each grid point to the molecular
-        surface. If False, a boolean grid is returned with set bits
-        corresponding to points inside the molecule.
+        * 'occupancy' : boolean grid indicating inside/outside of molecule.
+          Each atom only visits the grid points within its bounding box.
     """
     conformers = True
     name = 'shape'
@@ -47,6 +53,7 @@ class ShapeGrid(Featurizer):
         self.size = size
         self.resolution = resolution
         self.hydrogens = hydrogens
+        self.align = align
         self.preparator = MolPreparator(align=align, add_hydrogens=hydrogens)
         self.probe_radius = probe_radius
         self.featurization = featurization
@@ -55,30 +62,67 @@ class ShapeGrid(Featurizer):
         """
         Generate shape features for all conformers of a molecule.
 
+        Grids for all conformers are calculated at once from an
+        (n_confs, n_atoms, 3) array of atom positions.
+
         Parameters
         ----------
         mol : RDKit Mol
             Molecule.
         """
         mol = self.preparator(mol)
-        features = []
-        for conf in mol.GetConformers():
-            grid_mol = self.embed_mol_in_grid(mol, conf.GetId())
-            if self.featurization == 'distance':
-                this_features = grid_mol.get_distance()
-            elif self.featurization == 'occupancy':
-                this_features = grid_mol.get_occupancy()
-            else:
-                raise NotImplementedError(
-                    "Unrecognized featurization '{}'.".format(
-                        self.featurization))
-            features.append(this_features)
+        coords, radii = self.get_atom_arrays(mol)
+        shape = tuple(self.size * np.ones(3, dtype=int))
+        grid = Grid(shape, spacing=self.resolution, dtype=bool)
+        if self.featurization == 'distance':
+            features = get_distance_grids(grid, coords, radii,
+                                          self.probe_radius)
+        elif self.featurization == 'occupancy':
+            features = get_occupancy_grids(grid, coords, radii,
+                                           self.probe_radius)
+        else:
+            raise NotImplementedError(
+                "Unrecognized featurization '{}'.".format(
+                    self.featurization))
         return features
 
+    def get_atom_arrays(self, mol):
+        """
+        Get atom positions for all conformers of a molecule, along with
+        atomic radii. Hydrogens are skipped unless self.hydrogens is True.
+
+        Parameters
+        ----------
+        mol : RDKit Mol
+            Molecule.
+
+        Returns
+        -------
+        coords : ndarray
+            Atom positions with shape (n_confs, n_atoms, 3).
+        radii : ndarray
+            Atomic radii.
+        """
+        atoms = [atom for atom in mol.GetAtoms()
+                 if self.hydrogens or atom.GetAtomicNum() != 1]
+        index = [atom.GetIdx() for atom in atoms]
+        radii = np.asarray(
+            [GridAtom.get_radius_from_atomic_num(atom.GetAtomicNum())
+             for atom in atoms], dtype=float)
+        coords = np.zeros((mol.GetNumConformers(), len(index), 3),
+                          dtype=float)
+        for i, conf in enumerate(mol.GetConformers()):
+            coords[i] = np.asarray(conf.GetPositions())[index]
+        return coords, radii
+
     def embed_mol_in_grid(self, mol, conf_id):
         """
         Add atoms from a molecule to a GridMol.
 
+        ShapeGrid no longer uses this method (grids for all conformers are
+        calculated together in _featurize); it is kept for backward
+        compatibility.
+
         Parameters
         ----------
         mol : RDKit Mol
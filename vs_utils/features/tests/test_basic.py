@@ -3,6 +3,7 @@ Test basic molecular features.
 """
 import numpy as np
 import unittest
+import warnings
 
 from rdkit import Chem
 
@@ -48,3 +49,51 @@ class TestSimpleDescriptors(unittest.TestCase):
     assert np.allclose(
       descriptors[0, self.engine.descriptors.index('ExactMolWt')], 180,
       atol=0.1)
+
+  def testSimpleDescriptorsBatch(self):
+    """
+    Test that batched descriptors match per-molecule descriptors.
+    """
+    descriptors = self.engine([self.mol, self.mol])
+    assert descriptors.shape == (2, len(self.engine.descriptors))
+    assert np.allclose(descriptors[1], self.engine._featurize(self.mol))
+
+  def testSelection(self):
+    """
+    Test descriptor selection with include, exclude, and cost_budget.
+    """
+    engine = SimpleDescriptors(include='MolWt,fr_*', exclude=['fr_Ar_N'])
+    assert engine.descriptors[0] == 'MolWt'
+    assert 'fr_Ar_N' not in engine.descriptors
+    assert all([name.startswith('fr_') for name in engine.descriptors[1:]])
+    assert engine([self.mol]).shape == (1, len(engine.descriptors))
+    fast = SimpleDescriptors(cost_budget='fast')
+    assert 'Ipc' in self.engine.descriptors
+    assert 'Ipc' not in fast.descriptors
+    assert 'MolWt' in fast.descriptors
+    with self.assertRaises(ValueError):
+      SimpleDescriptors(include=['NotADescriptor'])
+    with self.assertRaises(ValueError):
+      SimpleDescriptors(cost_budget='slow')
+
+  def testFloat32(self):
+    """
+    Test that descriptors are written to float32 rows.
+    """
+    assert self.engine([self.mol]).dtype == np.float32
+    assert self.engine._featurize(self.mol).dtype == np.float32
+
+  def testFloat32Overflow(self):
+    """
+    Test that descriptors outside the float32 range are clipped.
+    """
+    engine = SimpleDescriptors(include=['MolWt'])
+    engine.descriptors = ['Big', 'Small']
+    engine.functions = [lambda mol: 1e100, lambda mol: -1e100]
+    with warnings.catch_warnings(record=True) as w:
+      warnings.simplefilter('always')
+      rval = engine([self.mol])
+    assert np.all(np.isfinite(rval))
+    assert np.array_equal(rval[0], [np.finfo(np.float32).max,
+                                    -np.finfo(np.float32).max])
+    assert len(w) == 2 and "'Big'" in str(w[0].message)
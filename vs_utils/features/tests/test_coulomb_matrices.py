@@ -33,6 +33,42 @@ class TestCoulombMatrix(unittest.TestCase):
         size = np.triu_indices(self.mol.GetNumAtoms())[0].size
         assert rval.shape == (1, self.mol.GetNumConformers(), size)
 
+    def test_coulomb_matrix_values(self):
+        """
+        Compare Coulomb matrices to an explicit calculation for each pair of
+        atoms.
+        """
+        engine = conformers.ConformerGenerator(max_conformers=3)
+        mol = engine.generate_conformers(Chem.MolFromSmiles('CC(=O)O'))
+        n_atoms = mol.GetNumAtoms()
+        f = cm.CoulombMatrix(n_atoms + 2, remove_hydrogens=False,
+                             randomize=False)
+        rval = f.coulomb_matrix(mol)
+        assert rval.shape == (mol.GetNumConformers(), n_atoms + 2,
+                              n_atoms + 2)
+        z = [atom.GetAtomicNum() for atom in mol.GetAtoms()]
+        for k, conf in enumerate(mol.GetConformers()):
+            ref = np.zeros((n_atoms + 2, n_atoms + 2))
+            for i in xrange(n_atoms):
+                for j in xrange(n_atoms):
+                    if i == j:
+                        ref[i, j] = 0.5 * z[i] ** 2.4
+                    else:
+                        d = conf.GetAtomPosition(i).Distance(
+                            conf.GetAtomPosition(j))
+                        ref[i, j] = z[i] * z[j] / d
+            assert np.allclose(rval[k], ref)
+
+    def test_coulomb_matrix_samples(self):
+        """
+        Test CoulombMatrix with multiple randomized samples per conformer.
+        """
+        f = cm.CoulombMatrix(self.mol.GetNumAtoms(), n_samples=3)
+        rval = f([self.mol])
+        size = np.triu_indices(self.mol.GetNumAtoms())[0].size
+        assert rval.shape == (1, 3 * self.mol.GetNumConformers(), size)
+        assert np.allclose(rval[0], f._featurize(self.mol))
+
     def test_coulomb_matrix_padding(self):
         """
         Test CoulombMatrix with padding.
@@ -63,3 +99,55 @@ class TestCoulombMatrix(unittest.TestCase):
         rval = f([self.mol])
         size = np.triu_indices(self.mol.GetNumAtoms())[0].size
         assert rval.shape == (1, self.mol.GetNumConformers(), size)
+
+    def test_coulomb_matrix_eigenspectrum(self):
+        """
+        Test CoulombMatrix eigenvalue spectrum representation.
+        """
+        n_atoms = self.mol.GetNumAtoms()
+        f = cm.CoulombMatrix(n_atoms + 5, representation='eigenspectrum',
+                             n_samples=3)
+        rval = f([self.mol])
+        assert rval.shape == (1, self.mol.GetNumConformers(), n_atoms + 5)
+        m = cm.CoulombMatrix(n_atoms, randomize=False).coulomb_matrix(
+            self.mol)[0]
+        ref = np.linalg.eigvalsh(m)
+        ref = ref[np.argsort(-np.abs(ref))]
+        assert np.allclose(rval[0, 0, :len(ref)], ref)
+        assert np.allclose(rval[0, 0, len(ref):], 0)
+
+    def test_coulomb_matrix_sorted(self):
+        """
+        Test CoulombMatrix sorted representation.
+        """
+        f = cm.CoulombMatrix(self.mol.GetNumAtoms(), representation='sorted',
+                             n_samples=3)
+        m = f.coulomb_matrix(self.mol)
+        assert len(m) == self.mol.GetNumConformers()
+        norms = np.linalg.norm(m[0], axis=1)
+        assert np.all(np.diff(norms) <= 0)
+        assert np.allclose(m[0], m[0].T)
+        rval = f([self.mol])
+        size = np.triu_indices(self.mol.GetNumAtoms())[0].size
+        assert rval.shape == (1, self.mol.GetNumConformers(), size)
+
+    def test_coulomb_matrix_seed(self):
+        """
+        Test that seeded randomized matrices are reproducible and do not
+        depend on molecule order.
+        """
+        mol = Chem.MolFromSmiles('CC(C)CC1=CC=C(C=C1)C(C)C(=O)O')
+        engine = conformers.ConformerGenerator(max_conformers=1)
+        mol = engine.generate_conformers(mol)
+        f = cm.CoulombMatrix(mol.GetNumAtoms(), n_samples=5, seed=123)
+        a = f([self.mol, mol])
+        b = f([mol, self.mol])
+        assert np.array_equal(a[0], b[1])
+        assert np.array_equal(a[1], b[0])
+
+        # samples are permutations of the original matrix
+        m = cm.CoulombMatrix(mol.GetNumAtoms(),
+                             randomize=False).coulomb_matrix(mol)[0]
+        for sample in f.coulomb_matrix(mol):
+            assert np.allclose(np.sort(np.diag(sample)), np.sort(np.diag(m)))
+            assert np.allclose(np.sort(sample.ravel()), np.sort(m.ravel()))
@@ -0,0 +1,108 @@
+"""
+Tests for Dragon descriptors.
+"""
+import numpy as np
+import unittest
+
+from vs_utils.features import FeaturizerPipeline
+from vs_utils.features.dragon import DragonDescriptors
+
+
+class MockMol(int):
+    """
+    Mock molecule without a name.
+    """
+    def HasProp(self, name):
+        """
+        Check for a molecule property.
+
+        Parameters
+        ----------
+        name : str
+            Property name.
+        """
+        return False
+
+
+class MockDragon(object):
+    """
+    Mock Dragon engine that returns descriptors derived from each molecule
+    and skips negative molecules.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def get_descriptors(self, mols):
+        """
+        Calculate mock descriptors.
+
+        Parameters
+        ----------
+        mols : array_like
+            Molecules.
+        """
+        mols = list(mols)
+        self.calls.append(mols)
+        features = np.zeros(len(mols), dtype=object)
+        for i, mol in enumerate(mols):
+            features[i] = None if mol < 0 else np.asarray([mol, 2 * mol],
+                                                           dtype=float)
+        return features
+
+
+class TestDragonDescriptors(unittest.TestCase):
+    """
+    Tests for DragonDescriptors.
+    """
+    def setUp(self):
+        """
+        Set up tests.
+        """
+        self.engine = DragonDescriptors()
+        self.engine.engine = MockDragon()
+        self.mols = [MockMol(1), MockMol(-1), MockMol(3)]
+
+    def test_featurize(self):
+        """
+        Test DragonDescriptors.featurize with one Dragon call per batch.
+        """
+        features = self.engine(self.mols)
+        assert features.shape == (3, 2)
+        assert np.array_equal(features[0], [1, 2])
+        assert np.ma.getmaskarray(features)[1].all()
+        assert self.engine.engine.calls == [self.mols]
+
+    def test_featurize_options(self):
+        """
+        Test DragonDescriptors.featurize with Featurizer.featurize options.
+        """
+        failures = {}
+        features = self.engine.featurize(self.mols, failures=failures,
+                                         dtype='float32')
+        assert features.dtype == np.float32
+        assert np.array_equal(features[2], [3, 6])
+        assert np.ma.getmaskarray(features)[1].all()
+
+    def test_featurize_single(self):
+        """
+        Test DragonDescriptors._featurize with a single molecule.
+        """
+        assert np.array_equal(self.engine._featurize(3), [3, 6])
+
+    def test_featurize_iter(self):
+        """
+        Test DragonDescriptors.featurize_iter.
+        """
+        chunks = list(self.engine.featurize_iter(self.mols, chunk_size=2))
+        assert len(chunks) == 2
+        assert self.engine.engine.calls == [[1, -1], [3]]
+        assert np.array_equal(chunks[1][1], [[3, 6]])
+
+    def test_pipeline(self):
+        """
+        Test DragonDescriptors in a FeaturizerPipeline.
+        """
+        pipeline = FeaturizerPipeline([self.engine])
+        features = pipeline.featurize(self.mols, chunk_size=2)['dragon']
+        assert features.shape == (3, 2)
+        assert np.array_equal(features[2], [3, 6])
@@ -1,17 +1,75 @@
 """
 Test featurizer class.
 """
+import inspect
 import numpy as np
+import signal
+import time
 import unittest
 
 from rdkit import Chem
 
-from vs_utils.features import MolPreparator
+from vs_utils.features import (ComplexFeaturizer, FEATURIZERS, Featurizer,
+                               FeaturizerPipeline, get_featurizers,
+                               MolPreparator, resolve_featurizer)
 from vs_utils.features.basic import MolecularWeight
+from vs_utils.features.coulomb_matrices import CoulombMatrix
+from vs_utils.features.fingerprints import CircularFingerprint
+from vs_utils.features.shape_grid import ShapeGrid
+from vs_utils.utils.ob_utils import IonizerError
 from vs_utils.utils.parallel_utils import LocalCluster
 from vs_utils.utils.rdkit_utils import conformers
 
 
+class FlakyMolecularWeight(MolecularWeight):
+    """
+    Molecular weight featurizer that fails for molecules named 'error',
+    hangs for molecules named 'slow', and hangs without responding to
+    time_limit for molecules named 'stuck'.
+    """
+    def _featurize_batch(self, mols):
+        """
+        Calculate molecular weights for a batch of molecules.
+
+        Parameters
+        ----------
+        mols : list
+            Molecules.
+        """
+        for mol in mols:
+            if mol.GetProp('_Name') == 'error':
+                raise ValueError('Bad molecule.')
+            if mol.GetProp('_Name') == 'slow':
+                time.sleep(60)
+            if mol.GetProp('_Name') == 'stuck':
+                signal.signal(signal.SIGALRM, signal.SIG_IGN)
+                time.sleep(60)
+        return super(FlakyMolecularWeight, self)._featurize_batch(mols)
+
+
+class LineCountComplexFeaturizer(ComplexFeaturizer):
+    """
+    Count PDB lines for complexes. Fails for empty molecule PDBs and hangs
+    for molecule PDBs containing 'slow'.
+    """
+    def _featurize_complex(self, mol_pdb, protein_pdb):
+        """
+        Count PDB lines.
+
+        Parameters
+        ----------
+        mol_pdb: list
+            Lines of the molecule PDB file.
+        protein_pdb: list
+            Lines of the protein PDB file.
+        """
+        if not len(mol_pdb):
+            raise ValueError('Empty PDB.')
+        if 'slow' in mol_pdb:
+            time.sleep(60)
+        return [len(mol_pdb), len(protein_pdb)]
+
+
 class TestFeaturizer(unittest.TestCase):
     """
     Tests for Featurizer.
@@ -53,6 +111,354 @@ class TestFeaturizer(unittest.TestCase):
                           client_kwargs={'cluster_id': cluster.cluster_id})
         assert np.array_equal(rval, parallel_rval)
 
+    def test_process_backend(self):
+        """
+        Test featurization with a local process pool.
+        """
+        mols = [self.mol] * 5
+        f = MolecularWeight()
+        rval = f(mols)
+        process_rval = f(mols, backend='process', n_jobs=2, chunk_size=2)
+        assert np.array_equal(rval, process_rval)
+
+    def test_process_backend_conformers(self):
+        """
+        Test conformer featurization with a local process pool.
+        """
+        mols = [self.mol] * 3
+        f = CoulombMatrix(self.mol.GetNumAtoms(), randomize=False)
+        rval = f(mols)
+        process_rval = f(mols, backend='process', n_jobs=2, chunk_size=1)
+        assert rval.shape == process_rval.shape
+        assert np.allclose(rval, process_rval)
+
+    def test_empty(self):
+        """
+        Test featurization without any molecules.
+        """
+        for f in [MolecularWeight(),
+                  CoulombMatrix(self.mol.GetNumAtoms(), randomize=False)]:
+            for backend in ['serial', 'process']:
+                rval = f([], backend=backend, n_jobs=2)
+                assert len(rval) == 0, (f.name, backend)
+
+    def test_serial_chunks(self):
+        """
+        Test that serial featurization is done in chunks.
+        """
+        mols = [self.mol] * 5
+        f = MolecularWeight()
+        batches = []
+        featurize_batch = f._featurize_batch
+
+        def record_batch(chunk):
+            batches.append(len(chunk))
+            return featurize_batch(chunk)
+
+        f._featurize_batch = record_batch
+        rval = f(mols, chunk_size=2)
+        assert batches == [2, 2, 1]
+        assert rval.shape == (5, 1)
+
+    def test_timeout_batches(self):
+        """
+        Test that featurization with a timeout is done in batches.
+        """
+        mols = [self.mol] * 5
+        f = MolecularWeight()
+        batches = []
+        featurize_batch = f._featurize_batch
+
+        def record_batch(chunk):
+            batches.append(len(chunk))
+            return featurize_batch(chunk)
+
+        f._featurize_batch = record_batch
+        rval = f(mols, chunk_size=2, timeout=10)
+        assert batches == [2, 2, 1]
+        assert np.allclose(rval, f(mols))
+
+    def test_ragged(self):
+        """
+        Test ragged conformer features.
+        """
+        engine = conformers.ConformerGenerator(max_conformers=3)
+        multi = engine.generate_conformers(Chem.Mol(self.mol))
+        mols = [self.mol, multi, self.mol]
+        f = CoulombMatrix(self.mol.GetNumAtoms(), randomize=False)
+        rval = f(mols)
+        ragged_rval = f(mols, ragged=True)
+        assert np.array_equal(ragged_rval.lengths,
+                              [1, multi.GetNumConformers(), 1])
+        assert ragged_rval.data.shape[0] == multi.GetNumConformers() + 2
+        assert np.array_equal(ragged_rval.mol_index[:2], [0, 1])
+        dense = ragged_rval.densify()
+        assert dense.shape == rval.shape
+        assert np.array_equal(np.ma.getmaskarray(dense),
+                              np.ma.getmaskarray(rval))
+        assert np.allclose(dense, rval)
+
+        # chunks are concatenated without padding
+        process_rval = f(mols, backend='process', n_jobs=2, chunk_size=1,
+                         ragged=True)
+        assert np.array_equal(process_rval.offsets, ragged_rval.offsets)
+        assert np.allclose(process_rval.data, ragged_rval.data)
+
+    def test_failures(self):
+        """
+        Test isolation of failed and timed-out molecules.
+        """
+        mols = []
+        for name in ['mol0', 'error', 'slow', 'mol3']:
+            mol = Chem.Mol(self.mol)
+            mol.SetProp('_Name', name)
+            mols.append(mol)
+        ref = MolecularWeight()([self.mol])[0]
+        f = FlakyMolecularWeight()
+
+        # serial, without a timeout
+        failures = {}
+        rval = f(mols[:2], failures=failures)
+        assert failures.keys() == [1]
+        assert 'Bad molecule' in failures[1]
+        assert np.ma.getmaskarray(rval).tolist() == [[False], [True]]
+        assert np.allclose(rval[0], ref)
+
+        # process pool, with a timeout
+        failures = {}
+        rval = f(mols, backend='process', n_jobs=2, chunk_size=2,
+                 timeout=1, max_tasks_per_child=1, failures=failures)
+        assert sorted(failures.keys()) == [1, 2]
+        assert 'Time limit' in failures[2]
+        assert np.array_equal(np.ma.getmaskarray(rval)[:, 0],
+                              [False, True, True, False])
+        assert np.allclose(rval[[0, 3]], ref)
+
+    def test_stuck_worker(self):
+        """
+        Test that only the molecule a stuck worker was featurizing fails.
+        """
+        mols = []
+        for name in ['mol0', 'stuck', 'mol2']:
+            mol = Chem.Mol(self.mol)
+            mol.SetProp('_Name', name)
+            mols.append(mol)
+        ref = MolecularWeight()([self.mol])[0]
+        f = FlakyMolecularWeight()
+        failures = {}
+        start = time.time()
+        rval = f(mols, backend='process', n_jobs=1, chunk_size=3,
+                 timeout=0.5, failures=failures)
+        assert time.time() - start < 30
+        assert failures.keys() == [1]
+        assert 'time limit' in failures[1]
+        assert np.array_equal(np.ma.getmaskarray(rval)[:, 0],
+                              [False, True, False])
+        assert np.allclose(rval[[0, 2]], ref)
+
+    def test_parallel_options(self):
+        """
+        Test that options that IPython.parallel does not support are
+        rejected.
+        """
+        f = MolecularWeight()
+        for kwargs in [{'timeout': 1}, {'failures': {}},
+                       {'max_tasks_per_child': 1}]:
+            try:
+                f([self.mol], backend='ipython', **kwargs)
+                raise AssertionError(kwargs)
+            except ValueError:
+                pass
+
+    def test_featurize_iter(self):
+        """
+        Test chunked featurization from a generator.
+        """
+        names = ['mol{}'.format(i) for i in xrange(5)]
+        mols = []
+        for name in names:
+            mol = Chem.Mol(self.mol)
+            mol.SetProp('_Name', name)
+            mols.append(mol)
+        f = MolecularWeight()
+        rval = f(mols)
+        chunks = list(f.featurize_iter((mol for mol in mols), chunk_size=2))
+        assert [len(mol_ids) for mol_ids, _ in chunks] == [2, 2, 1]
+        assert np.array_equal(
+            np.concatenate([mol_ids for mol_ids, _ in chunks]), names)
+        assert np.array_equal(
+            np.concatenate([features for _, features in chunks]), rval)
+
+
+class TestComplexFeaturizer(unittest.TestCase):
+    """
+    Tests for ComplexFeaturizer.
+    """
+    def setUp(self):
+        """
+        Set up tests.
+        """
+        self.mol_pdbs = [['ATOM'] * (i + 1) for i in xrange(5)]
+        self.protein_pdbs = [['ATOM'] * (10 + i) for i in xrange(5)]
+        self.featurizer = LineCountComplexFeaturizer()
+
+    def test_process_backend(self):
+        """
+        Test featurize_complexes with a local process pool.
+        """
+        rval = self.featurizer.featurize_complexes(self.mol_pdbs,
+                                                   self.protein_pdbs)
+        assert np.array_equal(rval, [[i + 1, 10 + i] for i in xrange(5)])
+        process_rval = self.featurizer.featurize_complexes(
+            self.mol_pdbs, self.protein_pdbs, backend='process', n_jobs=2,
+            chunk_size=2)
+        assert np.array_equal(rval, process_rval)
+
+    def test_failures(self):
+        """
+        Test isolation of failed and timed-out complexes.
+        """
+        self.mol_pdbs[1] = []
+        self.mol_pdbs[3] = ['slow']
+        failures = {}
+        rval = self.featurizer.featurize_complexes(
+            self.mol_pdbs, self.protein_pdbs, backend='process', n_jobs=2,
+            chunk_size=2, timeout=1, failures=failures)
+        assert sorted(failures.keys()) == [1, 3]
+        assert 'Empty PDB' in failures[1]
+        assert 'Time limit' in failures[3]
+        assert np.array_equal(np.ma.getmaskarray(rval)[:, 0],
+                              [False, True, False, True, False])
+        assert np.array_equal(rval[4], [5, 14])
+
+
+class TestFeaturizerRegistry(unittest.TestCase):
+    """
+    Tests for the featurizer registry.
+    """
+    def test_registry(self):
+        """
+        Check that registry entries match featurizer classes.
+        """
+        for name, info in FEATURIZERS.items():
+            klass = resolve_featurizer(name)
+            assert issubclass(klass, Featurizer)
+            assert name == klass.name or name in klass.name
+            try:
+                args, _, _, defaults = inspect.getargspec(klass.__init__)
+            except TypeError:  # no __init__
+                args, defaults = ['self'], None
+            assert tuple(args[1:]) == info.args, name
+            assert (defaults or ()) == info.defaults, name
+
+    def test_all_registered(self):
+        """
+        Check that all featurizers are registered.
+        """
+        featurizers = get_featurizers()
+        for klass in Featurizer.__subclasses__():
+            names = klass.name
+            if not isinstance(names, list):
+                names = [names]
+            for name in names:
+                assert featurizers[name] is klass, name
+
+
+class TestFeaturizerPipeline(unittest.TestCase):
+    """
+    Tests for FeaturizerPipeline.
+    """
+    def setUp(self):
+        """
+        Set up tests.
+        """
+        smiles = 'CC(=O)OC1=CC=CC=C1C(=O)O'
+        mol = Chem.MolFromSmiles(smiles)
+        engine = conformers.ConformerGenerator(max_conformers=1)
+        self.mols = [engine.generate_conformers(mol)] * 3
+        self.featurizers = [
+            MolecularWeight(), CircularFingerprint(size=512),
+            ShapeGrid(size=20, hydrogens=True),
+            ShapeGrid(size=20, hydrogens=True, featurization='distance')]
+
+    def test_pipeline(self):
+        """
+        Test FeaturizerPipeline.
+        """
+        refs = [f(self.mols) for f in self.featurizers]
+        pipeline = FeaturizerPipeline(self.featurizers)
+        assert pipeline.names == ['mw', 'circular', 'shape', 'shape_1']
+        assert len(pipeline.preparators) == 1
+        assert self.featurizers[2].preparator is self.featurizers[3].preparator
+        rval = pipeline.featurize(self.mols, chunk_size=2)
+        assert rval.keys() == pipeline.names
+        for ref, features in zip(refs, rval.values()):
+            assert np.allclose(ref, features)
+
+    def test_process_backend(self):
+        """
+        Test FeaturizerPipeline with a local process pool.
+        """
+        pipeline = FeaturizerPipeline(self.featurizers[:3])
+        rval = pipeline.featurize(self.mols)
+        process_rval = pipeline.featurize(self.mols, backend='process',
+                                          n_jobs=2, chunk_size=1)
+        for name in pipeline.names:
+            assert np.allclose(rval[name], process_rval[name])
+
+    def test_featurize_iter(self):
+        """
+        Test FeaturizerPipeline.featurize_iter.
+        """
+        pipeline = FeaturizerPipeline(self.featurizers[:2])
+        chunks = list(pipeline.featurize_iter(self.mols, chunk_size=2))
+        assert [len(mol_ids) for mol_ids, _ in chunks] == [2, 1]
+        assert chunks[0][1]['circular'].shape == (2, 512)
+
+    def test_failures(self):
+        """
+        Test isolation of failed and timed-out molecules.
+        """
+        mols = []
+        for name in ['mol0', 'error', 'slow', 'mol3']:
+            mol = Chem.Mol(self.mols[0])
+            mol.SetProp('_Name', name)
+            mols.append(mol)
+        ref = MolecularWeight()([self.mols[0]])[0]
+        pipeline = FeaturizerPipeline(
+            [FlakyMolecularWeight(), MolecularWeight()], ['flaky', 'mw'])
+
+        # serial, without a timeout
+        failures = {}
+        rval = pipeline.featurize(mols[:2], failures=failures)
+        assert failures == {'flaky': {1: 'ValueError: Bad molecule.'},
+                            'mw': {}}
+        assert np.ma.getmaskarray(rval['flaky']).tolist() == [[False],
+                                                              [True]]
+        assert np.allclose(rval['mw'], ref)
+
+        # process pool, with a timeout
+        failures = {}
+        rval = pipeline.featurize(mols, backend='process', n_jobs=2,
+                                  chunk_size=2, timeout=1,
+                                  max_tasks_per_child=1, failures=failures)
+        assert sorted(failures['flaky'].keys()) == [1, 2]
+        assert 'Time limit' in failures['flaky'][2]
+        assert failures['mw'] == {}
+        assert np.array_equal(np.ma.getmaskarray(rval['flaky'])[:, 0],
+                              [False, True, True, False])
+        assert np.allclose(rval['flaky'][[0, 3]], ref)
+        assert not np.ma.getmaskarray(rval['mw']).any()
+        assert np.allclose(rval['mw'], ref)
+
+        # chunks in which every molecule fails
+        failures = {}
+        chunks = list(pipeline.featurize_iter(mols[:2], chunk_size=1,
+                                              failures=failures))
+        assert failures['flaky'].keys() == [1]
+        assert np.ma.getmaskarray(chunks[1][1]['flaky']).tolist() == [[True]]
+        assert np.allclose(chunks[1][1]['mw'], ref)
+
 
 class TestMolPreparator(unittest.TestCase):
     """
@@ -88,6 +494,31 @@ class TestMolPreparator(unittest.TestCase):
                           for atom in self.mol.GetAtoms()])
         assert mol_charge != ref_charge
 
+    def test_prepare_many(self):
+        """
+        Test MolPreparator.prepare_many.
+        """
+        self.preparator.set_ionize(True)
+        self.preparator.set_add_hydrogens(True)
+        bad_mol = Chem.MolFromSmiles(
+            'CC1=C(C(C(=C(O1)N)C#N)C2=CC3=C(C=C2)OCO3)C(=O)OCC=C')
+        mols = self.preparator.prepare_many([self.mol, bad_mol])
+        assert (mols[0].ToBinary() ==
+                self.preparator(self.mol).ToBinary())
+        assert isinstance(mols[1], IonizerError)
+
+        # memoized failures are raised by prepare
+        self.preparator.memoize(True)
+        assert self.preparator.prepare_many([self.mol, bad_mol],
+                                            copy=False) is None
+        assert (self.preparator(self.mol).ToBinary() ==
+                mols[0].ToBinary())
+        try:
+            self.preparator(bad_mol)
+            assert False
+        except IonizerError:
+            pass
+
     def test_align(self):
         """
         Test MolPreparator with align=True.
@@ -130,3 +561,22 @@ class TestMolPreparator(unittest.TestCase):
         ref_mol = Chem.RemoveHs(self.mol)
         mol = self.preparator(ref_mol)
         assert mol.GetNumAtoms() > ref_mol.GetNumAtoms()
+
+    def test_memoize(self):
+        """
+        Test MolPreparator memoization.
+        """
+        self.preparator.set_add_hydrogens(True)
+        self.preparator.memoize()
+        mol = self.preparator(self.mol)
+        other = self.preparator(self.mol)
+        assert mol is not other
+        assert Chem.MolToMolBlock(mol) == Chem.MolToMolBlock(other)
+        assert len(self.preparator._memo) == 1
+
+        # options are part of the key
+        mol = self.preparator(self.mol, add_hydrogens=False)
+        assert mol.GetNumAtoms() == self.mol.GetNumAtoms()
+        assert len(self.preparator._memo) == 2
+        self.preparator.memoize(False)
+        assert self.preparator._memo is None
@@ -1,11 +1,14 @@
 """
 Test topological fingerprints.
 """
+import numpy as np
 import unittest
 
 from rdkit import Chem
+from rdkit.Chem import rdMolDescriptors
 
 from vs_utils.features import fingerprints as fp
+from vs_utils.utils.array_utils import SparseFeatures, unpack_bits
 
 
 class TestCircularFingerprint(unittest.TestCase):
@@ -27,15 +30,60 @@ class TestCircularFingerprint(unittest.TestCase):
         rval = self.engine([self.mol])
         assert rval.shape == (1, self.engine.size)
 
+    def test_circular_fingerprints_batch(self):
+        """
+        Test that batched fingerprints match per-molecule fingerprints.
+        """
+        mols = [self.mol, Chem.MolFromSmiles('CCO')]
+        rval = self.engine(mols)
+        for i, mol in enumerate(mols):
+            fp = self.engine._featurize(mol)
+            assert fp.dtype == np.uint8
+            assert np.array_equal(rval[i], fp)
+
+    def test_circular_fingerprints_dtype(self):
+        """
+        Test CircularFingerprint with compact output data types.
+        """
+        mols = [self.mol, Chem.MolFromSmiles('CCO')]
+        rval = self.engine(mols)
+        assert rval.dtype == np.uint8
+        assert self.engine(mols, dtype=bool).dtype == bool
+        packed = self.engine(mols, dtype='packed')
+        assert packed.shape == (2, self.engine.size // 8)
+        assert packed.dtype == np.uint8
+        assert np.array_equal(unpack_bits(packed, self.engine.size), rval)
+
+    def test_featurize_folded(self):
+        """
+        Test fingerprints for several radii and sizes in one pass.
+        """
+        mols = [self.mol, Chem.MolFromSmiles('CCO'),
+                Chem.MolFromSmiles('c1ccccc1O')]
+        combinations = [(2, 1024), (1, 512), (3, 2048), (2, 64)]
+        rval = self.engine.featurize_folded(mols, combinations)
+        assert rval.keys() == combinations
+        for (radius, size), x in rval.items():
+            engine = fp.CircularFingerprint(radius=radius, size=size)
+            assert np.array_equal(x, engine(mols))
+
     def test_sparse_circular_fingerprints(self):
         """
         Test CircularFingerprint with sparse encoding.
         """
         self.engine = fp.CircularFingerprint(sparse=True)
-        rval = self.engine([self.mol])
-        assert rval.shape == (1,)
-        assert isinstance(rval[0], dict)
-        assert len(rval[0])
+        mols = [self.mol, Chem.MolFromSmiles('CCO')]
+        rval = self.engine(mols)
+        assert isinstance(rval, SparseFeatures)
+        assert rval.shape == (2, len(rval.keys))
+        assert rval.labels is None
+
+        # compare to RDKit sparse fingerprints
+        for i, mol in enumerate(mols):
+            ref = rdMolDescriptors.GetMorganFingerprint(
+                mol, 2).GetNonzeroElements()
+            row = rval.matrix[i]
+            assert dict(zip(rval.keys[row.indices], row.data)) == ref
 
     def test_sparse_circular_fingerprints_with_smiles(self):
         """
@@ -43,12 +91,25 @@ class TestCircularFingerprint(unittest.TestCase):
         fragment.
         """
         self.engine = fp.CircularFingerprint(sparse=True, smiles=True)
-        rval = self.engine([self.mol])
-        assert rval.shape == (1,)
-        assert isinstance(rval[0], dict)
-        assert len(rval[0])
-
-        # check for separate count and SMILES entries for each fragment
-        for fragment_id, value in rval[0].items():
-            assert 'count' in value
-            assert 'smiles' in value
+        rval = self.engine([self.mol, self.mol])
+        assert rval.shape[0] == 2
+        assert rval.shape[1] and len(rval.labels) == rval.shape[1]
+        assert np.array_equal(rval.matrix[0].toarray(),
+                              rval.matrix[1].toarray())
+        for label in rval.labels:
+            assert isinstance(label, str)
+
+    def test_sparse_circular_fingerprints_merge(self):
+        """
+        Test that sparse fingerprints calculated in chunks share a
+        vocabulary.
+        """
+        self.engine = fp.CircularFingerprint(sparse=True, smiles=True)
+        mols = [self.mol, Chem.MolFromSmiles('CCO'),
+                Chem.MolFromSmiles('c1ccccc1O')]
+        ref = self.engine(mols)
+        rval = self.engine._merge_blocks([self.engine._featurize_batch([mol])
+                                          for mol in mols])
+        assert np.array_equal(rval.keys, ref.keys)
+        assert np.array_equal(rval.labels, ref.labels)
+        assert np.array_equal(rval.matrix.toarray(), ref.matrix.toarray())
@@ -1,11 +1,13 @@
 """
 Test image featurizer.
 """
+import numpy as np
 import unittest
 
 from rdkit import Chem
 
 from vs_utils.features import images
+from vs_utils.utils.array_utils import unpack_bits
 
 
 class TestOBabelMolImage(unittest.TestCase):
@@ -36,6 +38,46 @@ class TestOBabelMolImage(unittest.TestCase):
         rval = f([self.mol])
         assert rval.shape == (1, 250, 250, 3), rval.shape
 
+    def test_images_gray(self):
+        """
+        Test MolImage with grayscale pixels.
+        """
+        f = images.MolImage(250, engine=self.engine, mode='gray')
+        rval = f([self.mol, self.mol])
+        assert rval.shape == (2, 250, 250), rval.shape
+        assert rval.dtype == np.uint8
+        assert np.array_equal(rval[0], rval[1])
+
+    def test_images_batch(self):
+        """
+        Test that images do not depend on the other molecules in a batch.
+        """
+        other = Chem.MolFromSmiles('CCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCC')
+        f = images.MolImage(100, engine=self.engine, mode='gray')
+        rval = f([self.mol, other, self.mol])
+        assert np.array_equal(rval[0], f([self.mol])[0])
+        assert np.array_equal(rval[1], f([other])[0])
+        assert np.array_equal(rval[2], rval[0])
+        assert not np.array_equal(rval[0], rval[1])
+
+    def test_images_binary(self):
+        """
+        Test MolImage with packed 1-bit pixels.
+        """
+        gray = images.MolImage(250, engine=self.engine, mode='gray')
+        f = images.MolImage(250, engine=self.engine, mode='binary')
+        rval = f([self.mol])
+        assert rval.shape == (1, 250, 32), rval.shape
+        pixels = unpack_bits(rval, 250)
+        assert np.array_equal(pixels, gray([self.mol]) < 128)
+        assert 0 < pixels.sum() < pixels.size
+
+        # flattened images are packed after flattening
+        f = images.MolImage(250, flatten=True, engine=self.engine,
+                            mode='binary')
+        rval = f([self.mol])
+        assert rval.shape == (1, 7813), rval.shape
+
 
 class TestRDKitMolImage(TestOBabelMolImage):
     """
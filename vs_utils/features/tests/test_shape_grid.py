@@ -1,6 +1,7 @@
 """
 Tests for grid-based shape features.
 """
+import numpy as np
 import unittest
 
 from rdkit import Chem
@@ -41,6 +42,20 @@ class TestShapeGrid(unittest.TestCase):
         self.engine = ShapeGrid(featurization='occupancy')
         features = self.engine(self.mols)
         assert features.shape == (len(self.mols), self.max_confs, 81, 81, 81)
+        assert features.dtype == bool
+
+    def test_occupancy_assemble(self):
+        """
+        Test that occupancy grids stay boolean when assembled with failed
+        molecules.
+        """
+        grids = np.zeros((2, 3, 3, 3), dtype=bool)
+        features = self.engine._assemble(None, [grids, None])
+        assert features.data.dtype == bool
+        assert np.array_equal(features.lengths, [2, 1])
+        features = features.densify()
+        assert features.dtype == bool
+        assert np.ma.getmaskarray(features)[1].all()
 
     def test_embed_mol_in_grid(self):
         """
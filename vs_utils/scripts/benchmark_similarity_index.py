@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+Benchmark FingerprintIndex threshold queries against brute-force search.
+
+A synthetic library of bit-packed fingerprints is generated with a spread of
+bit densities similar to folded Morgan fingerprints. Queries are library
+fingerprints with a few bits flipped, so every query has hits. Both methods
+must return the same hits.
+"""
+
+__author__ = "Steven Kearnes"
+__copyright__ = "Copyright 2014, Stanford University"
+__license__ = "BSD 3-clause"
+
+import argparse
+import numpy as np
+import os
+import shutil
+import tempfile
+import time
+
+from vs_utils.similarity import TanimotoSearch
+from vs_utils.similarity.index import FingerprintIndex
+from vs_utils.utils.array_utils import pack_bits
+
+
+def parse_args(input_args=None):
+    """
+    Parse command-line arguments.
+
+    Parameters
+    ----------
+    input_args : list, optional
+        Input arguments. If not provided, defaults to sys.argv[1:].
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--n-fingerprints', type=int, default=1000000,
+                        help='Number of library fingerprints.')
+    parser.add_argument('-b', '--n-bits', type=int, default=2048,
+                        help='Fingerprint length.')
+    parser.add_argument('-q', '--n-queries', type=int, default=20,
+                        help='Number of queries.')
+    parser.add_argument('-t', '--threshold', type=float, action='append',
+                        help='Similarity threshold (can be repeated). ' +
+                             'Defaults to 0.5, 0.7, and 0.9.')
+    parser.add_argument('-p', '--partitions', type=int, default=8,
+                        help='Number of bit partitions for the index.')
+    parser.add_argument('-s', '--seed', type=int, default=0,
+                        help='Random seed.')
+    return parser.parse_args(input_args)
+
+
+def generate_fingerprints(filename, n_fingerprints, n_bits, seed=None,
+                          block_size=2000):
+    """
+    Write synthetic bit-packed fingerprints to a .npy file.
+
+    Parameters
+    ----------
+    filename : str
+        Output filename.
+    n_fingerprints : int
+        Number of fingerprints.
+    n_bits : int
+        Fingerprint length.
+    seed : int, optional
+        Random seed.
+    block_size : int, optional (default 2000)
+        Number of fingerprints generated at a time.
+    """
+    rng = np.random.RandomState(seed)
+    fps = np.lib.format.open_memmap(filename, mode='w+', dtype=np.uint8,
+                                    shape=(n_fingerprints, n_bits // 8))
+    for start in xrange(0, n_fingerprints, block_size):
+        n = min(block_size, n_fingerprints - start)
+        density = rng.lognormal(np.log(0.02), 0.5, size=(n, 1))
+        fps[start:start + n] = pack_bits(rng.rand(n, n_bits) < density)
+    del fps  # flush to disk
+
+
+def get_queries(library, n_queries, n_flips=4, seed=None):
+    """
+    Perturb random library fingerprints to use as queries.
+
+    Parameters
+    ----------
+    library : ndarray
+        Bit-packed library fingerprints.
+    n_queries : int
+        Number of queries.
+    n_flips : int, optional (default 4)
+        Number of bits flipped in each query.
+    seed : int, optional
+        Random seed.
+    """
+    rng = np.random.RandomState(seed)
+    rows = np.sort(rng.choice(len(library), n_queries, replace=False))
+    queries = np.array(library[rows])
+    n_bits = 8 * queries.shape[1]
+    for query in queries:
+        flips = rng.choice(n_bits, n_flips, replace=False)
+        query[flips // 8] ^= (128 >> (flips % 8)).astype(np.uint8)
+    return queries
+
+
+def main(n_fingerprints=1000000, n_bits=2048, n_queries=20,
+         thresholds=(0.5, 0.7, 0.9), n_partitions=8, seed=0):
+    """
+    Compare index and brute-force threshold queries.
+
+    Parameters
+    ----------
+    n_fingerprints : int, optional (default 1000000)
+        Number of library fingerprints.
+    n_bits : int, optional (default 2048)
+        Fingerprint length.
+    n_queries : int, optional (default 20)
+        Number of queries.
+    thresholds : iterable, optional (default (0.5, 0.7, 0.9))
+        Similarity thresholds.
+    n_partitions : int, optional (default 8)
+        Number of bit partitions for the index.
+    seed : int, optional (default 0)
+        Random seed.
+    """
+    temp_dir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(temp_dir, 'library.npy')
+        start = time.time()
+        generate_fingerprints(filename, n_fingerprints, n_bits, seed)
+        print 'Generated {} fingerprints in {:.1f} s'.format(
+            n_fingerprints, time.time() - start)
+        engine = TanimotoSearch(filename)
+        queries = get_queries(engine.library, n_queries, seed=seed)
+        indexes = []
+        for partitions in sorted(set([0, n_partitions])):
+            start = time.time()
+            index = FingerprintIndex.build(
+                filename, os.path.join(temp_dir, 'index-{}'.format(partitions)),
+                n_partitions=partitions)
+            print 'Built index with {} partitions in {:.1f} s'.format(
+                partitions, time.time() - start)
+            indexes.append((partitions, index))
+
+        for threshold in thresholds:
+            print '\nThreshold {}:'.format(threshold)
+            start = time.time()
+            expected = engine.search(queries, threshold=threshold)
+            brute = time.time() - start
+            print '    brute force: {:.3f} s/query'.format(brute / n_queries)
+            for partitions, index in indexes:
+                start = time.time()
+                hits = index.search(queries, threshold=threshold)
+                seconds = time.time() - start
+                for (a, _), (b, _) in zip(hits, expected):
+                    assert np.array_equal(np.sort(a), np.sort(b))
+                visited = np.mean([len(index.get_candidates(query, threshold))
+                                   for query in queries])
+                print ('    index ({} partitions): {:.3f} s/query, ' +
+                       '{:.2%} of library visited, {:.1f}x speedup').format(
+                           partitions, seconds / n_queries,
+                           visited / n_fingerprints, brute / seconds)
+    finally:
+        shutil.rmtree(temp_dir)
+
+if __name__ == '__main__':
+    args = parse_args()
+    thresholds = args.threshold
+    if thresholds is None:
+        thresholds = [0.5, 0.7, 0.9]
+    main(args.n_fingerprints, args.n_bits, args.n_queries, thresholds,
+         args.partitions, args.seed)
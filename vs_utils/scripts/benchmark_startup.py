@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Benchmark startup time for featurize.py.
+
+Each trial runs a fresh Python process that imports featurize.py and parses
+the command line for a featurizer subcommand (without featurizing anything).
+The 'lazy' mode uses the featurizer registry, so only the selected
+featurizer module is imported. The 'eager' mode additionally imports every
+registered featurizer, which is what building the subcommands required
+before the registry was added.
+"""
+
+__author__ = "Steven Kearnes"
+__copyright__ = "Copyright 2014, Stanford University"
+__license__ = "BSD 3-clause"
+
+import argparse
+import numpy as np
+import subprocess
+import sys
+
+# modules that are expensive to import and not needed for most featurizers
+HEAVY_MODULES = ['PIL', 'rdkit.Chem.Draw', 'scipy',
+                 'vs_utils.utils.amber_utils', 'vs_utils.utils.dragon_utils',
+                 'vs_utils.features.gridmol']
+
+TRIAL = """
+import sys
+import time
+start = time.time()
+from vs_utils.scripts.featurize import parse_args
+parse_args(['input.sdf', 'output.pkl'] + {args!r})
+if {eager!r}:
+    from vs_utils.features import get_featurizers
+    get_featurizers()
+print time.time() - start
+print ','.join([name for name in {modules!r} if name in sys.modules])
+"""
+
+
+def parse_args(input_args=None):
+    """
+    Parse command-line arguments.
+
+    Parameters
+    ----------
+    input_args : list, optional
+        Input arguments. If not provided, defaults to sys.argv[1:].
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--n-trials', type=int, default=10,
+                        help='Number of trials for each mode.')
+    parser.add_argument('featurizer_args', nargs='*', default=['circular'],
+                        help='featurize.py subcommand and arguments.')
+    return parser.parse_args(input_args)
+
+
+def run_trial(featurizer_args, eager=False):
+    """
+    Time featurize.py startup in a new process.
+
+    Parameters
+    ----------
+    featurizer_args : list
+        featurize.py subcommand and arguments.
+    eager : bool, optional (default False)
+        Whether to import all featurizers.
+
+    Returns
+    -------
+    seconds : float
+        Startup time, in seconds.
+    modules : list
+        Heavy modules that were imported.
+    """
+    code = TRIAL.format(args=list(featurizer_args), eager=eager,
+                        modules=HEAVY_MODULES)
+    output = subprocess.check_output([sys.executable, '-c', code])
+    seconds, modules = output.strip('\n').split('\n')[-2:]
+    return float(seconds), [name for name in modules.split(',') if name]
+
+
+def main(featurizer_args, n_trials=10):
+    """
+    Compare lazy and eager featurize.py startup times.
+
+    Parameters
+    ----------
+    featurizer_args : list
+        featurize.py subcommand and arguments.
+    n_trials : int, optional (default 10)
+        Number of trials for each mode.
+    """
+    results = {}
+    for mode in ['lazy', 'eager']:
+        times = []
+        for _ in xrange(n_trials):
+            seconds, modules = run_trial(featurizer_args, mode == 'eager')
+            times.append(seconds)
+        results[mode] = np.median(times)
+        print '{}: median {:.3f} s over {} trials'.format(
+            mode, results[mode], n_trials)
+        print '    heavy modules imported: {}'.format(
+            ', '.join(modules) if modules else 'none')
+    print 'Startup time reduction: {:.3f} s ({:.0%})'.format(
+        results['eager'] - results['lazy'],
+        1 - results['lazy'] / results['eager'])
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args.featurizer_args, args.n_trials)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+Build a fingerprint index for Tanimoto threshold queries.
+
+Input is either a .npy file containing bit-packed fingerprints (e.g.
+CircularFingerprint features written with dtype='packed') or featurize.py
+output with a 'features' column.
+"""
+
+__author__ = "Steven Kearnes"
+__copyright__ = "Copyright 2014, Stanford University"
+__license__ = "BSD 3-clause"
+
+import argparse
+import numpy as np
+
+from vs_utils.similarity.index import FingerprintIndex
+from vs_utils.utils import read_pickle
+from vs_utils.utils.array_utils import pack_bits
+
+
+def parse_args(input_args=None):
+    """
+    Parse command-line arguments.
+
+    Parameters
+    ----------
+    input_args : list, optional
+        Input arguments. If not provided, defaults to sys.argv[1:].
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input',
+                        help='Input filename (.npy or featurize.py output).')
+    parser.add_argument('output',
+                        help='Index directory.')
+    parser.add_argument('-p', '--partitions', type=int, default=0,
+                        help='Number of bit partitions used to prune ' +
+                             'candidates.')
+    parser.add_argument('--packed', action='store_true',
+                        help='Features in featurize.py output are already ' +
+                             'bit-packed.')
+    return parser.parse_args(input_args)
+
+
+def read_fingerprints(input_filename, packed=False):
+    """
+    Read bit-packed fingerprints.
+
+    Parameters
+    ----------
+    input_filename : str
+        Input filename. .npy files are memory-mapped and must contain
+        bit-packed fingerprints.
+    packed : bool, optional (default False)
+        Whether features in featurize.py output are already bit-packed.
+    """
+    if input_filename.endswith('.npy'):
+        return input_filename  # memory-mapped by FingerprintIndex.build
+    df = read_pickle(input_filename)
+    fps = np.vstack(df['features'].values)
+    if packed:
+        return fps.astype(np.uint8)
+    return pack_bits(fps)
+
+
+def main(input_filename, output_dir, n_partitions=0, packed=False):
+    """
+    Build a fingerprint index.
+
+    Parameters
+    ----------
+    input_filename : str
+        Input filename.
+    output_dir : str
+        Index directory.
+    n_partitions : int, optional (default 0)
+        Number of bit partitions used to prune candidates.
+    packed : bool, optional (default False)
+        Whether features in featurize.py output are already bit-packed.
+    """
+    fps = read_fingerprints(input_filename, packed)
+    index = FingerprintIndex.build(fps, output_dir, n_partitions=n_partitions)
+    print 'Indexed {} fingerprints in {}.'.format(len(index), output_dir)
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args.input, args.output, args.partitions, args.packed)
@@ -2,6 +2,13 @@
 """
 Featurize molecules and save features to disk. Featurizers are exposed as
 subcommands, with __init__ arguments as subcommand arguments.
+
+The pipeline subcommand calculates features for several featurizers in a
+single pass. Each featurizer is given as a spec of the form
+name[:arg=value,...], for example:
+
+    featurize.py mols.sdf.gz features.pkl.gz pipeline circular:size=1024 \
+        shape:size=40,hydrogens=true esp
 """
 
 __author__ = "Steven Kearnes"
@@ -9,14 +16,19 @@ __copyright__ = "Copyright 2014, Stanford University"
 __license__ = "BSD 3-clause"
 
 import argparse
-import inspect
+import collections
+import gzip
 import joblib
 import numpy as np
+import os
 import pandas as pd
 
-from vs_utils.features import get_featurizers
+from vs_utils.features import (FEATURIZERS, FeaturizerPipeline,
+                               resolve_featurizer)
 from vs_utils.utils import (read_pickle, ScaffoldGenerator, SmilesGenerator,
                             write_dataframe)
+from vs_utils.utils.array_utils import SparseFeatures
+from vs_utils.utils.cache_utils import FeatureCache
 from vs_utils.utils.parallel_utils import LocalCluster
 from vs_utils.utils.rdkit_utils import serial
 
@@ -51,6 +63,33 @@ def parse_args(input_args=None):
     parser.add_argument('-np', '--n-engines', type=int,
                         help='Start a local IPython.parallel cluster with ' +
                              'this many engines.')
+    parser.add_argument('-j', '--n-jobs', type=int,
+                        help='Featurize with a pool of this many local ' +
+                             'processes.')
+    parser.add_argument('--chunk-size', type=int, default=100,
+                        help='Number of molecules sent to a worker process ' +
+                             '(or written to a streamed output file) at a ' +
+                             'time.')
+    parser.add_argument('--timeout', type=float,
+                        help='Time limit (in seconds) for featurizing each ' +
+                             'molecule. Molecules that fail or exceed the ' +
+                             'limit are recorded with masked features and ' +
+                             'an error message.')
+    parser.add_argument('--max-tasks-per-child', type=int,
+                        help='Replace each worker process after it has ' +
+                             'featurized this many chunks.')
+    parser.add_argument('--dtype',
+                        choices=['float32', 'float64', 'uint8', 'bool',
+                                 'packed'],
+                        help='Output data type for features. Packed ' +
+                             'features have binary values packed into ' +
+                             'uint8 bytes.')
+    parser.add_argument('--cache-dir',
+                        help='Directory for a persistent feature cache.')
+    parser.add_argument('--stream', action='store_true',
+                        help='Read, featurize, and write molecules one ' +
+                             'chunk at a time (requires .csv or .csv.gz ' +
+                             'output).')
     parser.add_argument('output',
                         help=('Output filename (.joblib, .pkl, .pkl.gz, .csv, '
                               'or .csv.gz).'))
@@ -61,27 +100,22 @@ def parse_args(input_args=None):
                         help='Prefix for molecule IDs.')
 
     # featurizer subcommands
-    featurizers = get_featurizers()
+    # featurizer classes are not imported until one is selected
     subparsers = parser.add_subparsers(title='featurizers')
-    for name, klass in featurizers.items():
-        command = subparsers.add_parser(name, help=klass.__doc__,
+    for name, info in FEATURIZERS.items():
+        command = subparsers.add_parser(name, help=info.description,
                                         formatter_class=HelpFormatter,
-                                        epilog=klass.__doc__)
-        command.set_defaults(klass=klass)
-        try:
-            args, _, _, defaults = inspect.getargspec(klass.__init__)
-        except TypeError:
-            args = []
-        for i, arg in enumerate(args):
-            if i == 0 and arg == 'self':
-                continue
+                                        epilog=info.description)
+        command.set_defaults(featurizer=name)
+        n_required = len(info.args) - len(info.defaults)
+        for i, arg in enumerate(info.args):
             kwargs = {}
-            try:
-                kwargs['default'] = defaults[i - len(args)]
+            if i < n_required:
+                kwargs['required'] = True
+            else:
+                kwargs['default'] = info.defaults[i - n_required]
                 if kwargs['default'] is not None:
                     kwargs['type'] = type(kwargs['default'])
-            except IndexError:
-                kwargs['required'] = True
             if 'type' in kwargs and kwargs['type'] == bool:
                 if kwargs['default']:
                     command.add_argument('--no-{}'.format(arg), dest=arg,
@@ -91,17 +125,73 @@ def parse_args(input_args=None):
                                          action='store_true')
             else:
                 command.add_argument('--{}'.format(arg), **kwargs)
+
+    # multiple featurizers
+    command = subparsers.add_parser(
+        'pipeline', help=FeaturizerPipeline.__doc__,
+        formatter_class=HelpFormatter, epilog=FeaturizerPipeline.__doc__)
+    command.set_defaults(featurizer='pipeline')
+    command.add_argument('featurizers', nargs='+', type=parse_featurizer_spec,
+                         metavar='name[:arg=value,...]',
+                         help='Featurizer specs.')
     args = argparse.Namespace()
     args.featurizer_kwargs = parser.parse_args(input_args)
-    for arg in ['input', 'output', 'klass', 'targets', 'parallel',
-                'cluster_id', 'n_engines', 'compression_level',
+    for arg in ['input', 'output', 'featurizer', 'targets', 'parallel',
+                'cluster_id', 'n_engines', 'n_jobs', 'chunk_size', 'stream',
+                'cache_dir', 'timeout', 'max_tasks_per_child', 'dtype',
+                'compression_level',
                 'smiles_hydrogens', 'include_smiles', 'scaffolds',
                 'chiral_scaffolds', 'mol_prefix']:
         setattr(args, arg, getattr(args.featurizer_kwargs, arg))
         delattr(args.featurizer_kwargs, arg)
+    if args.featurizer == 'pipeline':
+        args.klass = FeaturizerPipeline
+    else:
+        args.klass = resolve_featurizer(args.featurizer)
     return args
 
 
+def parse_featurizer_spec(spec):
+    """
+    Construct a featurizer from a spec of the form name[:arg=value,...].
+
+    Argument values are converted to the type of the corresponding __init__
+    default value (if it is not None). Boolean values can be given as
+    true/false, yes/no, or 1/0.
+
+    Parameters
+    ----------
+    spec : str
+        Featurizer spec.
+    """
+    name, _, arg_string = spec.partition(':')
+    if name not in FEATURIZERS:
+        raise argparse.ArgumentTypeError(
+            "Unrecognized featurizer '{}'.".format(name))
+    info = FEATURIZERS[name]
+    defaults = dict(zip(info.args[len(info.args) - len(info.defaults):],
+                        info.defaults))
+    kwargs = {}
+    for item in arg_string.split(','):
+        if not item:
+            continue
+        key, sep, value = item.partition('=')
+        if not sep or key not in info.args:
+            raise argparse.ArgumentTypeError(
+                "Invalid argument '{}' for featurizer '{}'.".format(item,
+                                                                   name))
+        default = defaults.get(key)
+        if isinstance(default, bool):
+            if value.lower() not in ['true', 'false', 'yes', 'no', '1', '0']:
+                raise argparse.ArgumentTypeError(
+                    "Invalid boolean value '{}'.".format(value))
+            value = value.lower() in ['true', 'yes', '1']
+        elif default is not None:
+            value = type(default)(value)
+        kwargs[key] = value
+    return resolve_featurizer(name)(**kwargs)
+
+
 class HelpFormatter(argparse.RawTextHelpFormatter):
     """
     Argparse help formatter with better indenting.
@@ -120,14 +210,18 @@ def main(featurizer_class, input_filename, output_filename,
          target_filename=None, featurizer_kwargs=None, parallel=False,
          client_kwargs=None, view_flags=None, compression_level=3,
          smiles_hydrogens=False, include_smiles=False, scaffolds=False,
-         chiral_scaffolds=False, mol_id_prefix=None):
+         chiral_scaffolds=False, mol_id_prefix=None, backend=None,
+         n_jobs=None, chunk_size=100, stream=False, cache_dir=None,
+         timeout=None, max_tasks_per_child=None, dtype=None):
     """
     Featurize molecules in input_filename using the given featurizer.
 
     Parameters
     ----------
-    featurizer_class : Featurizer
-        Featurizer class.
+    featurizer_class : Featurizer or FeaturizerPipeline
+        Featurizer class. If FeaturizerPipeline, features for each
+        featurizer in the pipeline are written to separate columns named
+        features_<name>.
     input_filename : str
         Filename containing molecules to be featurized.
     output_filename : str
@@ -157,7 +251,53 @@ def main(featurizer_class, input_filename, output_filename,
         Whether to include chirality in scaffolds.
     mol_id_prefix : str, optional
         Prefix for molecule IDs.
+    backend : str, optional
+        Featurization backend ('serial', 'ipython', or 'process'). See
+        Featurizer.featurize.
+    n_jobs : int, optional
+        Number of worker processes for the 'process' backend.
+    chunk_size : int, optional (default 100)
+        Number of molecules sent to a worker process at a time. When
+        streaming, this is also the number of molecules written at a time.
+    stream : bool, optional (default False)
+        Whether to featurize and write molecules one chunk at a time. See
+        stream_features.
+    cache_dir : str, optional
+        Directory for a persistent feature cache. Molecules that have
+        already been featurized with the same featurizer parameters are
+        read from the cache.
+    timeout : float, optional
+        Time limit, in seconds, for featurizing each molecule. If provided,
+        molecules that fail featurization or exceed the limit get masked
+        features, and the reason for each failure is written to an error
+        column (or, for a pipeline, an error_<name> column for each
+        featurizer).
+    max_tasks_per_child : int, optional
+        Number of chunks featurized by each worker process before it is
+        replaced.
+    dtype : str, optional
+        Output data type for features (see Featurizer.featurize).
     """
+    if featurizer_kwargs is None:
+        featurizer_kwargs = {}
+    cache = None
+    if cache_dir is not None:
+        cache = FeatureCache(cache_dir)
+    pipeline = issubclass(featurizer_class, FeaturizerPipeline)
+    if pipeline:
+        assert not parallel, 'Pipelines do not support IPython.parallel.'
+    if stream:
+        assert not parallel, 'Streaming does not support IPython.parallel.'
+        assert timeout is None and max_tasks_per_child is None, (
+            'Streaming does not support timeouts or worker recycling.')
+        featurizer = featurizer_class(**featurizer_kwargs)
+        stream_features(featurizer, input_filename, output_filename,
+                        target_filename, chunk_size, backend or 'serial',
+                        n_jobs, smiles_hydrogens, include_smiles, scaffolds,
+                        chiral_scaffolds, mol_id_prefix, cache, dtype)
+        report_cache(cache)
+        return
+
     mols, mol_ids = read_mols(input_filename, mol_id_prefix=mol_id_prefix)
 
     # get targets
@@ -176,22 +316,45 @@ def main(featurizer_class, input_filename, output_filename,
 
     # featurize molecules
     print "Featurizing molecules..."
-    if featurizer_kwargs is None:
-        featurizer_kwargs = {}
     featurizer = featurizer_class(**featurizer_kwargs)
-    features = featurizer.featurize(mols, parallel, client_kwargs, view_flags)
+    failures = None
+    if timeout is not None:
+        failures = {}
+    if pipeline:
+        features = featurizer.featurize(
+            mols, backend or 'serial', n_jobs, chunk_size, dtype=dtype,
+            timeout=timeout, max_tasks_per_child=max_tasks_per_child,
+            failures=failures, cache=cache)
+    else:
+        features = featurizer.featurize(
+            mols, parallel, client_kwargs, view_flags, backend=backend,
+            n_jobs=n_jobs, chunk_size=chunk_size, cache=cache,
+            timeout=timeout, max_tasks_per_child=max_tasks_per_child,
+            failures=failures, dtype=dtype)
+    report_cache(cache)
+    if failures is not None:
+        failed = failures
+        if pipeline:  # failures for each featurizer
+            failed = set().union(*failures.values())
+        print "%d molecules failed featurization." % len(failed)
 
     # fill in data container
     print "Saving results..."
     data['mol_id'] = mol_ids
-    data['features'] = features
+    features = get_feature_columns(features)
+    data.update(features)
 
     # sanity checks
-    assert data['features'].shape[0] == len(mols), (
-        "Features do not match molecules.")
+    for column in features:
+        assert data[column].shape[0] == len(mols), (
+            "Features do not match molecules.")
     assert data['mol_id'].shape[0] == len(mols), (
         "Molecule IDs do not match molecules.")
 
+    # failures
+    if failures is not None:
+        data.update(get_error_columns(failures, len(mols), pipeline))
+
     # smiles, scaffolds, args
     if include_smiles:
         smiles = SmilesGenerator(remove_hydrogens=(not smiles_hydrogens))
@@ -200,23 +363,269 @@ def main(featurizer_class, input_filename, output_filename,
         data['scaffolds'] = get_scaffolds(mols, chiral_scaffolds)
 
     # construct a DataFrame
+    for column in features:
+        if isinstance(data[column], SparseFeatures):
+            write_vocabulary(data[column], column, output_filename,
+                             compression_level)
+        data[column] = format_features(data[column], output_filename)
+    df = pd.DataFrame(data)
+
+    # write output file
+    write_output_file(df, output_filename, compression_level)
+
+
+def stream_features(featurizer, input_filename, output_filename,
+                    target_filename=None, chunk_size=1000, backend='serial',
+                    n_jobs=None, smiles_hydrogens=False, include_smiles=False,
+                    scaffolds=False, chiral_scaffolds=False,
+                    mol_id_prefix=None, cache=None, dtype=None):
+    """
+    Featurize molecules one chunk at a time and append each chunk to a CSV
+    output file.
+
+    Memory usage depends on chunk_size rather than the number of molecules in
+    the input file. Unlike main, molecules are written in input order, and
+    molecules without targets are skipped rather than collated.
+
+    Parameters
+    ----------
+    featurizer : Featurizer or FeaturizerPipeline
+        Featurizer.
+    input_filename : str
+        Filename containing molecules to be featurized.
+    output_filename : str
+        Output filename. Should end with .csv or .csv.gz.
+    target_filename : str, optional
+        Pickle containing target values. Should be a dict containing
+        'mol_id' and 'y' keys, corresponding to molecule names and target
+        values.
+    chunk_size : int, optional (default 1000)
+        Number of molecules per chunk.
+    backend : str, optional (default 'serial')
+        Featurization backend ('serial' or 'process').
+    n_jobs : int, optional
+        Number of worker processes for the 'process' backend.
+    smiles_hydrogens : bool, optional (default False)
+        Whether to keep hydrogens when generating SMILES.
+    include_smiles : bool, optional (default False)
+        Include SMILES in output.
+    scaffolds : bool, optional (default False)
+        Whether to include scaffolds in output.
+    chiral_scaffods : bool, optional (default False)
+        Whether to include chirality in scaffolds.
+    mol_id_prefix : str, optional
+        Prefix for molecule IDs.
+    cache : FeatureCache, optional
+        Feature cache.
+    dtype : str, optional
+        Output data type for features.
+    """
+    if not output_filename.endswith(('.csv', '.csv.gz')):
+        raise NotImplementedError(
+            'Streaming output requires a .csv or .csv.gz file.')
+    target_map = None
+    if target_filename is not None:
+        targets = read_pickle(target_filename)
+        if not isinstance(targets, dict):
+            raise ValueError("Streaming requires targets to be a dict " +
+                             "with 'mol_id' and 'y' keys.")
+        target_map = dict(zip([str(mol_id) for mol_id in targets['mol_id']],
+                              targets['y']))
+    smiles_engine = SmilesGenerator(remove_hydrogens=(not smiles_hydrogens))
+    scaffold_engine = ScaffoldGenerator(include_chirality=chiral_scaffolds)
+
+    # per-molecule output values, consumed in order as features arrive
+    records = collections.deque()
+
+    def get_mols():
+        """
+        Read molecules and record output values for each one.
+        """
+        for mol_id, mol in iter_mols(input_filename, mol_id_prefix):
+            record = {'mol_id': mol_id}
+            if target_map is not None:
+                if str(mol_id) not in target_map:
+                    continue
+                record['y'] = target_map[str(mol_id)]
+            if include_smiles:
+                record['smiles'] = smiles_engine.get_smiles(mol)
+            if scaffolds:
+                record['scaffolds'] = scaffold_engine.get_scaffold(mol)
+            records.append(record)
+            yield mol
+
+    print "Featurizing molecules..."
+    if output_filename.endswith('.gz'):
+        f = gzip.open(output_filename, 'wb')
+    else:
+        f = open(output_filename, 'wb')
+    n_mols = 0
+    with f:
+        for _, features in featurizer.featurize_iter(
+                get_mols(), chunk_size, backend, n_jobs, cache,
+                dtype=dtype):
+            features = get_feature_columns(features)
+            n_chunk = len(features.values()[0])
+            df = pd.DataFrame([records.popleft() for _ in xrange(n_chunk)])
+            for column, values in features.items():
+                df[column] = format_features(values, output_filename)
+            df.to_csv(f, header=(n_mols == 0), index=False)
+            n_mols += len(df)
+    print "%d molecules featurized." % n_mols
+
+
+def report_cache(cache):
+    """
+    Print feature cache statistics.
+
+    Parameters
+    ----------
+    cache : FeatureCache
+        Feature cache. Nothing is printed if cache is None.
+    """
+    if cache is None:
+        return
+    print "Feature cache: {} hits, {} misses.".format(cache.hits,
+                                                       cache.misses)
+
+
+def get_feature_columns(features):
+    """
+    Get output columns for features.
+
+    Parameters
+    ----------
+    features : array_like or dict
+        Feature matrix, or a dict mapping featurizer names to feature
+        matrices (see FeaturizerPipeline).
+
+    Returns
+    -------
+    An OrderedDict mapping column names to feature matrices. A single
+    feature matrix is stored in the 'features' column; otherwise, the
+    features for each featurizer are stored in a features_<name> column.
+    """
+    columns = collections.OrderedDict()
+    if isinstance(features, dict):
+        for name, value in features.items():
+            columns['features_{}'.format(name)] = value
+    else:
+        columns['features'] = features
+    return columns
+
+
+def get_error_columns(failures, n_mols, pipeline=False):
+    """
+    Get output columns for featurization failures.
+
+    Parameters
+    ----------
+    failures : dict
+        Mapping from molecule index to the reason for the failure, or (for
+        a pipeline) a dict mapping featurizer names to such mappings.
+    n_mols : int
+        Number of molecules.
+    pipeline : bool, optional (default False)
+        Whether failures are for a FeaturizerPipeline.
+
+    Returns
+    -------
+    An OrderedDict mapping column names to the reason for the failure of
+    each molecule (None for molecules that did not fail). Failures for a
+    single featurizer are stored in the 'error' column; otherwise, the
+    failures for each featurizer are stored in an error_<name> column.
+    """
+    if not pipeline:
+        failures = {None: failures}
+    columns = collections.OrderedDict()
+    for name, featurizer_failures in sorted(failures.items()):
+        column = 'error' if name is None else 'error_{}'.format(name)
+        columns[column] = np.asarray([featurizer_failures.get(i)
+                                      for i in xrange(n_mols)])
+    return columns
+
+
+def format_features(features, output_filename):
+    """
+    Convert a feature matrix to a list of per-molecule rows for output.
+
+    Rows of SparseFeatures are written as one-row CSR matrices (with
+    columns from the vocabulary written by write_vocabulary), or for CSV
+    output, as space-separated key:value pairs.
+
+    Parameters
+    ----------
+    features : array_like or SparseFeatures
+        Feature matrix.
+    output_filename : str
+        Output filename.
+    """
+    if isinstance(features, SparseFeatures):
+        if output_filename.endswith(('.csv', '.csv.gz')):
+            return [' '.join(['{}:{}'.format(key, value) for key, value in
+                              zip(row.keys, row.matrix.data)])
+                    for row in features]
+        return [features.matrix[i] for i in xrange(len(features))]
     try:
-        if data['features'].ndim > 1:
+        if features.ndim > 1:
             # numpy arrays will be "summarized" when written as strings
             # use str(row.tolist())[1:-1] to remove the surrounding brackets
             # remove commas (keeping spaces) to avoid conflicts with csv
             if (output_filename.endswith('.csv')
                     or output_filename.endswith('.csv.gz')):
-                data['features'] = [str(row.tolist())[1:-1].replace(', ', ' ')
-                                    for row in data['features']]
+                features = [str(row.tolist())[1:-1].replace(', ', ' ')
+                            for row in features]
             else:
-                data['features'] = [row for row in data['features']]
+                features = [row for row in features]
     except AttributeError:
         pass
-    df = pd.DataFrame(data)
+    return features
+
+
+def get_vocabulary_filename(output_filename, column):
+    """
+    Get the filename for the vocabulary of a sparse feature column.
+
+    For example, the vocabulary for the 'features' column of output.pkl.gz
+    is written to output-features-vocabulary.pkl.gz.
+
+    Parameters
+    ----------
+    output_filename : str
+        Output filename.
+    column : str
+        Feature column name.
+    """
+    dirname, basename = os.path.split(output_filename)
+    prefix, dot, suffix = basename.partition('.')
+    return os.path.join(dirname, '{}-{}-vocabulary{}{}'.format(
+        prefix, column, dot, suffix))
 
-    # write output file
-    write_output_file(df, output_filename, compression_level)
+
+def write_vocabulary(features, column, output_filename, compression_level=3):
+    """
+    Write the vocabulary for sparse features. Row i of the vocabulary
+    describes column i of the sparse feature matrix, with the feature key
+    (e.g. fragment ID) in the 'key' column and labels (e.g. fragment SMILES),
+    if any, in the 'label' column.
+
+    Parameters
+    ----------
+    features : SparseFeatures
+        Sparse features.
+    column : str
+        Feature column name.
+    output_filename : str
+        Output filename.
+    compression_level : int, optional (default 3)
+        Compression level (0-9) to use with joblib.dump.
+    """
+    vocabulary = pd.DataFrame({'key': features.keys})
+    if features.labels is not None:
+        vocabulary['label'] = features.labels
+    filename = get_vocabulary_filename(output_filename, column)
+    write_output_file(vocabulary, filename, compression_level)
+    print "Vocabulary for {} written to {}.".format(column, filename)
 
 
 def collate_mols(mols, mol_names, targets, target_ids):
@@ -283,22 +692,44 @@ def read_mols(input_filename, mol_id_prefix=None, log_every_N=1000):
     print "Reading molecules..."
     mols = []
     names = []
+    for name, mol in iter_mols(input_filename, mol_id_prefix, log_every_N):
+      mols.append(mol)
+      names.append(name)
+    mols = np.asarray(mols)
+    names = np.asarray(names)
+    print "%d molecules read." % len(mols)
+    return mols, names
+
+
+def iter_mols(input_filename, mol_id_prefix=None, log_every_N=1000):
+    """
+    Read molecules from an input file one at a time.
+
+    Parameters
+    ----------
+    input_filename : str
+      Filename containing molecules.
+    mol_id_prefix : str, optional
+      Prefix for molecule IDs.
+    log_every_N: int
+      Print log statement every N molecules read.
+
+    Returns
+    -------
+    A generator yielding (name, mol) tuples. The name is None if the molecule
+    does not have a _Name property.
+    """
     with serial.MolReader().open(input_filename) as reader:
       for num, mol in enumerate(reader.get_mols()):
-        if num % 1000 == 0:
+        if num % log_every_N == 0:
           print "Reading molecule %d" % num
-        mols.append(mol)
         if mol.HasProp('_Name'):
           name = mol.GetProp('_Name')
           if mol_id_prefix is not None:
             name = mol_id_prefix + name
-          names.append(name)
         else:
-          names.append(None)
-    mols = np.asarray(mols)
-    names = np.asarray(names)
-    print "%d molecules read." % len(mols)
-    return mols, names
+          name = None
+        yield name, mol
 
 
 def get_scaffolds(mols, include_chirality=False):
@@ -355,6 +786,13 @@ if __name__ == '__main__':
         args.parallel = True
         args.cluster_id = cluster.cluster_id
 
+    # local process pool
+    backend = None
+    if args.n_jobs is not None:
+        assert not args.parallel, ('Use either IPython.parallel or a local ' +
+                                   'process pool, not both.')
+        backend = 'process'
+
     # cluster flags
     if args.cluster_id is not None:
         client_kwargs = {'cluster_id': args.cluster_id}
@@ -376,4 +814,12 @@ if __name__ == '__main__':
          include_smiles=args.include_smiles,
          scaffolds=args.scaffolds,
          chiral_scaffolds=args.chiral_scaffolds,
-         mol_id_prefix=args.mol_prefix)
+         mol_id_prefix=args.mol_prefix,
+         backend=backend,
+         n_jobs=args.n_jobs,
+         chunk_size=args.chunk_size,
+         stream=args.stream,
+         cache_dir=args.cache_dir,
+         timeout=args.timeout,
+         max_tasks_per_child=args.max_tasks_per_child,
+         dtype=args.dtype)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""
+Profile RDKit descriptor calculation.
+
+Each descriptor used by SimpleDescriptors is timed on a random sample of
+molecules, and descriptors are reported in order of decreasing cost. Use
+the report to choose include/exclude lists or a cost_budget for a project.
+"""
+
+__author__ = "Steven Kearnes"
+__copyright__ = "Copyright 2014, Stanford University"
+__license__ = "BSD 3-clause"
+
+import argparse
+import numpy as np
+import pandas as pd
+import time
+
+from vs_utils.features.basic import SimpleDescriptors
+from vs_utils.utils import write_dataframe
+from vs_utils.utils.rdkit_utils import serial
+
+
+def parse_args(input_args=None):
+    """
+    Parse command-line arguments.
+
+    Parameters
+    ----------
+    input_args : list, optional
+        Input arguments. If not provided, defaults to sys.argv[1:].
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input',
+                        help='Input molecules.')
+    parser.add_argument('-n', '--n-mols', type=int, default=1000,
+                        help='Number of molecules to sample.')
+    parser.add_argument('-s', '--seed', type=int, default=0,
+                        help='Random seed for sampling.')
+    parser.add_argument('--include',
+                        help='Descriptors to profile (comma-separated ' +
+                             'names or patterns).')
+    parser.add_argument('--exclude',
+                        help='Descriptors to skip.')
+    parser.add_argument('-o', '--output',
+                        help='Output filename for the report (.csv, ' +
+                             '.csv.gz, .pkl, or .pkl.gz).')
+    return parser.parse_args(input_args)
+
+
+def sample_mols(input_filename, n_mols, seed=None):
+    """
+    Draw a uniform random sample of molecules from a file (reservoir
+    sampling, so the file is only read once).
+
+    Parameters
+    ----------
+    input_filename : str
+        Filename containing molecules.
+    n_mols : int
+        Number of molecules to sample.
+    seed : int, optional
+        Random seed.
+    """
+    rng = np.random.RandomState(seed)
+    sample = []
+    with serial.MolReader().open(input_filename) as reader:
+        for i, mol in enumerate(reader.get_mols()):
+            if i < n_mols:
+                sample.append(mol)
+            else:
+                j = rng.randint(i + 1)
+                if j < n_mols:
+                    sample[j] = mol
+    return sample
+
+
+def profile_descriptors(mols, engine):
+    """
+    Time each descriptor on a set of molecules.
+
+    Parameters
+    ----------
+    mols : list
+        Molecules.
+    engine : SimpleDescriptors
+        Descriptor featurizer.
+
+    Returns
+    -------
+    A DataFrame with the total time (in seconds) for each descriptor,
+    sorted by decreasing time, and whether each descriptor is included
+    with cost_budget='fast'.
+    """
+    seconds = np.zeros(len(engine.functions))
+    for mol in mols:
+        for j, function in enumerate(engine.functions):
+            start = time.time()
+            function(mol)
+            seconds[j] += time.time() - start
+    report = pd.DataFrame({'descriptor': engine.descriptors,
+                           'seconds': seconds})
+    report = report.sort_values('seconds', ascending=False)
+    report['ms_per_mol'] = 1000 * report['seconds'] / max(len(mols), 1)
+    report['fraction'] = report['seconds'] / max(seconds.sum(), 1e-12)
+    report['cumulative'] = report['fraction'].cumsum()
+    fast = SimpleDescriptors(engine.include, engine.exclude, 'fast')
+    report['fast'] = report['descriptor'].isin(fast.descriptors)
+    return report.reset_index(drop=True)
+
+
+def main(input_filename, n_mols=1000, seed=0, include=None, exclude=None,
+         output_filename=None):
+    """
+    Profile descriptor calculation on a sample of molecules.
+
+    Parameters
+    ----------
+    input_filename : str
+        Filename containing molecules.
+    n_mols : int, optional (default 1000)
+        Number of molecules to sample.
+    seed : int, optional (default 0)
+        Random seed for sampling.
+    include : str, optional
+        Descriptors to profile.
+    exclude : str, optional
+        Descriptors to skip.
+    output_filename : str, optional
+        Output filename for the report.
+    """
+    mols = sample_mols(input_filename, n_mols, seed)
+    engine = SimpleDescriptors(include=include, exclude=exclude)
+    report = profile_descriptors(mols, engine)
+    total = report['seconds'].sum()
+    fast = report['seconds'][report['fast']].sum()
+    print '{} descriptors, {} molecules: {:.1f} ms/mol'.format(
+        len(report), len(mols), 1000 * total / max(len(mols), 1))
+    print "cost_budget='fast': {:.1f} ms/mol ({:.0%} of total)".format(
+        1000 * fast / max(len(mols), 1), fast / max(total, 1e-12))
+    print report.to_string(index=False)
+    if output_filename is not None:
+        write_dataframe(report, output_filename)
+    return report
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args.input, args.n_mols, args.seed, args.include, args.exclude,
+         args.output)
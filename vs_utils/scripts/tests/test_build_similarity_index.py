@@ -0,0 +1,66 @@
+"""
+Test build_similarity_index.py.
+"""
+import numpy as np
+import os
+import pandas as pd
+import shutil
+import tempfile
+import unittest
+
+from vs_utils.scripts.build_similarity_index import main
+from vs_utils.similarity.index import FingerprintIndex
+from vs_utils.utils import write_pickle
+from vs_utils.utils.array_utils import pack_bits
+
+
+class TestBuildSimilarityIndex(unittest.TestCase):
+    """
+    Test build_similarity_index.py.
+    """
+    def setUp(self):
+        """
+        Set up tests.
+        """
+        rng = np.random.RandomState(20141016)
+        self.bits = (rng.rand(10, 64) < 0.3).astype(np.uint8)
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """
+        Clean up tests.
+        """
+        shutil.rmtree(self.temp_dir)
+
+    def check_index(self, directory):
+        """
+        Check that an index contains the test fingerprints.
+
+        Parameters
+        ----------
+        directory : str
+            Index directory.
+        """
+        index = FingerprintIndex(directory)
+        assert np.array_equal(index.fingerprints,
+                              pack_bits(self.bits)[index.indices])
+
+    def test_npy(self):
+        """
+        Test .npy input.
+        """
+        filename = os.path.join(self.temp_dir, 'fps.npy')
+        np.save(filename, pack_bits(self.bits))
+        directory = os.path.join(self.temp_dir, 'index')
+        main(filename, directory, n_partitions=2)
+        self.check_index(directory)
+
+    def test_featurize_output(self):
+        """
+        Test featurize.py output.
+        """
+        filename = os.path.join(self.temp_dir, 'features.pkl.gz')
+        write_pickle(pd.DataFrame({'features': list(self.bits)}), filename)
+        directory = os.path.join(self.temp_dir, 'index')
+        main(filename, directory)
+        self.check_index(directory)
@@ -1,19 +1,48 @@
 """
 Test featurize.py.
 """
+import glob
+import os
 import shutil
 import tempfile
 import unittest
 import joblib
 import numpy as np
+from scipy import sparse
 from rdkit import Chem
 from rdkit.Chem import AllChem
 
+from vs_utils.features.dragon import DragonDescriptors
 from vs_utils.scripts.featurize import main, parse_args
-from vs_utils.utils import read_pickle, write_pickle
+from vs_utils.utils import read_csv_features, read_pickle, write_pickle
 from vs_utils.utils.rdkit_utils import conformers, serial
 
 
+class MockDragon(object):
+  """
+  Mock Dragon engine that uses atom counts as descriptors.
+  """
+  def get_descriptors(self, mols):
+    """
+    Calculate mock descriptors.
+
+    Parameters
+    ----------
+    mols : array_like
+        Molecules.
+    """
+    return np.asarray([[mol.GetNumAtoms()] for mol in mols], dtype=float)
+
+
+class MockDragonDescriptors(DragonDescriptors):
+  """
+  Dragon descriptors calculated with a mock Dragon engine.
+  """
+  def __init__(self, assign_stereo_from_3d=False):
+    super(MockDragonDescriptors, self).__init__(assign_stereo_from_3d)
+    self.engine = MockDragon()
+
+
 class TestFeaturize(unittest.TestCase):
   """
   Test featurize.py.
@@ -57,7 +86,7 @@ class TestFeaturize(unittest.TestCase):
     shutil.rmtree(self.temp_dir)
 
   def check_output(self, featurize_args, shape, targets=None, mol_ids=None,
-                   smiles=None, output_suffix='.pkl'):
+                   smiles=None, output_suffix='.pkl', featurizer_class=None):
     """
     Check features shape, targets, and mol_ids.
 
@@ -77,6 +106,9 @@ class TestFeaturize(unittest.TestCase):
         Expected SMILES. Defaults to self.smiles.
     output_suffix : str, optional (default '.pkl')
         Suffix for output files.
+    featurizer_class : Featurizer, optional
+        Featurizer class to use instead of the class chosen by the script
+        arguments.
     """
 
     # generate command-line arguments
@@ -87,7 +119,9 @@ class TestFeaturize(unittest.TestCase):
 
     # run script
     args = parse_args(input_args)
-    main(args.klass, args.input, args.output, target_filename=args.targets,
+    if featurizer_class is None:
+      featurizer_class = args.klass
+    main(featurizer_class, args.input, args.output, target_filename=args.targets,
          featurizer_kwargs=vars(args.featurizer_kwargs),
          include_smiles=True, scaffolds=args.scaffolds,
          chiral_scaffolds=args.chiral_scaffolds)
@@ -121,6 +155,38 @@ class TestFeaturize(unittest.TestCase):
     """
     self.check_output(['circular'], (2, 2048))
 
+  def test_stream(self):
+    """
+    Stream features to a CSV file.
+    """
+    _, output_filename = tempfile.mkstemp(suffix='.csv', dir=self.temp_dir)
+    targets = {'mol_id': ['ibuprofen', 'aspirin'], 'y': [1, 0]}
+    write_pickle(targets, self.targets_filename)
+    args = parse_args([self.input_filename, '-t', self.targets_filename,
+                       '--stream', '--chunk-size', '1', output_filename,
+                       'circular', '--size', '512'])
+    main(args.klass, args.input, args.output, target_filename=args.targets,
+         featurizer_kwargs=vars(args.featurizer_kwargs),
+         include_smiles=True, chunk_size=args.chunk_size, stream=args.stream)
+    data = read_csv_features(output_filename)
+    assert np.array_equal(data['mol_id'], self.mol_ids)  # input order
+    assert np.array_equal(data['y'], [0, 1])
+    assert np.array_equal(data['smiles'], self.smiles)
+    assert data.ix[0, 'features'].shape == (512,)
+
+  def test_pipeline(self):
+    """
+    Calculate features for several featurizers in one pass.
+    """
+    args = parse_args([self.input_filename, 'out.pkl', 'pipeline',
+                       'circular:size=512', 'mw'])
+    assert [f.size for f in args.featurizer_kwargs.featurizers[:1]] == [512]
+    data = self.check_output(['pipeline', 'circular:size=512,sparse=false',
+                              'mw'], (2,))
+    assert 'features' not in data
+    assert data.ix[0, 'features_circular'].shape == (512,)
+    assert data.ix[0, 'features_mw'].shape == (1,)
+
   def test_compressed_pickle(self):
     """
     Save features to a compressed pickle.
@@ -143,10 +209,16 @@ class TestFeaturize(unittest.TestCase):
     """
     Test sparse circular fingerprints.
     """
-    data = self.check_output(['circular', '--sparse'], (2,))
+    data = self.check_output(['circular', '--sparse', '--smiles'], (2,))
+    filenames = glob.glob(os.path.join(self.temp_dir,
+                                       '*-features-vocabulary.pkl'))
+    assert len(filenames) == 1
+    vocabulary = read_pickle(filenames[0])
     for value in data['features']:
-        assert isinstance(value, dict)
-        assert len(value)
+        assert sparse.isspmatrix_csr(value)
+        assert value.shape == (1, len(vocabulary))
+        assert value.nnz
+    assert np.all(vocabulary['label'].notnull())
 
   def test_coulomb_matrix(self):
     """
@@ -181,6 +253,13 @@ class TestFeaturize(unittest.TestCase):
     """
     self.check_output(['mw'], (2, 1))
 
+  def test_dragon(self):
+    """
+    Test a featurizer that overrides Featurizer.featurize.
+    """
+    self.check_output(['dragon'], (2, 1),
+                      featurizer_class=MockDragonDescriptors)
+
   def test_descriptors(self):
     """
     Test calculation of RDKit descriptors.
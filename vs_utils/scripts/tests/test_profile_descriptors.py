@@ -0,0 +1,47 @@
+"""
+Test profile_descriptors.py.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from rdkit import Chem
+
+from vs_utils.scripts.profile_descriptors import main
+from vs_utils.utils import read_pickle
+from vs_utils.utils.rdkit_utils import serial
+
+
+class TestProfileDescriptors(unittest.TestCase):
+    """
+    Test profile_descriptors.py.
+    """
+    def setUp(self):
+        """
+        Set up tests.
+        """
+        smiles = ['CC(=O)OC1=CC=CC=C1C(=O)O', 'CC(C)CC1=CC=C(C=C1)C(C)C(=O)O',
+                  'CC1=CC=C(C=C1)C2=CC(=NN2C3=CC=C(C=C3)S(=O)(=O)N)C(F)(F)F']
+        self.temp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.temp_dir, 'mols.sdf')
+        with serial.MolWriter().open(self.filename) as writer:
+            writer.write([Chem.MolFromSmiles(s) for s in smiles])
+
+    def tearDown(self):
+        """
+        Clean up tests.
+        """
+        shutil.rmtree(self.temp_dir)
+
+    def test_profile(self):
+        """
+        Profile a subset of descriptors on a sample of molecules.
+        """
+        output_filename = os.path.join(self.temp_dir, 'report.pkl')
+        report = main(self.filename, n_mols=2, include='MolWt,Ipc,fr_*',
+                      output_filename=output_filename)
+        assert 'MolWt' in report['descriptor'].values
+        assert (report['seconds'].diff().dropna() <= 0).all()
+        assert not report['fast'][report['descriptor'] == 'Ipc'].any()
+        assert len(read_pickle(output_filename)) == len(report)
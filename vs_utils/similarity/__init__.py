@@ -0,0 +1,394 @@
+"""
+Tanimoto similarity search over bit-packed fingerprints.
+
+Fingerprints are stored as uint8 matrices with shape (n_mols, n_bytes),
+e.g. CircularFingerprint output featurized with dtype='packed' (see
+vs_utils.utils.array_utils.pack_bits). Similarities are calculated with
+vectorized popcounts over blocks of library rows, so memory usage does not
+depend on the size of the library and memory-mapped libraries can be
+searched without loading them into memory.
+"""
+
+__author__ = "Steven Kearnes"
+__copyright__ = "Copyright 2014, Stanford University"
+__license__ = "BSD 3-clause"
+
+import functools
+import numpy as np
+
+from vs_utils.utils.parallel_utils import process_map
+
+# number of set bits in each byte value
+POPCOUNT_TABLE = np.array([bin(i).count('1') for i in xrange(256)],
+                          dtype=np.uint8)
+
+# number of set bits in each 16-bit value (halves the number of lookups)
+POPCOUNT_TABLE_16 = (POPCOUNT_TABLE[np.arange(2 ** 16) & 0xff] +
+                     POPCOUNT_TABLE[np.arange(2 ** 16) >> 8])
+
+# maximum size, in bytes, of intermediate (query, row, word) arrays
+MAX_BLOCK_BYTES = 2 ** 25
+
+
+def check_fingerprints(fps):
+    """
+    Check that fingerprints are a bit-packed matrix.
+
+    Parameters
+    ----------
+    fps : array_like
+        Bit-packed fingerprints with shape (n_mols, n_bytes).
+    """
+    if not isinstance(fps, np.ndarray):
+        fps = np.asarray(fps)
+    if fps.ndim == 1:
+        fps = fps[np.newaxis]
+    if fps.ndim != 2 or fps.dtype != np.uint8:
+        raise ValueError(
+            'Fingerprints must be a bit-packed uint8 matrix ' +
+            '(got {} array with shape {}).'.format(fps.dtype, fps.shape))
+    return fps
+
+
+def load_library(library):
+    """
+    Load bit-packed library fingerprints.
+
+    Parameters
+    ----------
+    library : array_like or str
+        Bit-packed fingerprints, or the filename of a .npy file containing
+        bit-packed fingerprints. Files are memory-mapped (read-only).
+    """
+    if isinstance(library, basestring):
+        library = np.load(library, mmap_mode='r')
+    return check_fingerprints(library)
+
+
+def popcount(fps):
+    """
+    Count the number of set bits in each fingerprint.
+
+    Parameters
+    ----------
+    fps : array_like
+        Bit-packed fingerprints.
+    """
+    return POPCOUNT_TABLE[np.asarray(fps)].sum(axis=-1, dtype=np.int32)
+
+
+def intersection_count(queries, fps):
+    """
+    Count the number of bits set in both a query and a library fingerprint
+    for each pair of fingerprints.
+
+    Bits are counted with a lookup table over 16-bit words (or bytes, if
+    the fingerprints have an odd number of bytes). Queries are processed in
+    groups so the intermediate (query, row, word) array is no larger than
+    MAX_BLOCK_BYTES.
+
+    Parameters
+    ----------
+    queries : ndarray
+        Bit-packed query fingerprints with shape (n_queries, n_bytes).
+    fps : ndarray
+        Bit-packed library fingerprints with shape (n_mols, n_bytes).
+
+    Returns
+    -------
+    An int32 array with shape (n_queries, n_mols).
+    """
+    table = POPCOUNT_TABLE
+    if queries.shape[1] % 2 == 0:
+        table = POPCOUNT_TABLE_16
+        queries = np.ascontiguousarray(queries).view(np.uint16)
+        fps = np.ascontiguousarray(fps).view(np.uint16)
+    counts = np.zeros((len(queries), len(fps)), dtype=np.int32)
+    step = max(1, MAX_BLOCK_BYTES // max(1, fps.nbytes))
+    for start in xrange(0, len(queries), step):
+        both = np.bitwise_and(queries[start:start + step, np.newaxis],
+                              fps[np.newaxis])
+        counts[start:start + step] = table[both].sum(axis=2)
+    return counts
+
+
+def tanimoto(queries, fps, query_counts=None, fps_counts=None):
+    """
+    Calculate Tanimoto similarities between query and library fingerprints.
+
+    The similarity between two empty fingerprints is defined as zero.
+
+    Parameters
+    ----------
+    queries : array_like
+        Bit-packed query fingerprints with shape (n_queries, n_bytes).
+    fps : array_like
+        Bit-packed library fingerprints with shape (n_mols, n_bytes).
+    query_counts : array_like, optional
+        Precomputed popcounts for the queries.
+    fps_counts : array_like, optional
+        Precomputed popcounts for the library fingerprints.
+
+    Returns
+    -------
+    A float array with shape (n_queries, n_mols).
+    """
+    queries = check_fingerprints(queries)
+    fps = check_fingerprints(fps)
+    if queries.shape[1] != fps.shape[1]:
+        raise ValueError('Query and library fingerprints have different ' +
+                         'lengths ({} != {} bytes).'.format(queries.shape[1],
+                                                            fps.shape[1]))
+    if query_counts is None:
+        query_counts = popcount(queries)
+    if fps_counts is None:
+        fps_counts = popcount(fps)
+    both = intersection_count(queries, fps)
+    union = (np.asarray(query_counts)[:, np.newaxis] +
+             np.asarray(fps_counts)[np.newaxis] - both)
+    return both / np.maximum(union, 1).astype(float)
+
+
+class TanimotoSearch(object):
+    """
+    Tanimoto similarity search against a library of bit-packed
+    fingerprints.
+
+    Parameters
+    ----------
+    library : array_like or str
+        Bit-packed library fingerprints with shape (n_mols, n_bytes), or
+        the filename of a .npy file containing them. Files are
+        memory-mapped, so only one block of the library is in memory at a
+        time.
+    block_size : int, optional (default 10000)
+        Number of library fingerprints compared to the queries at a time.
+    n_jobs : int, optional (default 1)
+        Number of worker processes. The library is split into contiguous
+        ranges that are searched in parallel. Workers memory-map the
+        library if it was given as a filename; otherwise, each worker gets
+        a copy of its part of the library.
+    """
+    def __init__(self, library, block_size=10000, n_jobs=1):
+        self.filename = None
+        if isinstance(library, basestring):
+            self.filename = library
+        self.library = load_library(library)
+        self.block_size = block_size
+        self.n_jobs = n_jobs
+
+    def __len__(self):
+        """
+        Number of library fingerprints.
+        """
+        return len(self.library)
+
+    def search(self, queries, k=None, threshold=None):
+        """
+        Find the most similar library fingerprints for each query.
+
+        At least one of k and threshold must be given. If both are given,
+        the top k hits with similarity at or above the threshold are
+        returned.
+
+        Parameters
+        ----------
+        queries : array_like
+            Bit-packed query fingerprints with shape (n_queries, n_bytes).
+        k : int, optional
+            Number of hits to return for each query.
+        threshold : float, optional
+            Minimum Tanimoto similarity for hits.
+
+        Returns
+        -------
+        A list containing an (indices, similarities) tuple for each query,
+        sorted by decreasing similarity.
+        """
+        if k is None and threshold is None:
+            raise ValueError('At least one of k and threshold is required.')
+        queries = check_fingerprints(queries)
+        if self.n_jobs == 1:
+            return search_range(self.library, queries, (0, len(self)), k=k,
+                                threshold=threshold,
+                                block_size=self.block_size)
+
+        # split the library into contiguous ranges for worker processes
+        bounds = np.linspace(0, len(self), self.n_jobs + 1).astype(int)
+        ranges = zip(bounds[:-1], bounds[1:])
+        if self.filename is not None:
+            library = self.filename
+            function = functools.partial(search_range, library, queries,
+                                         k=k, threshold=threshold,
+                                         block_size=self.block_size)
+            parts = list(process_map(function, ranges, n_jobs=self.n_jobs))
+        else:
+            function = functools.partial(_search_part, queries=queries, k=k,
+                                         threshold=threshold,
+                                         block_size=self.block_size)
+            parts = list(process_map(
+                function,
+                [(start, np.asarray(self.library[start:stop]))
+                 for start, stop in ranges],
+                n_jobs=self.n_jobs))
+
+        # merge the hits from each part
+        hits = []
+        for i in xrange(len(queries)):
+            indices = np.concatenate([part[i][0] for part in parts])
+            scores = np.concatenate([part[i][1] for part in parts])
+            hits.append(select_hits(indices, scores, k=k))
+        return hits
+
+
+def search_range(library, queries, bounds, k=None, threshold=None,
+                 block_size=10000):
+    """
+    Search a range of library fingerprints.
+
+    Parameters
+    ----------
+    library : array_like or str
+        Bit-packed library fingerprints, or the filename of a .npy file
+        containing them.
+    queries : ndarray
+        Bit-packed query fingerprints.
+    bounds : tuple
+        (start, stop) indices of the library range to search.
+    k : int, optional
+        Number of hits to return for each query.
+    threshold : float, optional
+        Minimum Tanimoto similarity for hits.
+    block_size : int, optional (default 10000)
+        Number of library fingerprints compared to the queries at a time.
+
+    Returns
+    -------
+    A list containing an (indices, similarities) tuple for each query, with
+    library indices relative to the full library.
+    """
+    library = load_library(library)
+    query_counts = popcount(queries)
+    n_queries = len(queries)
+    start, stop = bounds
+    best_indices = np.zeros((n_queries, 0), dtype=np.intp)
+    best_scores = np.zeros((n_queries, 0), dtype=float)
+    hit_queries, hit_indices, hit_scores = [], [], []
+    for block_start in xrange(start, stop, block_size):
+        block_stop = min(block_start + block_size, stop)
+        block = np.asarray(library[block_start:block_stop])
+        scores = tanimoto(queries, block, query_counts=query_counts)
+        indices = np.arange(block_start, block_stop)
+
+        # keep the top k hits seen so far for each query
+        if k is not None:
+            if threshold is not None:
+                scores = np.where(scores >= threshold, scores, -1.)
+            best_scores = np.hstack((best_scores, scores))
+            best_indices = np.hstack(
+                (best_indices, np.tile(indices, (n_queries, 1))))
+            if best_scores.shape[1] > k:
+                keep = _top_k(best_scores, k)
+                best_scores = best_scores[keep].reshape((n_queries, k))
+                best_indices = best_indices[keep].reshape((n_queries, k))
+
+        # otherwise keep all hits above the threshold
+        else:
+            i, j = np.nonzero(scores >= threshold)
+            hit_queries.append(i)
+            hit_indices.append(indices[j])
+            hit_scores.append(scores[i, j])
+
+    hits = []
+    if k is not None:
+        for i in xrange(n_queries):
+            mask = best_scores[i] >= 0  # skip hits below the threshold
+            hits.append(select_hits(best_indices[i][mask],
+                                    best_scores[i][mask]))
+    else:
+        if hit_queries:
+            hit_queries = np.concatenate(hit_queries)
+            hit_indices = np.concatenate(hit_indices)
+            hit_scores = np.concatenate(hit_scores)
+        else:
+            hit_queries = np.zeros(0, dtype=np.intp)
+            hit_indices = np.zeros(0, dtype=np.intp)
+            hit_scores = np.zeros(0, dtype=float)
+        order = np.argsort(hit_queries, kind='mergesort')
+        splits = np.searchsorted(hit_queries[order], np.arange(1, n_queries))
+        for query_order in np.split(order, splits):
+            hits.append(select_hits(hit_indices[query_order],
+                                    hit_scores[query_order]))
+    return hits
+
+
+def _top_k(scores, k):
+    """
+    Select the k highest scores in each row, breaking ties in favor of
+    earlier columns.
+
+    Ties are broken by position rather than by the order np.partition
+    happens to leave them in, so search results do not depend on the
+    block size (search_range keeps library indices in increasing order
+    along each row).
+
+    Parameters
+    ----------
+    scores : ndarray
+        Scores with shape (n_rows, n_columns), where n_columns > k.
+    k : int
+        Number of scores to select from each row.
+
+    Returns
+    -------
+    A boolean mask with k set values in each row.
+    """
+    kth = -np.partition(-scores, k - 1, axis=1)[:, k - 1, np.newaxis]
+    above = scores > kth
+    ties = scores == kth
+    n_ties = k - np.sum(above, axis=1)[:, np.newaxis]
+    return above | (ties & (np.cumsum(ties, axis=1) <= n_ties))
+
+
+def _search_part(part, queries, k=None, threshold=None, block_size=10000):
+    """
+    Search an in-memory part of a library in a worker process.
+
+    Parameters
+    ----------
+    part : tuple
+        (start, fps) tuple, where start is the index of the first
+        fingerprint in the full library.
+    queries : ndarray
+        Bit-packed query fingerprints.
+    k : int, optional
+        Number of hits to return for each query.
+    threshold : float, optional
+        Minimum Tanimoto similarity for hits.
+    block_size : int, optional (default 10000)
+        Number of library fingerprints compared to the queries at a time.
+    """
+    start, fps = part
+    hits = search_range(fps, queries, (0, len(fps)), k=k,
+                        threshold=threshold, block_size=block_size)
+    return [(indices + start, scores) for indices, scores in hits]
+
+
+def select_hits(indices, scores, k=None):
+    """
+    Sort hits by decreasing similarity (and increasing library index) and
+    optionally keep the top k.
+
+    Parameters
+    ----------
+    indices : ndarray
+        Library indices.
+    scores : ndarray
+        Similarities.
+    k : int, optional
+        Number of hits to keep.
+    """
+    order = np.lexsort((indices, -scores))
+    if k is not None:
+        order = order[:k]
+    return indices[order], scores[order]
@@ -0,0 +1,258 @@
+"""
+Persistent fingerprint index for Tanimoto threshold queries.
+
+Library fingerprints are sorted by popcount so a threshold query only
+visits library fingerprints whose popcounts are compatible with the
+threshold (the BitBound approach; see Tabei, _Journal of Cheminformatics_
+__4__ (2012) 26 and Swamidass and Baldi, _J. Chem. Inf. Model._ __47__
+(2007) 302). For a query with a bits set and threshold t, Tanimoto
+similarity is bounded by min(a, b) / max(a, b), so only library
+fingerprints with t * a <= b <= a / t bits set can be hits.
+
+Optionally, popcounts are also stored for a few partitions of the bits.
+Since the intersection of two fingerprints is at most the sum over
+partitions of the smaller partition popcount, this gives a tighter bound
+that prunes candidates before any fingerprints are compared.
+
+An index is stored in a directory with the following files:
+
+    index.json        Metadata (format version, number of fingerprints,
+                      fingerprint length in bytes, number of partitions).
+    fingerprints.npy  Bit-packed fingerprints sorted by popcount.
+    indices.npy       Original library index of each sorted fingerprint.
+    counts.npy        Popcount of each sorted fingerprint.
+    offsets.npy       Fingerprints with c bits set are rows
+                      offsets[c]:offsets[c + 1].
+    partitions.npy    Partition popcounts with shape (n_fingerprints,
+                      n_partitions), if n_partitions > 0.
+
+Arrays are memory-mapped when an index is loaded.
+"""
+
+__author__ = "Steven Kearnes"
+__copyright__ = "Copyright 2014, Stanford University"
+__license__ = "BSD 3-clause"
+
+import json
+import numpy as np
+import os
+
+from vs_utils.similarity import (check_fingerprints, load_library,
+                                 popcount, select_hits, tanimoto)
+
+
+class FingerprintIndex(object):
+    """
+    Popcount index for Tanimoto threshold queries against a library of
+    bit-packed fingerprints.
+
+    Use FingerprintIndex.build to create a new index.
+
+    Parameters
+    ----------
+    directory : str
+        Index directory.
+    """
+    version = 1
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'index.json')) as f:
+            metadata = json.load(f)
+        if metadata['version'] != self.version:
+            raise ValueError('Unsupported index version {}.'.format(
+                metadata['version']))
+        self.n_bytes = metadata['n_bytes']
+        self.n_partitions = metadata['n_partitions']
+        self.fingerprints = self._load('fingerprints')
+        self.indices = self._load('indices')
+        self.counts = self._load('counts')
+        self.offsets = np.load(os.path.join(directory, 'offsets.npy'))
+        self.partitions = None
+        if self.n_partitions:
+            self.partitions = self._load('partitions')
+        assert len(self.fingerprints) == metadata['n_fingerprints']
+
+    def __len__(self):
+        """
+        Number of library fingerprints.
+        """
+        return len(self.fingerprints)
+
+    def _load(self, name):
+        """
+        Memory-map an index array.
+
+        Parameters
+        ----------
+        name : str
+            Array name.
+        """
+        return np.load(os.path.join(self.directory, '{}.npy'.format(name)),
+                       mmap_mode='r')
+
+    @classmethod
+    def build(cls, library, directory, n_partitions=0, block_size=100000):
+        """
+        Build an index.
+
+        Parameters
+        ----------
+        library : array_like or str
+            Bit-packed library fingerprints with shape (n_mols, n_bytes),
+            or the filename of a .npy file containing them (which is
+            memory-mapped).
+        directory : str
+            Index directory.
+        n_partitions : int, optional (default 0)
+            Number of bit partitions used to prune candidates.
+        block_size : int, optional (default 100000)
+            Number of fingerprints processed at a time.
+        """
+        library = load_library(library)
+        n_mols, n_bytes = library.shape
+        if n_partitions > n_bytes:
+            raise ValueError('Fingerprints have fewer bytes than ' +
+                             'partitions ({} < {}).'.format(n_bytes,
+                                                            n_partitions))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # sort by popcount
+        counts = np.zeros(n_mols, dtype=np.uint16)
+        for start in xrange(0, n_mols, block_size):
+            counts[start:start + block_size] = popcount(
+                library[start:start + block_size])
+        order = np.argsort(counts, kind='mergesort')
+        counts = counts[order]
+        offsets = np.searchsorted(counts, np.arange(8 * n_bytes + 2))
+        np.save(os.path.join(directory, 'indices.npy'),
+                order.astype(np.int64))
+        np.save(os.path.join(directory, 'counts.npy'), counts)
+        np.save(os.path.join(directory, 'offsets.npy'),
+                offsets.astype(np.int64))
+
+        # write sorted fingerprints and partition popcounts
+        fps = np.lib.format.open_memmap(
+            os.path.join(directory, 'fingerprints.npy'), mode='w+',
+            dtype=np.uint8, shape=(n_mols, n_bytes))
+        partitions = None
+        if n_partitions:
+            partitions = np.lib.format.open_memmap(
+                os.path.join(directory, 'partitions.npy'), mode='w+',
+                dtype=np.uint16, shape=(n_mols, n_partitions))
+        for start in xrange(0, n_mols, block_size):
+            rows = order[start:start + block_size]
+            block = np.asarray(library[np.sort(rows)])[
+                np.argsort(np.argsort(rows))]  # read rows in file order
+            fps[start:start + block_size] = block
+            if n_partitions:
+                partitions[start:start + block_size] = partition_popcount(
+                    block, n_partitions)
+        del fps, partitions  # flush to disk
+
+        with open(os.path.join(directory, 'index.json'), 'wb') as f:
+            json.dump({'version': cls.version, 'n_fingerprints': n_mols,
+                       'n_bytes': n_bytes, 'n_partitions': n_partitions}, f)
+        return cls(directory)
+
+    def get_candidates(self, query, threshold):
+        """
+        Get the sorted fingerprint rows that can have similarity at or above
+        a threshold with a query.
+
+        Parameters
+        ----------
+        query : ndarray
+            Bit-packed query fingerprint.
+        threshold : float
+            Minimum Tanimoto similarity.
+        """
+        query = check_fingerprints(query)
+        a = popcount(query)[0]
+        if threshold > 0:
+            low = int(np.ceil(threshold * a - 1e-9))
+            high = int(np.floor(a / float(threshold) + 1e-9))
+        else:
+            low, high = 0, 8 * self.n_bytes
+        high = min(high, 8 * self.n_bytes)
+        start, stop = self.offsets[low], self.offsets[high + 1]
+        rows = np.arange(start, stop)
+        if self.partitions is None or threshold <= 0 or not len(rows):
+            return rows
+
+        # intersection is at most the sum of partition minimums
+        both = np.minimum(self.partitions[start:stop],
+                          partition_popcount(query, self.n_partitions))
+        both = both.sum(axis=1, dtype=np.int32)
+        b = np.asarray(self.counts[start:stop], dtype=np.int32)
+        keep = both * (1. + threshold) >= threshold * (a + b) - 1e-9
+        return rows[keep]
+
+    def search(self, queries, threshold, k=None, block_size=10000):
+        """
+        Find library fingerprints with similarity at or above a threshold
+        for each query.
+
+        Parameters
+        ----------
+        queries : array_like
+            Bit-packed query fingerprints with shape (n_queries, n_bytes).
+        threshold : float
+            Minimum Tanimoto similarity.
+        k : int, optional
+            Maximum number of hits to return for each query.
+        block_size : int, optional (default 10000)
+            Number of candidates compared to a query at a time.
+
+        Returns
+        -------
+        A list containing an (indices, similarities) tuple for each query,
+        sorted by decreasing similarity. Indices refer to the original
+        library.
+        """
+        queries = check_fingerprints(queries)
+        if queries.shape[1] != self.n_bytes:
+            raise ValueError('Query and library fingerprints have different ' +
+                             'lengths ({} != {} bytes).'.format(
+                                 queries.shape[1], self.n_bytes))
+        hits = []
+        for query in queries:
+            rows = self.get_candidates(query, threshold)
+            indices, scores = [], []
+            for start in xrange(0, len(rows), block_size):
+                block_rows = rows[start:start + block_size]
+                block_scores = tanimoto(
+                    query, self.fingerprints[block_rows],
+                    fps_counts=self.counts[block_rows])[0]
+                mask = block_scores >= threshold
+                indices.append(self.indices[block_rows[mask]])
+                scores.append(block_scores[mask])
+            if indices:
+                indices = np.concatenate(indices)
+                scores = np.concatenate(scores)
+            else:
+                indices = np.zeros(0, dtype=np.int64)
+                scores = np.zeros(0, dtype=float)
+            hits.append(select_hits(indices, scores, k=k))
+        return hits
+
+
+def partition_popcount(fps, n_partitions):
+    """
+    Count the number of set bits in contiguous partitions of each
+    fingerprint.
+
+    Parameters
+    ----------
+    fps : array_like
+        Bit-packed fingerprints with shape (n_mols, n_bytes).
+    n_partitions : int
+        Number of partitions. Partitions are contiguous ranges of bytes.
+    """
+    fps = check_fingerprints(fps)
+    bounds = np.linspace(0, fps.shape[1], n_partitions + 1).astype(int)
+    counts = np.zeros((len(fps), n_partitions), dtype=np.uint16)
+    for i in xrange(n_partitions):
+        counts[:, i] = popcount(fps[:, bounds[i]:bounds[i + 1]])
+    return counts
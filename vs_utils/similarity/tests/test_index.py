@@ -0,0 +1,108 @@
+"""
+Tests for similarity.index.
+"""
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+from vs_utils.similarity import TanimotoSearch
+from vs_utils.similarity.index import FingerprintIndex, partition_popcount
+from vs_utils.utils.array_utils import pack_bits
+
+
+class TestFingerprintIndex(unittest.TestCase):
+    """
+    Tests for FingerprintIndex.
+    """
+    def setUp(self):
+        """
+        Set up tests.
+        """
+        rng = np.random.RandomState(20141016)
+        density = rng.uniform(0.05, 0.4, size=(1000, 1))
+        bits = rng.rand(1000, 128) < density
+        bits[5] = False  # empty fingerprint
+        self.library = pack_bits(bits)
+        self.queries = self.library[[0, 5, 100, 500]].copy()
+        self.queries[:, 0] ^= 3
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """
+        Clean up tests.
+        """
+        shutil.rmtree(self.temp_dir)
+
+    def check_search(self, index, threshold):
+        """
+        Compare index hits to brute-force hits.
+
+        Parameters
+        ----------
+        index : FingerprintIndex
+            Index.
+        threshold : float
+            Minimum similarity.
+        """
+        engine = TanimotoSearch(self.library)
+        expected = engine.search(self.queries, threshold=threshold)
+        hits = index.search(self.queries, threshold=threshold, block_size=64)
+        for (indices, scores), (ref_indices, ref_scores) in zip(hits,
+                                                                expected):
+            assert np.array_equal(indices, ref_indices)
+            assert np.allclose(scores, ref_scores)
+
+    def test_build(self):
+        """
+        Test FingerprintIndex.build.
+        """
+        directory = os.path.join(self.temp_dir, 'index')
+        index = FingerprintIndex.build(self.library, directory,
+                                       block_size=300)
+        assert len(index) == len(self.library)
+        assert np.all(np.diff(index.counts) >= 0)
+        assert np.array_equal(np.sort(index.indices), np.arange(1000))
+        assert np.array_equal(index.fingerprints,
+                              self.library[index.indices])
+
+        # reload from disk
+        index = FingerprintIndex(directory)
+        assert isinstance(index.fingerprints, np.memmap)
+        assert index.partitions is None
+
+    def test_search(self):
+        """
+        Test threshold search.
+        """
+        index = FingerprintIndex.build(self.library, self.temp_dir)
+        for threshold in [0., 0.3, 0.7, 1.]:
+            self.check_search(index, threshold)
+
+        # candidates are restricted for high thresholds
+        n_candidates = len(index.get_candidates(self.queries[2], 0.9))
+        assert 0 < n_candidates < len(self.library) / 2
+
+    def test_partitions(self):
+        """
+        Test threshold search with partitions.
+        """
+        filename = os.path.join(self.temp_dir, 'library.npy')
+        np.save(filename, self.library)
+        index = FingerprintIndex.build(
+            filename, os.path.join(self.temp_dir, 'index'), n_partitions=4)
+        assert np.array_equal(index.partitions.sum(axis=1), index.counts)
+        for threshold in [0.3, 0.7, 1.]:
+            self.check_search(index, threshold)
+        unpartitioned = FingerprintIndex.build(
+            self.library, os.path.join(self.temp_dir, 'unpartitioned'))
+        assert (len(index.get_candidates(self.queries[2], 0.7)) <
+                len(unpartitioned.get_candidates(self.queries[2], 0.7)))
+
+    def test_partition_popcount(self):
+        """
+        Test partition_popcount.
+        """
+        fps = np.array([[255, 1, 3]], dtype=np.uint8)
+        assert np.array_equal(partition_popcount(fps, 2), [[8, 3]])
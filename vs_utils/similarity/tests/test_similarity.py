@@ -0,0 +1,150 @@
+"""
+Tests for similarity.
+"""
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+from vs_utils.similarity import (popcount, tanimoto, TanimotoSearch)
+from vs_utils.utils.array_utils import pack_bits
+
+
+class TestSimilarity(unittest.TestCase):
+    """
+    Tests for similarity.
+    """
+    def setUp(self):
+        """
+        Set up tests.
+        """
+        rng = np.random.RandomState(20141016)
+        self.library_bits = rng.rand(500, 100) < 0.3
+        self.query_bits = self.library_bits[[0, 10, 20]].copy()
+        self.query_bits[:, :10] = rng.rand(3, 10) < 0.3
+        self.library = pack_bits(self.library_bits)
+        self.queries = pack_bits(self.query_bits)
+
+        # brute-force similarities
+        both = np.dot(self.query_bits.astype(int),
+                      self.library_bits.T.astype(int))
+        union = (self.query_bits.sum(axis=1)[:, np.newaxis] +
+                 self.library_bits.sum(axis=1) - both)
+        self.scores = both / union.astype(float)
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """
+        Clean up tests.
+        """
+        shutil.rmtree(self.temp_dir)
+
+    def check_hits(self, hits, k=None, threshold=None):
+        """
+        Compare search hits to brute-force similarities.
+
+        Parameters
+        ----------
+        hits : list
+            (indices, similarities) tuples for each query.
+        k : int, optional
+            Number of hits for each query.
+        threshold : float, optional
+            Minimum similarity.
+        """
+        assert len(hits) == len(self.queries)
+        for scores, (indices, similarities) in zip(self.scores, hits):
+            expected = np.sort(scores)[::-1]
+            if threshold is not None:
+                expected = expected[expected >= threshold]
+            if k is not None:
+                expected = expected[:k]
+            assert np.allclose(similarities, expected)
+            assert np.allclose(scores[indices], similarities)
+
+    def test_popcount(self):
+        """
+        Test popcount.
+        """
+        assert np.array_equal(popcount(self.library),
+                              self.library_bits.sum(axis=1))
+
+    def test_tanimoto(self):
+        """
+        Test tanimoto.
+        """
+        assert np.allclose(tanimoto(self.queries, self.library), self.scores)
+
+        # empty fingerprints
+        empty = np.zeros((1, 2), dtype=np.uint8)
+        assert np.array_equal(tanimoto(empty, empty), [[0.]])
+
+    def test_unpacked(self):
+        """
+        Test that unpacked fingerprints are rejected.
+        """
+        with self.assertRaises(ValueError):
+            tanimoto(self.query_bits, self.library)
+
+    def test_top_k(self):
+        """
+        Test top-k search.
+        """
+        engine = TanimotoSearch(self.library, block_size=64)
+        hits = engine.search(self.queries, k=5)
+        self.check_hits(hits, k=5)
+        assert np.array_equal([indices[0] for indices, _ in hits],
+                              [0, 10, 20])
+
+    def test_threshold(self):
+        """
+        Test threshold search.
+        """
+        engine = TanimotoSearch(self.library, block_size=64)
+        self.check_hits(engine.search(self.queries, threshold=0.2),
+                        threshold=0.2)
+        self.check_hits(engine.search(self.queries, k=3, threshold=0.2),
+                        k=3, threshold=0.2)
+
+    def test_memmap(self):
+        """
+        Test search against a memory-mapped library.
+        """
+        filename = os.path.join(self.temp_dir, 'library.npy')
+        np.save(filename, self.library)
+        engine = TanimotoSearch(filename, block_size=64)
+        assert isinstance(engine.library, np.memmap)
+        self.check_hits(engine.search(self.queries, k=5), k=5)
+
+    def test_n_jobs(self):
+        """
+        Test multi-process search.
+        """
+        filename = os.path.join(self.temp_dir, 'library.npy')
+        np.save(filename, self.library)
+        for library in [self.library, filename]:
+            engine = TanimotoSearch(library, block_size=64, n_jobs=2)
+            self.check_hits(engine.search(self.queries, k=5), k=5)
+            self.check_hits(engine.search(self.queries, threshold=0.2),
+                            threshold=0.2)
+
+    def test_ties(self):
+        """
+        Test that tied hits do not depend on block_size or n_jobs.
+        """
+        library = np.repeat(self.library[:5], 50, axis=0)
+        expected = None
+        for block_size, n_jobs in [(7, 1), (64, 1), (1000, 1), (7, 2)]:
+            engine = TanimotoSearch(library, block_size=block_size,
+                                    n_jobs=n_jobs)
+            hits = engine.search(self.queries, k=10)
+            if expected is None:
+                expected = hits
+            for (indices, scores), (ref_indices, ref_scores) in zip(
+                    hits, expected):
+                assert np.array_equal(indices, ref_indices)
+                assert np.array_equal(scores, ref_scores)
+
+        # ties go to the earliest library entries
+        assert np.array_equal(expected[0][0], np.arange(10))
@@ -16,6 +16,7 @@ import tempfile
 
 from rdkit import Chem
 
+from vs_utils.utils.parallel_utils import check_output
 from vs_utils.utils.pdb_utils import PdbReader
 
 
@@ -75,7 +76,7 @@ class Antechamber(object):
                 output_filename, '-fo', 'mpdb', '-c', self.charge_type, '-nc',
                 str(net_charge)]  # all arguments must be strings
         try:
-            subprocess.check_output(args, cwd=self.temp_dir)
+            check_output(args, cwd=self.temp_dir)
         except subprocess.CalledProcessError as e:
             name = ''
             if mol.HasProp('_Name'):
@@ -226,7 +227,7 @@ class PBSA(object):
         args = ['pbsa', '-i', param_filename, '-o', output_filename, '-pqr',
                 pqr_filename]
         try:
-            subprocess.check_output(args, cwd=self.temp_dir)
+            check_output(args, cwd=self.temp_dir)
         except subprocess.CalledProcessError as e:
             with open(output_filename) as f:
                 print f.read()
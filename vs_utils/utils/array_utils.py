@@ -0,0 +1,483 @@
+"""
+Array containers and utilities.
+"""
+
+__author__ = "Steven Kearnes"
+__copyright__ = "Copyright 2014, Stanford University"
+__license__ = "BSD 3-clause"
+
+import numpy as np
+
+
+class RaggedArray(object):
+    """
+    Array with a variable number of rows for each item.
+
+    Rows for all items are stored in a single contiguous array, and item i
+    corresponds to rows offsets[i]:offsets[i + 1]. For example, conformer
+    features for a set of molecules are stored with shape
+    (total_conformers,) + feature_shape rather than padding every molecule
+    to the maximum number of conformers.
+
+    Parameters
+    ----------
+    data : ndarray
+        Rows for all items, concatenated along the first axis. Can be a
+        masked array (e.g. to mark failed conformers).
+    offsets : array_like
+        Row offsets for each item, with length n_items + 1.
+    """
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = np.asarray(offsets, dtype=np.intp)
+        assert self.offsets.ndim == 1 and self.offsets[0] == 0
+        assert self.offsets[-1] == len(data)
+
+    @classmethod
+    def from_list(cls, items, dtype=None):
+        """
+        Construct a RaggedArray from a list of per-item arrays.
+
+        Rows that are None are masked, and masks on masked array items are
+        preserved.
+
+        Parameters
+        ----------
+        items : list
+            Per-item arrays (or lists of rows) with rows on the first axis.
+        dtype : numpy dtype, optional
+            Data type. Defaults to the data type of the first row that is
+            not None (or float, if there are no items).
+        """
+        if not len(items):
+            return cls(np.zeros(0, dtype=dtype or float), [0])
+        lengths = [len(item) for item in items]
+        offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.intp)
+
+        # get the row shape and data type from the first row that is not
+        # None
+        row_shape, row_dtype = None, None
+        for item in items:
+            if isinstance(item, np.ndarray) and item.dtype != object:
+                if len(item):
+                    row_shape, row_dtype = item.shape[1:], item.dtype
+            else:
+                for row in item:
+                    if row is not None:
+                        row = np.asarray(row)
+                        row_shape, row_dtype = row.shape, row.dtype
+                        break
+            if row_shape is not None:
+                break
+        if row_shape is None:
+            raise ValueError('Cannot find any features.')
+        if dtype is None:
+            dtype = row_dtype
+
+        # fill in the rows
+        masked = any([isinstance(item, np.ma.MaskedArray) or
+                      any([x is None for x in item]) for item in items])
+        if not masked:
+            data = [np.asarray(item, dtype=dtype) for item in items
+                    if len(item)]
+            return cls(np.concatenate(data), offsets)
+        data = np.ma.masked_all((offsets[-1],) + row_shape, dtype=dtype)
+        for i, item in enumerate(items):
+            if isinstance(item, np.ma.MaskedArray):
+                data[offsets[i]:offsets[i + 1]] = item
+                continue
+            for j, row in enumerate(item):
+                if row is not None:
+                    data[offsets[i] + j] = row
+        return cls(data, offsets)
+
+    @classmethod
+    def concatenate(cls, arrays):
+        """
+        Concatenate RaggedArrays.
+
+        Parameters
+        ----------
+        arrays : list
+            RaggedArrays.
+        """
+        if len(arrays) == 1:
+            return arrays[0]
+        offsets = [arrays[0].offsets]
+        for array in arrays[1:]:
+            offsets.append(array.offsets[1:] + offsets[-1][-1])
+        if any([isinstance(array.data, np.ma.MaskedArray)
+                for array in arrays]):
+            data = np.ma.concatenate([array.data for array in arrays])
+        else:
+            data = np.concatenate([array.data for array in arrays])
+        return cls(data, np.concatenate(offsets))
+
+    def __len__(self):
+        """
+        Number of items.
+        """
+        return len(self.offsets) - 1
+
+    def __getitem__(self, item):
+        """
+        Get a view of the rows for an item.
+
+        Parameters
+        ----------
+        item : int
+            Item index.
+        """
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError(item)
+        return self.data[self.offsets[item]:self.offsets[item + 1]]
+
+    def __iter__(self):
+        """
+        Iterate over views of the rows for each item.
+        """
+        for i in xrange(len(self)):
+            yield self[i]
+
+    @property
+    def lengths(self):
+        """
+        Number of rows for each item.
+        """
+        return np.diff(self.offsets)
+
+    @property
+    def mol_index(self):
+        """
+        Item (molecule) index for each row.
+        """
+        return np.repeat(np.arange(len(self)), self.lengths)
+
+    @property
+    def row_shape(self):
+        """
+        Shape of each row.
+        """
+        return self.data.shape[1:]
+
+    @property
+    def dtype(self):
+        """
+        Data type.
+        """
+        return self.data.dtype
+
+    def densify(self, max_rows=None):
+        """
+        Construct a dense masked array with shape
+        (n_items, max_rows) + row_shape. Unused rows are masked.
+
+        Parameters
+        ----------
+        max_rows : int, optional
+            Size of the second axis. Defaults to the maximum number of rows
+            for any item (or 1, if there are no rows).
+        """
+        lengths = self.lengths
+        if max_rows is None:
+            max_rows = max(np.amax(lengths) if len(lengths) else 0, 1)
+        x = np.ma.masked_all((len(self), max_rows) + self.row_shape,
+                             dtype=self.dtype)
+        row_index = (np.arange(len(self.data)) -
+                     np.repeat(self.offsets[:-1], lengths))
+        x[self.mol_index, row_index] = self.data
+        return x
+
+
+class SparseFeatures(object):
+    """
+    Sparse feature matrix with a vocabulary of feature keys.
+
+    Column j of the matrix corresponds to keys[j] (such as a fragment ID
+    in a sparse fingerprint) and, optionally, labels[j] (such as the
+    fragment SMILES). Keys are sorted, so feature matrices for different
+    sets of items can be merged with concatenate.
+
+    Parameters
+    ----------
+    matrix : scipy.sparse matrix
+        Feature matrix with shape (n_items, n_keys). Converted to CSR.
+    keys : array_like
+        Sorted unique key for each column.
+    labels : array_like, optional
+        Label for each column (None for unknown labels).
+    """
+    def __init__(self, matrix, keys, labels=None):
+        from scipy import sparse  # scipy is slow to import
+
+        self.matrix = sparse.csr_matrix(matrix)
+        self.keys = np.asarray(keys, dtype=np.int64)
+        if labels is not None:
+            labels = np.asarray(labels, dtype=object)
+        self.labels = labels
+        assert self.matrix.shape[1] == len(self.keys)
+
+    @classmethod
+    def from_coo(cls, rows, keys, values, n_items, labels=None,
+                 dtype=np.int32):
+        """
+        Construct SparseFeatures from (row, key, value) triples. Values for
+        repeated (row, key) pairs are summed.
+
+        Parameters
+        ----------
+        rows : array_like
+            Item index for each value.
+        keys : array_like
+            Key for each value.
+        values : array_like
+            Values.
+        n_items : int
+            Number of items.
+        labels : dict, optional
+            Mapping from keys to labels.
+        dtype : numpy dtype, optional (default int32)
+            Data type.
+        """
+        from scipy import sparse
+
+        unique, columns = np.unique(np.asarray(keys, dtype=np.int64),
+                                    return_inverse=True)
+        matrix = sparse.csr_matrix(
+            (np.asarray(values, dtype=dtype),
+             (np.asarray(rows, dtype=np.intp), columns)),
+            shape=(n_items, len(unique)))
+        if labels is not None:
+            labels = [labels.get(key) for key in unique]
+        return cls(matrix, unique, labels)
+
+    @classmethod
+    def concatenate(cls, arrays):
+        """
+        Concatenate SparseFeatures, merging their vocabularies. Labels are
+        taken from the first array that has a label for each key.
+
+        Parameters
+        ----------
+        arrays : list
+            SparseFeatures.
+        """
+        from scipy import sparse
+
+        if len(arrays) == 1:
+            return arrays[0]
+        keys = np.unique(np.concatenate([array.keys for array in arrays]))
+        labels = None
+        if any([array.labels is not None for array in arrays]):
+            labels = np.empty(len(keys), dtype=object)
+        blocks = []
+        for array in arrays:
+            columns = np.searchsorted(keys, array.keys)
+            coo = array.matrix.tocoo()
+            blocks.append(sparse.csr_matrix(
+                (coo.data, (coo.row, columns[coo.col])),
+                shape=(coo.shape[0], len(keys))))
+            if array.labels is not None:
+                missing = np.array([label is None
+                                    for label in labels[columns]], dtype=bool)
+                labels[columns[missing]] = array.labels[missing]
+        return cls(sparse.vstack(blocks, format='csr'), keys, labels)
+
+    def __len__(self):
+        """
+        Number of items.
+        """
+        return self.matrix.shape[0]
+
+    def __getitem__(self, item):
+        """
+        Get the features for an item, with a vocabulary restricted to the
+        keys that are present.
+
+        Parameters
+        ----------
+        item : int
+            Item index.
+        """
+        from scipy import sparse
+
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError(item)
+        row = self.matrix[item]
+        columns = row.indices
+        order = np.argsort(columns)
+        row = sparse.csr_matrix(
+            (row.data[order], np.arange(len(columns)), [0, len(columns)]),
+            shape=(1, len(columns)))
+        labels = None
+        if self.labels is not None:
+            labels = self.labels[columns[order]]
+        return SparseFeatures(row, self.keys[columns[order]], labels)
+
+    def __iter__(self):
+        """
+        Iterate over the features for each item.
+        """
+        for i in xrange(len(self)):
+            yield self[i]
+
+    @property
+    def shape(self):
+        """
+        Matrix shape.
+        """
+        return self.matrix.shape
+
+    @property
+    def dtype(self):
+        """
+        Data type.
+        """
+        return self.matrix.dtype
+
+    @property
+    def vocabulary(self):
+        """
+        Mapping from keys to column indices.
+        """
+        return dict(zip(self.keys.tolist(), xrange(len(self.keys))))
+
+    def astype(self, dtype):
+        """
+        Convert the feature matrix to a new data type.
+
+        Parameters
+        ----------
+        dtype : numpy dtype
+            Data type.
+        """
+        return SparseFeatures(self.matrix.astype(dtype), self.keys,
+                              self.labels)
+
+
+def pack_bits(x):
+    """
+    Pack binary values along the last axis into uint8 bytes.
+
+    Masked values are packed as zeros, and bytes containing any masked
+    values are masked. A ValueError is raised if any (unmasked) values are
+    not 0 or 1.
+
+    Parameters
+    ----------
+    x : array_like
+        Binary (or boolean) values.
+    """
+    mask = None
+    if isinstance(x, np.ma.MaskedArray):
+        mask = np.packbits(np.ma.getmaskarray(x), axis=-1) > 0
+        x = x.filled(0)
+    x = np.asarray(x)
+    if x.dtype != bool and not np.all((x == 0) | (x == 1)):
+        raise ValueError('Only binary values can be packed.')
+    data = np.packbits(x.astype(bool), axis=-1)
+    if mask is None:
+        return data
+    return np.ma.array(data, mask=mask)
+
+
+def unpack_bits(x, n_bits, dtype=np.uint8):
+    """
+    Unpack bytes packed with pack_bits.
+
+    Parameters
+    ----------
+    x : array_like
+        Packed uint8 values.
+    n_bits : int
+        Number of bits along the last axis before packing.
+    dtype : numpy dtype, optional (default uint8)
+        Data type for the unpacked values.
+    """
+    if isinstance(x, np.ma.MaskedArray):
+        data = unpack_bits(x.filled(0), n_bits, dtype)
+        mask = np.repeat(np.ma.getmaskarray(x), 8, axis=-1)[..., :n_bits]
+        return np.ma.array(data, mask=mask)
+    x = np.unpackbits(np.asarray(x, dtype=np.uint8), axis=-1)
+    return x[..., :n_bits].astype(dtype)
+
+
+def get_voxel_indices(x):
+    """
+    Get the indices of set voxels in each of a stack of boolean grids
+    (sparse COO format).
+
+    Masked values are treated as unset.
+
+    Parameters
+    ----------
+    x : array_like
+        Boolean grids with shape (n_grids,) + grid_shape.
+
+    Returns
+    -------
+    A RaggedArray with a row of grid indices for each set voxel (with shape
+    (n_set, len(grid_shape))) for each grid. Indices are stored with the
+    smallest unsigned integer type that can hold them.
+    """
+    if isinstance(x, np.ma.MaskedArray):
+        x = x.filled(0)
+    x = np.asarray(x, dtype=bool)
+    index = np.nonzero(x)
+    dtype = np.min_scalar_type(max(x.shape[1:] + (1,)) - 1)
+    offsets = np.searchsorted(index[0], np.arange(len(x) + 1))
+    data = np.zeros((len(index[0]), x.ndim - 1), dtype=dtype)
+    for i, axis_index in enumerate(index[1:]):
+        data[:, i] = axis_index
+    return RaggedArray(data, offsets)
+
+
+def from_voxel_indices(voxels, grid_shape):
+    """
+    Construct boolean grids from set voxel indices. This is the inverse of
+    get_voxel_indices.
+
+    Parameters
+    ----------
+    voxels : RaggedArray
+        Grid indices of the set voxels in each grid.
+    grid_shape : tuple
+        Grid shape.
+    """
+    grid_shape = tuple(grid_shape)
+    x = np.zeros((len(voxels),) + grid_shape, dtype=bool)
+    index = (voxels.mol_index,) + tuple(
+        np.asarray(voxels.data[:, i], dtype=np.intp)
+        for i in xrange(len(grid_shape)))
+    x[index] = True
+    return x
+
+
+def convert_dtype(x, dtype=None):
+    """
+    Convert an array (or the data in a RaggedArray or SparseFeatures) to a
+    new data type.
+
+    Parameters
+    ----------
+    x : ndarray, RaggedArray, or SparseFeatures
+        Array.
+    dtype : numpy dtype or str, optional
+        Data type. If 'packed', binary values are packed into bytes along
+        the last axis (see pack_bits). If None, x is returned unchanged.
+    """
+    if dtype is None:
+        return x
+    if isinstance(x, RaggedArray):
+        return RaggedArray(convert_dtype(x.data, dtype), x.offsets)
+    if isinstance(x, SparseFeatures):
+        if dtype == 'packed':
+            raise ValueError('Sparse features cannot be packed.')
+        return x.astype(dtype)
+    if dtype == 'packed':
+        return pack_bits(x)
+    return np.asanyarray(x).astype(dtype)
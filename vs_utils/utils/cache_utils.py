@@ -0,0 +1,290 @@
+"""
+Feature caching.
+"""
+
+__author__ = "Steven Kearnes"
+__copyright__ = "Copyright 2014, Stanford University"
+__license__ = "BSD 3-clause"
+
+import collections
+import cPickle
+import hashlib
+import os
+import sqlite3
+import types
+
+import numpy as np
+from rdkit import Chem
+
+from vs_utils.features import FEATURIZERS
+
+
+class FeatureCache(object):
+    """
+    Content-addressed cache for per-molecule features.
+
+    Features are keyed on the featurizer (its class and parameters) and the
+    molecule. Molecules are identified by canonical isomeric SMILES, or by
+    RDKit binary (which includes conformer coordinates) for featurizers that
+    calculate features for conformers or otherwise use coordinates (see
+    Featurizer.uses_coordinates).
+
+    The cache has two tiers: a bounded in-memory LRU tier and an optional
+    persistent on-disk tier stored in an SQLite database.
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        Directory for the on-disk tier. If not provided, only the in-memory
+        tier is used.
+    max_memory_items : int, optional (default 10000)
+        Maximum number of items in the in-memory tier.
+    max_memory_bytes : int, optional (default 256 MB)
+        Maximum total size, in bytes, of the arrays in the in-memory tier.
+        Large features (such as grids for each conformer) are evicted
+        once this limit is reached, even if there are fewer than
+        max_memory_items items; items larger than the limit are only
+        stored in the on-disk tier.
+    """
+    filename = 'features.sqlite'
+
+    def __init__(self, cache_dir=None, max_memory_items=10000,
+                 max_memory_bytes=256 * 2 ** 20):
+        self.cache_dir = cache_dir
+        self.max_memory_items = max_memory_items
+        self.max_memory_bytes = max_memory_bytes
+        self.memory = collections.OrderedDict()
+        self.memory_bytes = 0
+        self.connection = None
+        if cache_dir is not None:
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            self.connection = sqlite3.connect(
+                os.path.join(cache_dir, self.filename))
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS features ' +
+                '(key TEXT PRIMARY KEY, value BLOB)')
+            self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def __del__(self):
+        self.close()
+
+    def __len__(self):
+        """
+        Number of items in the on-disk tier (or the in-memory tier if there
+        is no on-disk tier).
+        """
+        if self.connection is None:
+            return len(self.memory)
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM features').fetchone()[0]
+
+    def close(self):
+        """
+        Close the on-disk tier.
+        """
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def get_keys(self, featurizer, mols):
+        """
+        Get cache keys for molecules.
+
+        Parameters
+        ----------
+        featurizer : Featurizer
+            Featurizer.
+        mols : iterable
+            Molecules.
+        """
+        prefix = get_featurizer_hash(featurizer)
+        keys = []
+        for mol in mols:
+            if featurizer.conformers or featurizer.uses_coordinates:
+                mol_key = hashlib.sha1(mol.ToBinary()).hexdigest()
+            else:
+                mol_key = Chem.MolToSmiles(mol, isomericSmiles=True,
+                                           canonical=True)
+            keys.append(hashlib.sha1(prefix + mol_key).hexdigest())
+        return keys
+
+    def get_many(self, keys):
+        """
+        Look up cached values. Updates hit and miss counts.
+
+        Parameters
+        ----------
+        keys : list
+            Cache keys.
+
+        Returns
+        -------
+        A dict containing the keys that were found in the cache.
+        """
+        found = {}
+        missing = []
+        for key in keys:
+            if key in self.memory:
+                found[key] = self.memory.pop(key)
+                self.memory[key] = found[key]  # mark as recently used
+            else:
+                missing.append(key)
+        if self.connection is not None and missing:
+            unique = list(set(missing))
+            for start in xrange(0, len(unique), 500):  # SQLite variable limit
+                batch = unique[start:start + 500]
+                rows = self.connection.execute(
+                    'SELECT key, value FROM features WHERE key IN ' +
+                    '({})'.format(', '.join(['?'] * len(batch))), batch)
+                for key, value in rows:
+                    found[key] = cPickle.loads(str(value))
+                    self._remember(key, found[key])
+        for key in keys:
+            if key in found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return found
+
+    def set_many(self, items):
+        """
+        Add values to the cache.
+
+        Parameters
+        ----------
+        items : iterable
+            (key, value) tuples.
+        """
+        rows = []
+        for key, value in items:
+            self._remember(key, value)
+            if self.connection is not None:
+                rows.append((key, sqlite3.Binary(
+                    cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL))))
+        if rows:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO features VALUES (?, ?)', rows)
+            self.connection.commit()
+
+    def _remember(self, key, value):
+        """
+        Add a value to the in-memory tier, evicting the least recently used
+        items if necessary.
+
+        Parameters
+        ----------
+        key : str
+            Cache key.
+        value : object
+            Value.
+        """
+        if key in self.memory:
+            self.memory_bytes -= _get_nbytes(self.memory.pop(key))
+        self.memory[key] = value
+        self.memory_bytes += _get_nbytes(value)
+        while self.memory and (
+                len(self.memory) > self.max_memory_items or
+                self.memory_bytes > self.max_memory_bytes):
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= _get_nbytes(evicted)
+
+
+def _get_nbytes(value):
+    """
+    Get the size of the array data in a cached value, in bytes. Values
+    that are not arrays are counted as empty.
+
+    Parameters
+    ----------
+    value : object
+        Value.
+    """
+    nbytes = getattr(value, 'nbytes', 0)
+    if isinstance(value, np.ma.MaskedArray) and value.mask is not np.ma.nomask:
+        nbytes += value.mask.nbytes
+    return nbytes
+
+
+def get_featurizer_hash(featurizer):
+    """
+    Get a hash of the featurizer class and its parameters.
+
+    For registered featurizers (see vs_utils.features.FEATURIZERS), the
+    parameters are the registered __init__ arguments, read from the
+    featurizer attributes with the same names. Otherwise, parameters are
+    taken from the public instance attributes of the featurizer
+    (recursively, for attributes such as MolPreparators). Attributes with a
+    leading underscore are ignored, so featurizers can keep internal state
+    without invalidating cached features.
+
+    Parameters
+    ----------
+    featurizer : Featurizer
+        Featurizer.
+
+    Raises
+    ------
+    ValueError
+        If a parameter does not have a description that is stable across
+        processes.
+    """
+    klass = type(featurizer)
+    for info in FEATURIZERS.values():
+        if (klass.__module__, klass.__name__) == (info.module,
+                                                  info.class_name):
+            description = repr(('{}.{}'.format(info.module, info.class_name),
+                                [(arg, _describe(getattr(featurizer, arg)))
+                                 for arg in info.args]))
+            break
+    else:
+        description = repr(_describe(featurizer))
+    return hashlib.sha1(description).hexdigest()
+
+
+def _describe(value):
+    """
+    Get a description of a value that is stable across processes.
+
+    Objects are described by their class and public attributes. Objects
+    that define __getstate__ are described by their pickled state, so
+    runtime state that is not pickled (such as temporary files) is not
+    included.
+
+    Parameters
+    ----------
+    value : object
+        Value.
+
+    Raises
+    ------
+    ValueError
+        If the description of the value contains a memory address.
+    """
+    if isinstance(value, (list, tuple)):
+        return [_describe(item) for item in value]
+    if isinstance(value, dict):
+        return sorted((repr(key), _describe(item))
+                      for key, item in value.items())
+    if isinstance(value, (types.FunctionType, types.BuiltinFunctionType,
+                          types.MethodType, type)):
+        return '{}.{}'.format(getattr(value, '__module__', None),
+                              value.__name__)
+    if hasattr(value, '__dict__'):
+        klass = type(value)
+        state = vars(value)
+        if hasattr(value, '__getstate__'):
+            pickled = value.__getstate__()
+            if isinstance(pickled, dict):
+                state = pickled
+        attrs = dict((key, item) for key, item in state.items()
+                     if not key.startswith('_'))
+        return ('{}.{}'.format(klass.__module__, klass.__name__),
+                _describe(attrs))
+    description = repr(value)
+    if ' at 0x' in description:
+        raise ValueError(
+            'Cannot describe {} for a cache key.'.format(description))
+    return description
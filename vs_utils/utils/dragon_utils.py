@@ -14,6 +14,7 @@ import subprocess
 import tempfile
 
 from vs_utils.utils import SmilesGenerator
+from vs_utils.utils.parallel_utils import popen
 
 
 class Dragon(object):
@@ -46,6 +47,21 @@ class Dragon(object):
         self.smiles_engine = SmilesGenerator(**self.smiles_engine_kwargs)
         self.initialized = True
 
+    def __getstate__(self):
+        """
+        Get state for pickling.
+
+        The configuration file and SMILES engine belong to this process
+        (and the configuration file is deleted when this instance is
+        garbage collected), so copies (e.g. in worker processes) are
+        initialized separately.
+        """
+        state = self.__dict__.copy()
+        state['config_filename'] = None
+        state['smiles_engine'] = None
+        state['initialized'] = False
+        return state
+
     def __del__(self):
         """
         Cleanup.
@@ -147,8 +163,8 @@ class Dragon(object):
             self.initialize()
         smiles = [self.smiles_engine.get_smiles(mol) for mol in mols]
         args = ['dragon6shell', '-s', self.config_filename]
-        p = subprocess.Popen(args, stdin=subprocess.PIPE,
-                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        p = popen(args, stdin=subprocess.PIPE,
+                  stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         stdout, stderr = p.communicate('\n'.join(smiles))
         if not stdout:
             raise RuntimeError(stderr)
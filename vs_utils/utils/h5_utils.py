@@ -7,6 +7,11 @@ __copyright__ = "Copyright 2014, Stanford University"
 __license__ = "BSD 3-clause"
 
 import h5py
+import numpy as np
+
+from vs_utils.utils.array_utils import (from_voxel_indices,
+                                        get_voxel_indices, pack_bits,
+                                        RaggedArray, unpack_bits)
 
 save_options = {'chunks': True,
                 'fletcher32': True,
@@ -40,3 +45,160 @@ def dump(data, filename, attrs=None, options=None):
                 if value is None:
                     value = 'None'
                 f.attrs[key] = value
+
+
+class GridWriter(object):
+    """
+    Stream boolean grids (such as ShapeGrid occupancy grids) to an HDF5
+    file in a compact format.
+
+    Grids are written with one of the following modes:
+    * 'packed' : bits packed along the last axis (see pack_bits), stored in
+      a 'grids' dataset with shape (n_grids,) + packed_shape and one HDF5
+      chunk per grid.
+    * 'sparse' : indices of the set voxels (see get_voxel_indices), stored
+      in a 'voxels' dataset with shape (n_set, ndim). Voxels for grid i are
+      rows offsets[i]:offsets[i + 1] of the 'offsets' dataset.
+
+    Grids for item j are grids mol_offsets[j]:mol_offsets[j + 1], where
+    mol_offsets is the 'mol_offsets' dataset. Each grid is a separate item
+    unless grids are written as RaggedArrays (e.g. conformer grids for each
+    molecule from ShapeGrid.featurize_iter with ragged=True). Use
+    read_grids to read grids back.
+
+    Parameters
+    ----------
+    filename : str
+        Output filename. Existing files are overwritten.
+    grid_shape : tuple
+        Shape of each grid.
+    mode : str, optional (default 'packed')
+        Storage mode ('packed' or 'sparse').
+    options : dict, optional
+        Keyword arguments to create_dataset. Defaults to save_options
+        without the chunk size, which is chosen by the writer.
+    """
+    def __init__(self, filename, grid_shape, mode='packed', options=None):
+        if mode not in ['packed', 'sparse']:
+            raise ValueError("Unrecognized mode '{}'.".format(mode))
+        if options is None:
+            options = save_options.copy()
+            del options['chunks']
+        self.grid_shape = tuple(grid_shape)
+        self.mode = mode
+        self.f = h5py.File(filename, 'w')
+        self.f.attrs['mode'] = mode
+        self.f.attrs['grid_shape'] = self.grid_shape
+        self.n_grids = 0
+        offset_options = dict(options, chunks=(1024,))
+        self.f.create_dataset('mol_offsets', data=[0], dtype=np.int64,
+                              maxshape=(None,), **offset_options)
+        if mode == 'packed':
+            packed_shape = (self.grid_shape[:-1] +
+                            ((self.grid_shape[-1] + 7) // 8,))
+            self.f.create_dataset(
+                'grids', shape=(0,) + packed_shape, dtype=np.uint8,
+                maxshape=(None,) + packed_shape,
+                chunks=(1,) + packed_shape, **options)
+        else:
+            ndim = len(self.grid_shape)
+            self.f.create_dataset(
+                'voxels', shape=(0, ndim),
+                dtype=np.min_scalar_type(max(self.grid_shape) - 1),
+                maxshape=(None, ndim), chunks=(4096, ndim), **options)
+            self.f.create_dataset('offsets', data=[0], dtype=np.int64,
+                                  maxshape=(None,), **offset_options)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Close the file.
+        """
+        self.f.close()
+
+    def write(self, grids):
+        """
+        Append grids to the file.
+
+        Parameters
+        ----------
+        grids : array_like or RaggedArray
+            Boolean grids with shape (n_grids,) + grid_shape, or a
+            RaggedArray with grids for each molecule. Masked values (e.g.
+            for failed molecules) are written as unset voxels.
+        """
+        lengths = None
+        if isinstance(grids, RaggedArray):
+            lengths = grids.lengths
+            grids = grids.data
+        if isinstance(grids, np.ma.MaskedArray):
+            grids = grids.filled(0)
+        grids = np.asarray(grids, dtype=bool)
+        if grids.shape[1:] != self.grid_shape:
+            raise ValueError('Grids have the wrong shape ({} != {}).'.format(
+                grids.shape[1:], self.grid_shape))
+        if self.mode == 'packed':
+            self._append('grids', pack_bits(grids))
+        else:
+            voxels = get_voxel_indices(grids)
+            start = self.f['offsets'][-1]
+            self._append('voxels', voxels.data)
+            self._append('offsets', voxels.offsets[1:] + start)
+        if lengths is None:
+            lengths = np.ones(len(grids), dtype=int)  # one grid per item
+        self._append('mol_offsets',
+                     np.cumsum(lengths) + self.f['mol_offsets'][-1])
+        self.n_grids += len(grids)
+
+    def _append(self, name, data):
+        """
+        Append rows to a dataset.
+
+        Parameters
+        ----------
+        name : str
+            Dataset name.
+        data : ndarray
+            Rows to append.
+        """
+        dataset = self.f[name]
+        start = len(dataset)
+        dataset.resize(start + len(data), axis=0)
+        dataset[start:] = data
+
+
+def read_grids(f, start=0, stop=None):
+    """
+    Read boolean grids written with GridWriter.
+
+    Parameters
+    ----------
+    f : h5py.File or str
+        HDF5 file (or filename).
+    start : int, optional (default 0)
+        Index of the first grid to read.
+    stop : int, optional
+        Index after the last grid to read. Defaults to the number of grids.
+
+    Returns
+    -------
+    A boolean array with shape (n_grids,) + grid_shape.
+    """
+    if not isinstance(f, h5py.File):
+        with h5py.File(f, 'r') as handle:
+            return read_grids(handle, start, stop)
+    grid_shape = tuple(f.attrs['grid_shape'])
+    if f.attrs['mode'] == 'packed':
+        return unpack_bits(f['grids'][start:stop], grid_shape[-1],
+                           dtype=bool)
+    offsets = f['offsets'][start:]
+    if stop is not None:
+        offsets = offsets[:stop - start + 1]
+    voxels = f['voxels'][offsets[0]:offsets[-1]]
+    return from_voxel_indices(RaggedArray(voxels, offsets - offsets[0]),
+                              grid_shape)
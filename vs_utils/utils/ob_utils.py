@@ -6,12 +6,15 @@ __author__ = "Steven Kearnes"
 __copyright__ = "Copyright 2014, Stanford University"
 __license__ = "BSD 3-clause"
 
+import os
+import shutil
 from StringIO import StringIO
 import subprocess
+import tempfile
 
 from rdkit import Chem
 
-from vs_utils.utils import image_utils
+from vs_utils.utils.parallel_utils import popen
 from vs_utils.utils.rdkit_utils import serial
 
 class Ionizer(object):
@@ -23,6 +26,8 @@ class Ionizer(object):
     pH : float, optional (default 7.4)
         pH at which to calculate formal charges.
     """
+    tag = 'vs_utils_ionizer_{}'  # record name used to split batch output
+
     def __init__(self, pH=7.4):
         self.pH = pH
 
@@ -51,6 +56,42 @@ class Ionizer(object):
         else:
             return self._ionize_2d(mol)
 
+    def ionize_many(self, mols):
+        """
+        Ionize a batch of molecules while preserving 3D coordinates.
+
+        Molecules with conformers are ionized with a single obabel process
+        (one SDF record per conformer), and molecules without conformers
+        with another (one SMILES per line). Each record is named with the
+        index of its molecule so the output can be split back into
+        molecules. Molecule names are preserved for molecules with
+        conformers, as in ionize.
+
+        Parameters
+        ----------
+        mols : list
+            Molecules.
+
+        Returns
+        -------
+        A list containing the ionized molecule for each input molecule, or
+        an IonizerError instance for molecules that failed ionization.
+        """
+        mols = list(mols)
+        rval = [None] * len(mols)
+        index_3d = [i for i, mol in enumerate(mols)
+                    if mol.GetNumConformers() > 0]
+        index_2d = [i for i, mol in enumerate(mols)
+                    if not mol.GetNumConformers()]
+        for index, method in [(index_3d, self._ionize_3d_many),
+                              (index_2d, self._ionize_2d_many)]:
+            if not index:
+                continue
+            for i, ionized_mol in zip(
+                    index, method([mols[i] for i in index])):
+                rval[i] = ionized_mol
+        return rval
+
     def _ionize_2d(self, mol):
         """
         Ionize a molecule without preserving conformers.
@@ -62,19 +103,7 @@ class Ionizer(object):
         mol : RDMol
             Molecule.
         """
-        smiles = Chem.MolToSmiles(mol, isomericSmiles=True, canonical=True)
-        args = ['obabel', '-i', 'can', '-o', 'can', '-p', str(self.pH)]
-        p = subprocess.Popen(args, stdin=subprocess.PIPE,
-                             stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE)
-        ionized_smiles, _ = p.communicate(smiles)
-        ionized_mol = Chem.MolFromSmiles(ionized_smiles)
-
-        # catch ionizer error
-        if ionized_mol is None:
-            raise IonizerError(mol)
-
-        return ionized_mol
+        return self._check(self._ionize_2d_many([mol])[0])
 
     def _ionize_3d(self, mol):
         """
@@ -86,17 +115,118 @@ class Ionizer(object):
             Molecule.
         """
         assert mol.GetNumConformers() > 0
+        return self._check(self._ionize_3d_many([mol])[0])
+
+    @staticmethod
+    def _check(ionized_mol):
+        """
+        Raise errors returned by batch ionization.
+
+        Parameters
+        ----------
+        ionized_mol : RDMol or IonizerError
+            Ionized molecule.
+        """
+        if isinstance(ionized_mol, IonizerError):
+            raise ionized_mol
+        return ionized_mol
+
+    def _ionize_2d_many(self, mols):
+        """
+        Ionize molecules without preserving conformers.
+
+        Note: this method removes explicit hydrogens from the molecules.
+
+        Parameters
+        ----------
+        mols : list
+            Molecules.
+        """
+        smiles = ''
+        for i, mol in enumerate(mols):
+            smiles += '{} {}\n'.format(
+                Chem.MolToSmiles(mol, isomericSmiles=True, canonical=True),
+                self.tag.format(i))
+        args = ['obabel', '-i', 'can', '-o', 'can', '-p', str(self.pH)]
+        p = popen(args, stdin=subprocess.PIPE,
+                  stdout=subprocess.PIPE,
+                  stderr=subprocess.PIPE)
+        ionized_smiles, _ = p.communicate(smiles)
+        records = {}
+        for line in ionized_smiles.splitlines():
+            split_line = line.split()
+            if len(split_line) == 2:
+                records[split_line[1]] = split_line[0]
+
+        rval = []
+        for i, mol in enumerate(mols):
+            ionized_mol = None
+            if self.tag.format(i) in records:
+                ionized_mol = Chem.MolFromSmiles(records[self.tag.format(i)])
+
+            # catch ionizer error
+            if ionized_mol is None:
+                ionized_mol = IonizerError(mol)
+            rval.append(ionized_mol)
+        return rval
+
+    def _ionize_3d_many(self, mols):
+        """
+        Ionize molecules while preserving conformers.
+
+        Parameters
+        ----------
+        mols : list
+            Molecules.
+        """
         sdf = ''
-        for conf in mol.GetConformers():
-            sdf += Chem.MolToMolBlock(mol, confId=conf.GetId(),
-                                      includeStereo=True)
-            sdf += '$$$$\n'
+        for i, mol in enumerate(mols):
+            for conf in mol.GetConformers():
+                mol_block = Chem.MolToMolBlock(mol, confId=conf.GetId(),
+                                               includeStereo=True)
+                sdf += self.tag.format(i) + '\n'  # replace the title line
+                sdf += mol_block.split('\n', 1)[1]
+                sdf += '$$$$\n'
         args = ['obabel', '-i', 'sdf', '-o', 'sdf', '-p', str(self.pH)]
-        p = subprocess.Popen(args, stdin=subprocess.PIPE,
-                             stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE)
+        p = popen(args, stdin=subprocess.PIPE,
+                  stdout=subprocess.PIPE,
+                  stderr=subprocess.PIPE)
         ionized_sdf, _ = p.communicate(sdf)
-        reader = serial.MolReader(StringIO(ionized_sdf), mol_format='sdf',
+
+        # split records by molecule and restore titles
+        records = {}
+        for record in ionized_sdf.split('$$$$\n'):
+            if not record.strip():
+                continue
+            title, body = (record.lstrip('\n').split('\n', 1) + [''])[:2]
+            records.setdefault(title.strip(), []).append(body)
+        rval = []
+        for i, mol in enumerate(mols):
+            title = ''
+            if mol.HasProp('_Name'):
+                title = mol.GetProp('_Name')
+            sdf = ''.join(['{}\n{}$$$$\n'.format(title, conf)
+                           for conf in records.get(self.tag.format(i), [])])
+            try:
+                rval.append(self._read_ionized_sdf(mol, sdf))
+            except IonizerError as e:
+                rval.append(e)
+        return rval
+
+    @staticmethod
+    def _read_ionized_sdf(mol, sdf):
+        """
+        Read an ionized (possibly multi-conformer) molecule from obabel SDF
+        output.
+
+        Parameters
+        ----------
+        mol : RDMol
+            Input molecule.
+        sdf : str
+            Ionized conformers of the molecule.
+        """
+        reader = serial.MolReader(StringIO(sdf), mol_format='sdf',
                                   remove_salts=False)  # no changes
         try:
             mols = list(reader.get_mols())
@@ -159,12 +289,55 @@ class MolImage(object):
         smiles = Chem.MolToSmiles(mol, isomericSmiles=True, canonical=True)
         args = ['obabel', '-i', 'can', '-o', 'png', '-xd', '-xC',
                 '-xp {}'.format(self.size)]
-        p = subprocess.Popen(args, stdin=subprocess.PIPE,
-                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        p = popen(args, stdin=subprocess.PIPE,
+                  stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         png, _ = p.communicate(smiles)
+        from vs_utils.utils import image_utils  # PIL is slow to import
         im = image_utils.load(png)
         return im
 
+    def depict_many(self, mols):
+        """
+        Generate PNG images for a batch of molecules with a single obabel
+        process.
+
+        obabel writes one file per molecule (mol1.png, mol2.png, ...) to a
+        temporary directory. If the number of images does not match the
+        number of molecules (e.g. because obabel could not parse one of the
+        SMILES strings), each molecule is depicted separately instead.
+
+        Parameters
+        ----------
+        mols : list
+            Molecules.
+        """
+        if not len(mols):
+            return []
+        smiles = [Chem.MolToSmiles(mol, isomericSmiles=True, canonical=True)
+                  for mol in mols]
+        from vs_utils.utils import image_utils  # PIL is slow to import
+        temp = tempfile.mkdtemp()
+        try:
+            args = ['obabel', '-i', 'can', '-o', 'png', '-m', '-O',
+                    os.path.join(temp, 'mol.png'), '-xd', '-xC',
+                    '-xp {}'.format(self.size)]
+            p = popen(args, stdin=subprocess.PIPE,
+                      stdout=subprocess.PIPE,
+                      stderr=subprocess.PIPE)
+            p.communicate('\n'.join(smiles) + '\n')
+            filenames = [os.path.join(temp, 'mol{}.png'.format(i + 1))
+                         for i in xrange(len(mols))]
+            if (len(os.listdir(temp)) != len(mols) or
+                    not all([os.path.exists(f) for f in filenames])):
+                return [self.depict(mol) for mol in mols]
+            images = []
+            for filename in filenames:
+                with open(filename, 'rb') as f:
+                    images.append(image_utils.load(f.read()))
+            return images
+        finally:
+            shutil.rmtree(temp)
+
 
 class IonizerError(Exception):
     """
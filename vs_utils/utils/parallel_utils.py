@@ -1,11 +1,18 @@
 """
-IPython.parallel utilities.
+Parallel processing utilities.
 """
 
 __author__ = "Steven Kearnes"
 __copyright__ = "Copyright 2014, Stanford University"
 __license__ = "BSD 3-clause"
 
+import collections
+import contextlib
+import itertools
+import multiprocessing
+import os
+import select
+import signal
 import subprocess
 import time
 import uuid
@@ -61,3 +68,518 @@ class LocalCluster(object):
         for engine in self.engines:
             engine.terminate()
         self.controller.terminate()
+
+
+def iter_chunks(items, chunk_size):
+    """
+    Split an iterable into lists of at most chunk_size items.
+
+    Parameters
+    ----------
+    items : iterable
+        Items to split.
+    chunk_size : int
+        Maximum number of items per chunk.
+    """
+    chunk_size = int(chunk_size)
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be positive.')
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk):
+        yield chunk
+
+
+class TimeLimitError(Exception):
+    """
+    Raised when a block of code exceeds its time limit.
+    """
+
+
+# subprocesses started with popen in each active time_limit block
+_limited_processes = []
+
+# sends messages to the parent process in process_map workers
+_report = None
+
+
+@contextlib.contextmanager
+def time_limit(seconds):
+    """
+    Limit the wall-clock time of a block of code.
+
+    A TimeLimitError is raised inside the block when the time limit is
+    exceeded. This uses SIGALRM, so it only works in the main thread of a
+    process (which includes multiprocessing workers). Python code and
+    blocking system calls (such as waiting for a subprocess) are
+    interrupted, but long-running calls into extension modules are only
+    interrupted when they return control to the interpreter.
+
+    Subprocesses started with popen (or check_output) inside the block run
+    in their own process groups, and groups that are still running are
+    killed if the block exits with an exception (including
+    TimeLimitError).
+
+    Parameters
+    ----------
+    seconds : float
+        Time limit, in seconds. If None, the time is not limited.
+    """
+    if seconds is None:
+        yield
+        return
+
+    def handler(signum, frame):
+        raise TimeLimitError(
+            'Time limit of {} seconds exceeded.'.format(seconds))
+
+    processes = []
+    _limited_processes.append(processes)
+    previous = signal.signal(signal.SIGALRM, handler)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    except BaseException:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        for process in processes:
+            _kill_process_group(process)
+        raise
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+        _limited_processes.pop()
+
+
+def _kill_process_group(process):
+    """
+    Kill a subprocess started by popen, along with any processes it
+    started, if it is still running.
+
+    Parameters
+    ----------
+    process : Popen
+        Subprocess (a process group leader).
+    """
+    if process.poll() is None:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:  # process already exited
+            pass
+        process.wait()
+
+
+def popen(args, **kwargs):
+    """
+    Start a subprocess that is killed if an enclosing time_limit is
+    exceeded.
+
+    Inside a time_limit block or a process_map worker, the subprocess is
+    started in its own process group so that it can be killed along with
+    any processes it starts (when the time limit is exceeded or the worker
+    is killed).
+    External tools that are run during featurization should be started
+    with this function instead of subprocess.Popen.
+
+    Parameters
+    ----------
+    args : list
+        Program arguments.
+    kwargs : dict, optional
+        Keyword arguments for subprocess.Popen.
+    """
+    if not _limited_processes and _report is None:
+        return subprocess.Popen(args, **kwargs)
+    process = subprocess.Popen(args, preexec_fn=os.setpgrp, **kwargs)
+    if _limited_processes:
+        _limited_processes[-1].append(process)
+    if _report is not None:  # so the worker's subprocesses can be killed
+        _report(('process', process.pid))
+    return process
+
+
+def check_output(args, **kwargs):
+    """
+    Run a subprocess with popen and return its output.
+
+    This is like subprocess.check_output, including raising
+    subprocess.CalledProcessError if the subprocess fails.
+
+    Parameters
+    ----------
+    args : list
+        Program arguments.
+    kwargs : dict, optional
+        Keyword arguments for subprocess.Popen.
+    """
+    process = popen(args, stdout=subprocess.PIPE, **kwargs)
+    output, _ = process.communicate()
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, args,
+                                            output=output)
+    return output
+
+
+def report_progress(values):
+    """
+    Report results for the next items of the chunk that a process_map
+    worker is processing.
+
+    With a timeout, process_map requires the function to report a result
+    for each item of its chunk, in order (see process_map). Outside of
+    process_map workers, this does nothing.
+
+    Parameters
+    ----------
+    values : list
+        Results for the next items of the chunk.
+    """
+    if _report is not None:
+        _report(('progress', list(values)))
+
+
+def report_batch(n_items):
+    """
+    Report that a process_map worker is starting to process the next
+    n_items items of its chunk together.
+
+    The time limit for the next progress report is multiplied by n_items.
+    If the worker is killed before it reports results for these items,
+    they are retried one at a time so that only an item that is stuck
+    fails. Outside of process_map workers, this does nothing.
+
+    Parameters
+    ----------
+    n_items : int
+        Number of items processed together.
+    """
+    if _report is not None:
+        _report(('batch', n_items))
+
+
+def _worker_loop(function, conn, progress):
+    """
+    Apply a function to chunks of work received from the parent process
+    until None is received.
+
+    Messages are sent back as (kind, value) tuples:
+    * ('progress', values) : results reported with report_progress.
+    * ('batch', n_items) : a batch was started with report_batch.
+    * ('process', pid) : a subprocess was started with popen.
+    * ('result', value) : the return value of the function (None if
+      progress is True).
+    * ('error', exception) : the function raised an exception.
+
+    Parameters
+    ----------
+    function : callable
+        Function applied to each chunk.
+    conn : Connection
+        Worker end of the pipe to the parent process.
+    progress : bool
+        Whether the function reports progress, in which case its return
+        value is not sent to the parent process.
+    """
+    global _report
+    _report = conn.send
+    while True:
+        chunk = conn.recv()
+        if chunk is None:
+            break
+        try:
+            value = function(chunk)
+            rval = ('result', None if progress else value)
+        except Exception as e:
+            rval = ('error', e)
+        try:
+            conn.send(rval)
+        except Exception as e:  # unpicklable result or exception
+            conn.send(('error', RuntimeError(
+                '{}: {}'.format(type(e).__name__, e))))
+    conn.close()
+
+
+class _Worker(object):
+    """
+    Worker process for process_map, with a private pipe so the parent
+    process always knows which piece of work the worker is running.
+
+    Parameters
+    ----------
+    function : callable
+        Function applied to each chunk.
+    progress : bool, optional (default False)
+        Whether the function reports progress.
+    """
+    def __init__(self, function, progress=False):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_worker_loop, args=(function, child_conn, progress))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+        self.piece = None
+        self.last = None
+        self.n_done = 0
+        self.processes = []
+        self.n_tasks = 0
+
+    def fileno(self):
+        """
+        File descriptor for the pipe (so workers can be used with select).
+        """
+        return self.conn.fileno()
+
+    def submit(self, piece):
+        """
+        Send a piece of work to the worker.
+
+        Parameters
+        ----------
+        piece : tuple
+            (task ID, start, items) tuple, where items are the items of
+            the chunk for the task starting at index start.
+        """
+        self.conn.send(piece[2])
+        self.piece = piece
+        self.last = time.time()  # time of the last progress
+        self.n_done = 0  # number of items with reported results
+        self.n_batch = 1  # number of items being processed together
+        self.processes = []  # subprocesses started with popen
+        self.n_tasks += 1
+
+    def stop(self):
+        """
+        Ask an idle worker to exit.
+        """
+        try:
+            self.conn.send(None)
+        except (IOError, OSError):  # worker already exited
+            pass
+        self.process.join()
+        self.conn.close()
+
+    def kill(self):
+        """
+        Kill the worker and any subprocesses it started for its current
+        piece of work.
+        """
+        if self.process.is_alive():
+            try:
+                os.kill(self.process.pid, signal.SIGKILL)
+            except OSError:  # worker already exited
+                pass
+        self.process.join()
+        for pid in self.processes:
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except OSError:  # subprocess already exited
+                pass
+        self.conn.close()
+
+
+def process_map(function, chunks, n_jobs=None, max_pending=None,
+                max_tasks_per_child=None, timeout=None, on_timeout=None,
+                join=list):
+    """
+    Apply a function to each chunk of work using a pool of local processes.
+
+    Results are yielded in the same order as the input chunks. Chunks are
+    read from the input lazily and at most max_pending chunks are in flight
+    at any time, so memory usage does not depend on the total amount of
+    work. Exceptions raised by the function are raised when the result for
+    the chunk is yielded.
+
+    Each worker process has its own pipe and runs one chunk at a time, so
+    a stuck worker can be killed and replaced without affecting the others.
+
+    Parameters
+    ----------
+    function : callable
+        Function applied to each chunk.
+    chunks : iterable
+        Chunks of work. Chunks that are None are not sent to a worker and
+        yield None.
+    n_jobs : int, optional
+        Number of worker processes. Defaults to the number of CPUs.
+    max_pending : int, optional
+        Maximum number of chunks submitted to the pool but not yet yielded.
+        Defaults to twice the number of worker processes.
+    max_tasks_per_child : int, optional
+        Number of chunks processed by each worker process before it is
+        replaced with a new process (to contain memory leaks). By default,
+        workers live as long as the pool.
+    timeout : float, optional
+        Time limit, in seconds, for each item of a chunk. With a timeout,
+        the function must call report_progress with the result for each
+        item of its chunk, in order, and the result for the chunk is
+        join(values), where values are the reported results (the return
+        value of the function is not used). A worker that reports no
+        progress within the time limit (or exits unexpectedly) is killed
+        and replaced, along with any subprocesses it started with popen.
+        The item it was working on gets the result on_timeout(item,
+        reason), and the remaining items of the chunk are sent to a worker
+        as a new piece of work, so other items and chunks are not
+        affected. Functions that process several items at once should
+        call report_batch first (see report_batch). Chunks must be lists
+        if a timeout is given.
+    on_timeout : callable, optional
+        Function returning a placeholder result for an item whose worker
+        was killed, given the item and the reason. Required if timeout is
+        given.
+    join : callable, optional (default list)
+        Function constructing the result for a chunk from the results for
+        its items (if timeout is given).
+    """
+    if n_jobs is None:
+        n_jobs = multiprocessing.cpu_count()
+    if max_pending is None:
+        max_pending = 2 * n_jobs
+    if timeout is not None and on_timeout is None:
+        raise ValueError('on_timeout is required with timeout.')
+    progress = timeout is not None
+
+    workers = [_Worker(function, progress) for _ in xrange(n_jobs)]
+    chunks = iter(chunks)
+    order = collections.deque()  # task IDs in input order
+    queued = collections.deque()  # (task ID, start, items) not yet sent
+    results = {}  # task ID -> (success, value)
+    values = {}  # task ID -> results for each item (with a timeout)
+    n_left = {}  # task ID -> number of items without results
+    task_ids = itertools.count()
+    exhausted = False
+
+    def replace(worker):
+        """
+        Replace a worker with a new process.
+        """
+        workers[workers.index(worker)] = _Worker(function, progress)
+
+    def record(task_id, start, item_values):
+        """
+        Record results for items of a chunk, starting at index start.
+        """
+        if task_id not in values:  # task already failed
+            return
+        values[task_id][start:start + len(item_values)] = item_values
+        n_left[task_id] -= len(item_values)
+        if not n_left[task_id]:
+            del n_left[task_id]
+            results[task_id] = (True, join(values.pop(task_id)))
+
+    def error(task_id, e):
+        """
+        Record an exception raised for a task.
+        """
+        if progress and task_id not in values:  # task already finished
+            return
+        results[task_id] = (False, e)
+        values.pop(task_id, None)
+        n_left.pop(task_id, None)
+
+    def fail(worker, reason):
+        """
+        Kill a worker and give the item it was working on a placeholder
+        result. The remaining items of its piece of work are queued again.
+        """
+        worker.kill()
+        if not progress:
+            raise RuntimeError(reason)
+        task_id, start, items = worker.piece
+        done = worker.n_done
+        replace(worker)
+        if worker.n_batch > 1:  # retry the unfinished items one at a time
+            if task_id in values:
+                queued.extendleft(
+                    (task_id, start + i, [items[i]])
+                    for i in reversed(xrange(done, len(items))))
+        elif done < len(items):
+            record(task_id, start + done, [on_timeout(items[done], reason)])
+            if done + 1 < len(items) and task_id in values:
+                queued.appendleft((task_id, start + done + 1,
+                                   items[done + 1:]))
+
+    try:
+        while True:
+
+            # read and submit chunks
+            while not exhausted and len(order) < max_pending:
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    exhausted = True
+                    break
+                task_id = next(task_ids)
+                order.append(task_id)
+                if chunk is None:
+                    results[task_id] = (True, None)
+                elif progress and not len(chunk):
+                    results[task_id] = (True, join([]))
+                else:
+                    if progress:
+                        values[task_id] = [None] * len(chunk)
+                        n_left[task_id] = len(chunk)
+                    queued.append((task_id, 0, chunk))
+            for worker in workers:
+                if worker.piece is None and queued:
+                    worker.submit(queued.popleft())
+
+            # yield results in order
+            while order and order[0] in results:
+                success, value = results.pop(order.popleft())
+                if not success:
+                    raise value
+                yield value
+            if not order:
+                if exhausted:
+                    break
+                continue
+
+            # wait for messages and check time limits
+            busy = [worker for worker in workers if worker.piece is not None]
+            ready = select.select(busy, [], [], 0.1)[0]
+            for worker in ready:
+                try:
+                    kind, value = worker.conn.recv()
+                except EOFError:  # worker exited
+                    fail(worker, 'Worker process exited unexpectedly.')
+                    continue
+                task_id, start, items = worker.piece
+                if kind == 'process':
+                    worker.processes.append(value)
+                    continue
+                if kind == 'progress':
+                    if progress:
+                        record(task_id, start + worker.n_done, value)
+                        worker.n_done += len(value)
+                        worker.n_batch = 1
+                        worker.last = time.time()
+                    continue
+                if kind == 'batch':
+                    worker.n_batch = value
+                    worker.last = time.time()
+                    continue
+                if kind == 'error':
+                    error(task_id, value)
+                elif not progress:
+                    results[task_id] = (True, value)
+                elif worker.n_done != len(items):
+                    error(task_id, RuntimeError(
+                        'Results were not reported for every item.'))
+                worker.piece = None
+                if (max_tasks_per_child is not None and
+                        worker.n_tasks >= max_tasks_per_child):
+                    worker.stop()
+                    replace(worker)
+            if timeout is not None:
+                now = time.time()
+                for worker in busy:
+                    if (worker.piece is not None and worker not in ready and
+                            now - worker.last > timeout * worker.n_batch):
+                        fail(worker, 'Worker process exceeded the time limit.')
+    finally:
+        for worker in workers:  # also stops workers if iteration ends early
+            worker.kill()
@@ -0,0 +1,239 @@
+"""
+Tests for array_utils.
+"""
+import numpy as np
+import unittest
+
+from vs_utils.utils.array_utils import (convert_dtype, from_voxel_indices,
+                                        get_voxel_indices, pack_bits,
+                                        RaggedArray, SparseFeatures,
+                                        unpack_bits)
+
+
+class TestRaggedArray(unittest.TestCase):
+    """
+    Tests for RaggedArray.
+    """
+    def setUp(self):
+        """
+        Set up tests.
+        """
+        self.items = [np.ones((2, 3)), np.zeros((0, 3)),
+                      np.arange(9, dtype=float).reshape((3, 3))]
+
+    def test_from_list(self):
+        """
+        Test RaggedArray.from_list.
+        """
+        x = RaggedArray.from_list(self.items)
+        assert len(x) == 3
+        assert x.data.shape == (5, 3)
+        assert x.row_shape == (3,)
+        assert np.array_equal(x.offsets, [0, 2, 2, 5])
+        assert np.array_equal(x.lengths, [2, 0, 3])
+        assert np.array_equal(x.mol_index, [0, 0, 2, 2, 2])
+        for item, rows in zip(self.items, x):
+            assert np.array_equal(item, rows)
+        assert np.array_equal(x[-1], self.items[-1])
+
+    def test_from_list_none(self):
+        """
+        Test RaggedArray.from_list with None rows.
+        """
+        x = RaggedArray.from_list([[None, np.ones(3)], [np.zeros(3)]])
+        assert np.array_equal(np.ma.getmaskarray(x.data).all(axis=1),
+                              [True, False, False])
+
+        # masks are preserved when rows are copied
+        y = RaggedArray.from_list([rows.copy() for rows in x])
+        assert np.array_equal(np.ma.getmaskarray(y.data),
+                              np.ma.getmaskarray(x.data))
+
+    def test_from_list_empty(self):
+        """
+        Test RaggedArray.from_list without any items.
+        """
+        x = RaggedArray.from_list([])
+        assert len(x) == 0
+        assert x.densify().shape[0] == 0
+
+    def test_from_list_dtype(self):
+        """
+        Test that RaggedArray.from_list keeps the data type of the rows.
+        """
+        for dtype in [bool, np.uint8]:
+            x = RaggedArray.from_list([[None, np.ones(3, dtype=dtype)],
+                                       [np.zeros(3, dtype=dtype)]])
+            assert x.data.dtype == dtype
+            x = RaggedArray.from_list([np.ones((2, 3), dtype=dtype)])
+            assert x.data.dtype == dtype
+        x = RaggedArray.from_list([[np.ones(3)]], dtype=np.float32)
+        assert x.data.dtype == np.float32
+
+    def test_concatenate(self):
+        """
+        Test RaggedArray.concatenate.
+        """
+        x = RaggedArray.from_list(self.items[:2])
+        y = RaggedArray.from_list(self.items[2:])
+        z = RaggedArray.concatenate([x, y])
+        assert np.array_equal(z.offsets, [0, 2, 2, 5])
+        assert np.array_equal(z.data, RaggedArray.from_list(self.items).data)
+
+    def test_densify(self):
+        """
+        Test RaggedArray.densify.
+        """
+        x = RaggedArray.from_list(self.items).densify()
+        assert x.shape == (3, 3, 3)
+        mask = np.ma.getmaskarray(x).all(axis=2)
+        assert np.array_equal(mask, [[False, False, True],
+                                     [True, True, True],
+                                     [False, False, False]])
+        assert np.array_equal(x[2], self.items[2])
+        assert RaggedArray.from_list(self.items).densify(4).shape == (
+            3, 4, 3)
+
+
+class TestPackBits(unittest.TestCase):
+    """
+    Tests for pack_bits, unpack_bits, and convert_dtype.
+    """
+    def setUp(self):
+        """
+        Set up tests.
+        """
+        rng = np.random.RandomState(20141024)
+        self.x = (rng.rand(5, 3, 20) > 0.5).astype(np.uint8)
+
+    def test_pack_bits(self):
+        """
+        Test round trip through pack_bits and unpack_bits.
+        """
+        packed = pack_bits(self.x)
+        assert packed.shape == (5, 3, 3)
+        assert packed.dtype == np.uint8
+        assert np.array_equal(unpack_bits(packed, 20), self.x)
+        assert unpack_bits(packed, 20, dtype=bool).dtype == bool
+
+    def test_pack_bits_masked(self):
+        """
+        Test pack_bits with masked values.
+        """
+        x = np.ma.array(self.x, mask=np.zeros_like(self.x, dtype=bool))
+        x[1] = np.ma.masked
+        packed = pack_bits(x)
+        assert np.array_equal(np.ma.getmaskarray(packed).all(axis=(1, 2)),
+                              [False, True, False, False, False])
+        unpacked = unpack_bits(packed, 20)
+        assert np.array_equal(np.ma.getmaskarray(unpacked),
+                              np.ma.getmaskarray(x))
+        assert np.array_equal(unpacked[0], self.x[0])
+
+    def test_pack_bits_not_binary(self):
+        """
+        Test that pack_bits rejects values other than 0 and 1.
+        """
+        with self.assertRaises(ValueError):
+            pack_bits(2 * self.x)
+        with self.assertRaises(ValueError):
+            convert_dtype(self.x + 0.5, 'packed')
+
+        # masked values are not checked
+        x = np.ma.array(2 * self.x, mask=self.x > 0)
+        assert not np.any(pack_bits(x).filled(0))
+
+    def test_convert_dtype(self):
+        """
+        Test convert_dtype.
+        """
+        assert convert_dtype(self.x) is self.x
+        assert convert_dtype(self.x, 'float32').dtype == np.float32
+        ragged = RaggedArray(self.x.reshape((15, 20)), [0, 5, 15])
+        packed = convert_dtype(ragged, 'packed')
+        assert isinstance(packed, RaggedArray)
+        assert packed.data.shape == (15, 3)
+        assert np.array_equal(packed.offsets, ragged.offsets)
+
+
+class TestVoxelIndices(unittest.TestCase):
+    """
+    Tests for get_voxel_indices and from_voxel_indices.
+    """
+    def test_voxel_indices(self):
+        """
+        Test round trip through get_voxel_indices and from_voxel_indices.
+        """
+        x = np.zeros((3, 4, 5, 6), dtype=bool)
+        x[0, 1, 2, 3] = True
+        x[0, 3, 4, 5] = True
+        x[2, 0, 0, 0] = True
+        voxels = get_voxel_indices(x)
+        assert np.array_equal(voxels.lengths, [2, 0, 1])
+        assert voxels.data.dtype == np.uint8
+        assert np.array_equal(voxels[0], [[1, 2, 3], [3, 4, 5]])
+        assert np.array_equal(from_voxel_indices(voxels, (4, 5, 6)), x)
+
+        # masked voxels are unset
+        x = np.ma.array(x, mask=False)
+        x[0, 1, 2, 3] = np.ma.masked
+        assert np.array_equal(get_voxel_indices(x).lengths, [1, 0, 1])
+
+
+class TestSparseFeatures(unittest.TestCase):
+    """
+    Tests for SparseFeatures.
+    """
+    def setUp(self):
+        """
+        Set up tests.
+        """
+        self.a = SparseFeatures.from_coo(
+            [0, 0, 1, 1], [9, 2 ** 32 - 1, 9, 9], [1, 2, 3, 1], 2,
+            {9: 'C', 2 ** 32 - 1: 'O'})
+        self.b = SparseFeatures.from_coo([0], [4], [5], 1, {4: 'N'})
+
+    def test_from_coo(self):
+        """
+        Test SparseFeatures.from_coo.
+        """
+        assert self.a.shape == (2, 2)
+        assert np.array_equal(self.a.keys, [9, 2 ** 32 - 1])
+        assert np.array_equal(self.a.labels, ['C', 'O'])
+        assert np.array_equal(self.a.matrix.toarray(), [[1, 2], [4, 0]])
+        assert self.a.vocabulary == {9: 0, 2 ** 32 - 1: 1}
+
+    def test_concatenate(self):
+        """
+        Test SparseFeatures.concatenate.
+        """
+        empty = SparseFeatures.from_coo([], [], [], 1)
+        x = SparseFeatures.concatenate([self.a, empty, self.b])
+        assert len(x) == 4
+        assert np.array_equal(x.keys, [4, 9, 2 ** 32 - 1])
+        assert np.array_equal(x.labels, ['N', 'C', 'O'])
+        assert np.array_equal(x.matrix.toarray(),
+                              [[0, 1, 2], [0, 4, 0], [0, 0, 0], [5, 0, 0]])
+
+    def test_getitem(self):
+        """
+        Test per-item SparseFeatures.
+        """
+        rows = list(SparseFeatures.concatenate([self.a, self.b]))
+        assert np.array_equal(rows[1].keys, [9])
+        assert np.array_equal(rows[1].labels, ['C'])
+        assert np.array_equal(rows[1].matrix.toarray(), [[4]])
+        x = SparseFeatures.concatenate(rows)
+        assert np.array_equal(x.matrix.toarray(),
+                              SparseFeatures.concatenate(
+                                  [self.a, self.b]).matrix.toarray())
+
+    def test_convert_dtype(self):
+        """
+        Test convert_dtype with SparseFeatures.
+        """
+        x = convert_dtype(self.a, np.float32)
+        assert x.dtype == np.float32
+        assert np.array_equal(x.keys, self.a.keys)
+        with self.assertRaises(ValueError):
+            convert_dtype(self.a, 'packed')
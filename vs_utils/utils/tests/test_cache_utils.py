@@ -0,0 +1,225 @@
+"""
+Tests for feature caching.
+"""
+import numpy as np
+import shutil
+import tempfile
+import unittest
+
+from rdkit import Chem
+from rdkit.Chem import AllChem, rdGeometry
+
+from vs_utils.features import FeaturizerPipeline
+from vs_utils.features.basic import MolecularWeight
+from vs_utils.features.dragon import DragonDescriptors
+from vs_utils.features.esp import ESP
+from vs_utils.features.fingerprints import CircularFingerprint
+from vs_utils.utils.cache_utils import FeatureCache, get_featurizer_hash
+
+
+class TestFeatureCache(unittest.TestCase):
+    """
+    Tests for FeatureCache.
+    """
+    def setUp(self):
+        """
+        Set up tests.
+        """
+        self.temp_dir = tempfile.mkdtemp()
+        self.mols = [Chem.MolFromSmiles(smiles)
+                     for smiles in ['CC(=O)OC1=CC=CC=C1C(=O)O', 'CCO',
+                                    'OCC']]  # last two are identical
+
+    def tearDown(self):
+        """
+        Delete temporary files.
+        """
+        shutil.rmtree(self.temp_dir)
+
+    def test_lru(self):
+        """
+        Test eviction from the in-memory tier.
+        """
+        cache = FeatureCache(max_memory_items=2)
+        cache.set_many([('a', 1), ('b', 2)])
+        cache.get_many(['a'])  # mark 'a' as recently used
+        cache.set_many([('c', 3)])
+        assert sorted(cache.memory.keys()) == ['a', 'c']
+        assert cache.get_many(['a', 'b']) == {'a': 1}
+        assert cache.hits == 2 and cache.misses == 1
+
+    def test_memory_bytes(self):
+        """
+        Test eviction of large items from the in-memory tier.
+        """
+        cache = FeatureCache(self.temp_dir, max_memory_bytes=2000)
+        cache.set_many([('a', np.zeros(100)), ('b', np.zeros(100))])
+        assert sorted(cache.memory.keys()) == ['a', 'b']
+        cache.set_many([('c', np.zeros(100))])  # 800 bytes each
+        assert sorted(cache.memory.keys()) == ['b', 'c']
+        assert cache.memory_bytes == 1600
+        cache.set_many([('d', np.zeros(1000))])  # larger than the limit
+        assert not cache.memory and cache.memory_bytes == 0
+        found = cache.get_many(['a', 'd'])  # still in the on-disk tier
+        assert sorted(found.keys()) == ['a', 'd']
+        assert found['d'].shape == (1000,)
+
+    def test_persistence(self):
+        """
+        Test that the on-disk tier persists between instances.
+        """
+        cache = FeatureCache(self.temp_dir)
+        cache.set_many([('a', np.arange(3))])
+        cache.close()
+        cache = FeatureCache(self.temp_dir)
+        assert np.array_equal(cache.get_many(['a'])['a'], np.arange(3))
+
+    def test_keys(self):
+        """
+        Test cache keys for molecules and featurizer parameters.
+        """
+        cache = FeatureCache()
+        keys = cache.get_keys(CircularFingerprint(), self.mols)
+        assert keys[1] == keys[2]
+        assert keys[0] != keys[1]
+        other = cache.get_keys(CircularFingerprint(size=1024), self.mols)
+        assert keys[0] != other[0]
+        assert (get_featurizer_hash(CircularFingerprint()) ==
+                get_featurizer_hash(CircularFingerprint()))
+
+    def test_coordinate_keys(self):
+        """
+        Test that featurizers that use coordinates are keyed on them.
+        """
+        cache = FeatureCache()
+        mols = [Chem.Mol(self.mols[1]), Chem.Mol(self.mols[1])]
+        for mol, x in zip(mols, [0., 1.]):
+            AllChem.Compute2DCoords(mol)
+            conf = mol.GetConformer()
+            conf.SetAtomPosition(0, rdGeometry.Point3D(x, 0., 0.))
+        keys = cache.get_keys(DragonDescriptors(), mols)
+        assert keys[0] == keys[1]
+        keys = cache.get_keys(DragonDescriptors(assign_stereo_from_3d=True),
+                              mols)
+        assert keys[0] != keys[1]
+
+    def test_featurizer_hash(self):
+        """
+        Test that featurizer hashes depend only on featurizer parameters.
+        """
+        engine = DragonDescriptors()
+        engine.engine.initialize()
+        assert (get_featurizer_hash(engine) ==
+                get_featurizer_hash(DragonDescriptors()))
+        assert (get_featurizer_hash(engine) !=
+                get_featurizer_hash(DragonDescriptors(True)))
+        assert get_featurizer_hash(ESP()) != get_featurizer_hash(ESP(pH=7.))
+
+    def test_unregistered_featurizer_hash(self):
+        """
+        Test hashes for featurizers that are not registered.
+        """
+        class MyDragonDescriptors(DragonDescriptors):
+            pass
+
+        engine = MyDragonDescriptors()
+        engine.engine.initialize()
+        assert (get_featurizer_hash(engine) ==
+                get_featurizer_hash(MyDragonDescriptors()))
+
+        class MyMolecularWeight(MolecularWeight):
+            pass
+
+        f = MyMolecularWeight()
+        f.engine = object()
+        try:
+            get_featurizer_hash(f)
+            raise AssertionError
+        except ValueError:
+            pass
+
+    def test_featurize(self):
+        """
+        Test featurization with a cache.
+        """
+        f = MolecularWeight()
+        ref = f(self.mols)
+        cache = FeatureCache(self.temp_dir)
+        rval = f(self.mols, cache=cache)
+        assert np.allclose(rval, ref)
+        assert cache.hits == 0 and cache.misses == 3
+        assert len(cache) == 2  # duplicate molecules are stored once
+        rval = f(self.mols, cache=cache)
+        assert np.allclose(rval, ref)
+        assert cache.hits == 3
+
+    def test_featurize_iter(self):
+        """
+        Test chunked featurization with a cache.
+        """
+        f = MolecularWeight()
+        ref = f(self.mols)
+        cache = FeatureCache()
+        f(self.mols[:1], cache=cache)
+        chunks = [features for _, features in f.featurize_iter(
+            self.mols, chunk_size=1, cache=cache)]
+        assert len(chunks) == 3
+        assert np.allclose(np.concatenate(chunks), ref)
+        assert cache.hits == 2 and cache.misses == 2
+
+    def test_featurize_iter_cached(self):
+        """
+        Test that chunks are streamed when all features are cached.
+        """
+        f = MolecularWeight()
+        mols = self.mols * 10
+        cache = FeatureCache()
+        ref = f(mols, cache=cache)
+        for backend in ['serial', 'process']:
+            read = []
+
+            def get_mols():
+                for mol in mols:
+                    read.append(mol)
+                    yield mol
+
+            chunks = []
+            for _, features in f.featurize_iter(
+                    get_mols(), chunk_size=2, backend=backend, n_jobs=1,
+                    cache=cache):
+                # at most max_pending (2 * n_jobs) chunks are waiting
+                assert len(read) - 2 * len(chunks) <= 3 * 2, backend
+                chunks.append(features)
+            assert len(chunks) == 15
+            assert np.allclose(np.concatenate(chunks), ref)
+
+    def test_pipeline(self):
+        """
+        Test that pipeline featurizers only featurize uncached molecules.
+        """
+        featurizers = [MolecularWeight(), CircularFingerprint(size=64)]
+        refs = [f(self.mols) for f in featurizers]
+        cache = FeatureCache()
+        featurizers[0](self.mols, cache=cache)
+        batches = []
+        for f in featurizers:
+            def record_batch(mols, f=f, featurize_batch=f._featurize_batch):
+                batches.append((f.name, len(mols)))
+                return featurize_batch(mols)
+            f._featurize_batch = record_batch
+        pipeline = FeaturizerPipeline(featurizers, ['mw', 'circular'])
+        rval = pipeline.featurize(self.mols, cache=cache)
+        assert batches == [('circular', 2)]  # duplicates are featurized once
+        for ref, features in zip(refs, rval.values()):
+            assert np.allclose(features, ref)
+
+        # everything is cached now
+        for backend in ['serial', 'process']:
+            chunks = list(pipeline.featurize_iter(
+                self.mols, chunk_size=2, backend=backend, n_jobs=1,
+                cache=cache))
+            assert [len(mol_ids) for mol_ids, _ in chunks] == [2, 1]
+            for i, ref in enumerate(refs):
+                assert np.allclose(np.concatenate(
+                    [features.values()[i] for _, features in chunks]), ref)
+        assert batches == [('circular', 2)]
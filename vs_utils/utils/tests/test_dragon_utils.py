@@ -0,0 +1,30 @@
+"""
+Tests for dragon_utils.
+"""
+import cPickle
+import os
+import unittest
+
+from vs_utils.utils.dragon_utils import Dragon
+
+
+class TestDragon(unittest.TestCase):
+    """
+    Tests for Dragon.
+    """
+    def test_pickle(self):
+        """
+        Make sure pickled copies do not share the configuration file.
+        """
+        engine = Dragon()
+        engine.initialize()
+        filename = engine.config_filename
+        assert os.path.exists(filename)
+        copy = cPickle.loads(cPickle.dumps(engine, cPickle.HIGHEST_PROTOCOL))
+        assert not copy.initialized
+        assert copy.config_filename is None
+        assert copy.smiles_engine is None
+        del copy  # should not remove the configuration file
+        assert os.path.exists(filename)
+        del engine
+        assert not os.path.exists(filename)
@@ -8,6 +8,7 @@ import tempfile
 import unittest
 
 from vs_utils.utils import h5_utils
+from vs_utils.utils.array_utils import RaggedArray
 
 
 class TestH5Utils(unittest.TestCase):
@@ -31,3 +32,19 @@ class TestH5Utils(unittest.TestCase):
 
         # cleanup
         os.remove(filename)
+
+    def test_grid_writer(self):
+        """Test GridWriter and read_grids."""
+        rng = np.random.RandomState(20141024)
+        grids = rng.rand(5, 6, 7, 9) < 0.1
+        for mode in ['packed', 'sparse']:
+            _, filename = tempfile.mkstemp()
+            with h5_utils.GridWriter(filename, (6, 7, 9), mode) as writer:
+                writer.write(RaggedArray(grids[:3], [0, 1, 3]))
+                writer.write(grids[3:])
+            with h5py.File(filename, 'r') as f:
+                assert np.array_equal(f['mol_offsets'], [0, 1, 3, 4, 5])
+                assert np.array_equal(h5_utils.read_grids(f, 1, 4),
+                                      grids[1:4])
+            assert np.array_equal(h5_utils.read_grids(filename), grids)
+            os.remove(filename)
@@ -111,6 +111,28 @@ class TestIonizer(unittest.TestCase):
         except ob_utils.IonizerError:
             pass
 
+    def test_ionize_many(self):
+        """
+        Test Ionizer.ionize_many.
+        """
+        flat_mol = Chem.RemoveHs(Chem.Mol(self.mol))
+        flat_mol.RemoveAllConformers()
+        bad_mol = Chem.MolFromSmiles(
+            'CC1=C(C(C(=C(O1)N)C#N)C2=CC3=C(C=C2)OCO3)C(=O)OCC=C')
+        self.mol.SetProp('_Name', 'ibuprofen')
+        rval = self.ionizer.ionize_many([self.mol, bad_mol, flat_mol,
+                                         self.mol])
+        assert len(rval) == 4
+
+        # compare to ionizing molecules separately
+        for i in [0, 3]:
+            assert rval[i].GetNumConformers() == self.mol.GetNumConformers()
+            assert rval[i].GetProp('_Name') == 'ibuprofen'
+            assert rval[i].ToBinary() == self.ionizer(self.mol).ToBinary()
+        assert isinstance(rval[1], ob_utils.IonizerError)
+        assert Chem.MolToSmiles(rval[2], isomericSmiles=True) == (
+            Chem.MolToSmiles(self.ionized_mol, isomericSmiles=True))
+
 
 class TestMolImage(unittest.TestCase):
     """
@@ -0,0 +1,285 @@
+"""
+Tests for parallel_utils.
+"""
+import functools
+import os
+import shutil
+import signal
+import tempfile
+import time
+import unittest
+
+from vs_utils.utils.parallel_utils import (iter_chunks, popen, process_map,
+                                           report_batch, report_progress,
+                                           time_limit, TimeLimitError)
+
+
+def double(chunk):
+    """
+    Double each item in a chunk, hanging on negative items.
+
+    Parameters
+    ----------
+    chunk : list
+        Numbers.
+    """
+    rval = []
+    for x in chunk:
+        if x < 0:
+            time.sleep(60)
+        rval.append(2 * x)
+        report_progress([2 * x])
+    return rval
+
+
+def double_batch(chunk):
+    """
+    Double the items in a chunk as a batch, taking 0.2 seconds per item
+    and hanging if any item is negative.
+
+    Parameters
+    ----------
+    chunk : list
+        Numbers.
+    """
+    report_batch(len(chunk))
+    time.sleep(0.2 * len(chunk))
+    if min(chunk) < 0:
+        time.sleep(60)
+    rval = [2 * x for x in chunk]
+    report_progress(rval)
+    return rval
+
+
+def log_and_sleep(filename, chunk):
+    """
+    Log a chunk to a file and sleep for the number of seconds given by each
+    item, hanging on negative items.
+
+    Parameters
+    ----------
+    filename : str
+        Log filename.
+    chunk : list
+        Numbers.
+    """
+    with open(filename, 'ab') as f:
+        f.write('{}\n'.format(chunk))
+    for x in chunk:
+        if x < 0:
+            time.sleep(60)
+        time.sleep(x)
+        report_progress([x])
+    return chunk
+
+
+def check_chunk(chunk):
+    """
+    Raise an error on chunks containing zero and exit the process on
+    chunks containing None.
+
+    Parameters
+    ----------
+    chunk : list
+        Numbers.
+    """
+    for x in chunk:
+        if x is None:
+            os._exit(1)
+        if x == 0:
+            raise ValueError('Zero.')
+        report_progress([x])
+    return chunk
+
+
+def start_and_wait(filename, chunk):
+    """
+    Start a subprocess that sleeps and wait for it, writing its process ID
+    to a file.
+
+    Parameters
+    ----------
+    filename : str
+        Process ID filename.
+    chunk : list
+        Items (not used).
+    """
+    process = popen(['sleep', '60'])
+    with open(filename, 'wb') as f:
+        f.write(str(process.pid))
+    process.wait()
+
+
+def is_running(pid):
+    """
+    Check whether a process is running (and not a zombie).
+
+    Parameters
+    ----------
+    pid : int
+        Process ID.
+    """
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    try:
+        with open('/proc/{}/stat'.format(pid)) as f:
+            return f.read().split(')')[-1].split()[0] != 'Z'
+    except IOError:
+        return True
+
+
+class TestParallelUtils(unittest.TestCase):
+    """
+    Tests for parallel_utils.
+    """
+    def test_iter_chunks(self):
+        """
+        Test iter_chunks.
+        """
+        assert list(iter_chunks(xrange(5), 2)) == [[0, 1], [2, 3], [4]]
+        assert list(iter_chunks([], 2)) == []
+
+    def test_process_map(self):
+        """
+        Test process_map.
+        """
+        rval = list(process_map(double, iter_chunks(xrange(10), 3), n_jobs=2,
+                                max_tasks_per_child=1))
+        assert rval == [[0, 2, 4], [6, 8, 10], [12, 14, 16], [18]]
+
+    def test_process_map_timeout(self):
+        """
+        Test process_map with a stuck worker.
+        """
+        rval = list(process_map(double, [[1], [-1], [2], [3]], n_jobs=2,
+                                timeout=1,
+                                on_timeout=lambda item, reason: None))
+        assert rval == [[2], [None], [4], [6]]
+
+    def test_process_map_timeout_other_chunks(self):
+        """
+        Test that a stuck worker does not affect other chunks, including
+        chunks that are waiting for a worker.
+        """
+        temp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(temp_dir, 'log.txt')
+            function = functools.partial(log_and_sleep, filename)
+            chunks = [[-1], [1.5], [1.5], [0.1]]
+            rval = list(process_map(function, chunks, n_jobs=2, timeout=2,
+                                    on_timeout=lambda item, reason: None))
+            assert rval == [[None], [1.5], [1.5], [0.1]]
+            with open(filename) as f:
+                assert sorted(f.read().split()) == sorted(
+                    str(chunk) for chunk in chunks)  # each chunk runs once
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_process_map_timeout_queued(self):
+        """
+        Test that chunks queued behind a stuck chunk run after its worker
+        is replaced.
+        """
+        rval = list(process_map(double, [[-1], [1], [2], [3]], n_jobs=1,
+                                max_pending=4, timeout=0.5,
+                                on_timeout=lambda item, reason: None))
+        assert rval == [[None], [2], [4], [6]]
+
+    def test_process_map_timeout_items(self):
+        """
+        Test that only the item a stuck worker was working on is replaced,
+        and that the time limit does not depend on the chunk size.
+        """
+        start = time.time()
+        rval = list(process_map(double, [[1, 2, -1, 3, 4], [5]], n_jobs=1,
+                                timeout=0.5,
+                                on_timeout=lambda item, reason: item,
+                                join=tuple))
+        assert rval == [(2, 4, -1, 6, 8), (10,)]
+        assert time.time() - start < 10
+
+    def test_process_map_timeout_batch(self):
+        """
+        Test time limits for items processed as a batch.
+        """
+        start = time.time()
+        rval = list(process_map(double_batch, [[1, 2, 3, 4], [1, -1, 2]],
+                                n_jobs=1, timeout=0.5,
+                                on_timeout=lambda item, reason: None))
+        assert rval == [[2, 4, 6, 8], [2, None, 4]]
+        assert time.time() - start < 15
+
+    def test_process_map_timeout_subprocess(self):
+        """
+        Test that subprocesses started by a stuck worker are killed.
+        """
+        temp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(temp_dir, 'pid.txt')
+            function = functools.partial(start_and_wait, filename)
+            rval = list(process_map(function, [[0]], n_jobs=1, timeout=0.5,
+                                    on_timeout=lambda item, reason: reason))
+            assert 'time limit' in rval[0][0]
+            with open(filename) as f:
+                pid = int(f.read())
+            assert not is_running(pid)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_process_map_errors(self):
+        """
+        Test process_map with errors and workers that exit.
+        """
+        try:
+            list(process_map(check_chunk, [[1], [0], [2]], n_jobs=2))
+            raise AssertionError
+        except ValueError:
+            pass
+        rval = list(process_map(check_chunk, [[1], [None], [2]], n_jobs=2,
+                                timeout=10,
+                                on_timeout=lambda item, reason: 'exit'))
+        assert rval == [[1], ['exit'], [2]]
+        try:
+            list(process_map(check_chunk, [[1], [None], [2]], n_jobs=2))
+            raise AssertionError
+        except RuntimeError:
+            pass
+
+    def test_time_limit(self):
+        """
+        Test time_limit.
+        """
+        with time_limit(None):
+            pass
+        start = time.time()
+        try:
+            with time_limit(0.1):
+                time.sleep(10)
+        except TimeLimitError:
+            pass
+        else:
+            raise AssertionError('TimeLimitError not raised.')
+        assert time.time() - start < 5
+
+    def test_time_limit_subprocess(self):
+        """
+        Test that subprocesses are killed when the time limit is exceeded.
+        """
+        start = time.time()
+        try:
+            with time_limit(0.1):
+                process = popen(['sleep', '30'])
+                process.wait()
+        except TimeLimitError:
+            pass
+        else:
+            raise AssertionError('TimeLimitError not raised.')
+        assert time.time() - start < 5
+        assert process.returncode == -signal.SIGKILL
+        try:  # the process is gone
+            os.kill(process.pid, 0)
+            raise AssertionError('Subprocess still running.')
+        except OSError:
+            pass